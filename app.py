@@ -1,65 +1,141 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, g, has_request_context, jsonify, render_template, request, stream_with_context, url_for
+from contextlib import nullcontext
+import io
 import os
 import pandas as pd
 from calendar import monthrange
 import traceback
 
+from batch import parse_flag, parse_trades, resolve_trades
+from excursions import ExcursionHistograms, trade_excursions
+from hit_search import find_trade_outcome
+from jobs import FINISHED_STATES, JOB_QUEUED, JOB_RUNNING, JobQueue
+from metrics import Metrics, StageTimer, resident_memory_bytes
+from outcomes import TradeOutcome, csv_chunks, ndjson_chunks, records_to_csv
+from parquet_scan import ChunkedPriceFile
+from price_data import to_epoch_minutes
+from portfolio import PortfolioSettings, simulate_portfolio
+from price_store import STORE_SUFFIX
+from result_cache import ResultCache, make_key
+from robustness import RobustnessSettings, run_robustness
+from signals import StrategySettings, backtest_strategy, generate_signals
+from symbols import Symbol, SymbolRegistry, load_symbols_file
+from timeframes import parse_timeframe
+
 app = Flask(__name__)
 
-# Function to find the first .parquet file containing "xauusd" in its name (case-insensitive)
-def find_xauusd_parquet_file():
+# Function to find the first file or directory containing "xauusd" in its name with the given suffix (case-insensitive)
+def find_xauusd_file(suffix):
     files_in_directory = os.listdir()
     for file_name in files_in_directory:
-        if "xauusd" in file_name.lower() and file_name.lower().endswith(".parquet"):
+        if "xauusd" in file_name.lower() and file_name.lower().endswith(suffix):
             return file_name
     return None
 
-# Find the .parquet file
-file_path = find_xauusd_parquet_file()
-if not file_path:
-    raise FileNotFoundError("No .parquet file containing 'xauusd' found in the current directory.")
-
-# Load the .parquet file
-df = pd.read_parquet(file_path)
-
-# Convert 'Local time' column to datetime
-try:
-    df['Local time'] = pd.to_datetime(df['Local time'], format='%d.%m.%Y %H:%M:%S')
-except Exception as e:
-    raise ValueError(f"Error parsing 'Local time' column: {e}")
-
-# Drop rows with NaN values in the 'Open', 'High', 'Low', 'Close' columns
-df = df.dropna(subset=['Open', 'High', 'Low', 'Close'])
+# Function to find the first .parquet file containing "xauusd" in its name (case-insensitive)
+def find_xauusd_parquet_file():
+    return find_xauusd_file(".parquet")
+
+# Function to build the symbol registry (see symbols.py). SYMBOLS_FILE (default symbols.json) lists
+# each symbol with its data file, pip size and tolerance; without it the app serves XAUUSD from the
+# first xauusd price store or parquet file in the current directory. A store is preferred: it is
+# memory-mapped, so loading skips parsing and every worker shares the same pages.
+# Data is loaded on first use; SYMBOL_MEMORY_BUDGET_MB caps the memory the loaded symbols may take.
+# With CHUNKED_SCAN set the default XAUUSD parquet file is scanned row group by row group instead
+# of loaded (see parquet_scan.py), for histories too large to hold in memory. TICK_STORE names a
+# tick store (see tick_store.py) used to settle M1 bars that reach both SL and TP from their ticks.
+# SEARCH_INDEX=timeframes makes its hit searches run coarse to fine over the cached M5..D1 bars.
+def build_symbol_registry():
+    symbols_file = os.environ.get('SYMBOLS_FILE', 'symbols.json')
+    if os.path.exists(symbols_file):
+        symbols = load_symbols_file(symbols_file)
+    else:
+        chunked = os.environ.get('CHUNKED_SCAN', '').strip().lower() in ['true', '1', 'yes']
+        file_path = find_xauusd_parquet_file() if chunked else find_xauusd_file(STORE_SUFFIX) or find_xauusd_parquet_file()
+        if not file_path:
+            raise FileNotFoundError("No .parquet file containing 'xauusd' found in the current directory.")
+        symbols = [Symbol("XAUUSD", file_path, pip_size=0.1, tolerance=0.1, ingest_dir=os.environ.get('INGEST_DIR'),
+                          chunked=chunked, tick_path=os.environ.get('TICK_STORE'),
+                          search_index=os.environ.get('SEARCH_INDEX', 'pyramid'))]
+    memory_budget = os.environ.get('SYMBOL_MEMORY_BUDGET_MB')
+    return SymbolRegistry(symbols,
+                          memory_budget=int(float(memory_budget) * 2**20) if memory_budget else None,
+                          default=os.environ.get('DEFAULT_SYMBOL'),
+                          live=bool(ingest_token),
+                          poll_interval=float(os.environ.get('INGEST_POLL_SECONDS', 5)))
+
+# Incremental ingestion of new M1 bars (see ingest.py). A symbol's ingest_dir (INGEST_DIR for the
+# default XAUUSD setup) is polled every INGEST_POLL_SECONDS for new CSV/parquet chunks; with several
+# workers each one applies the same files, so they stay in sync. INGEST_TOKEN enables POST /data/append.
+ingest_token = os.environ.get('INGEST_TOKEN')
+registry = build_symbol_registry()
+
+# Cache of monitor_trade outcomes for repeated form submissions. RESULT_CACHE_SIZE bounds the
+# in-memory LRU; RESULT_CACHE_PATH optionally names a SQLite file that keeps results across restarts.
+result_cache = ResultCache(maxsize=int(os.environ.get('RESULT_CACHE_SIZE', 1024)),
+                           path=os.environ.get('RESULT_CACHE_PATH'),
+                           encode=TradeOutcome.to_state, decode=TradeOutcome.from_state)
+
+# MAE/MFE histograms aggregated over every batch and strategy this worker resolved, per symbol
+# (see excursions.py); read at /excursions
+excursion_histograms = ExcursionHistograms()
+
+# Request metrics (see metrics.py), scraped in the Prometheus text format from /metrics.
+# Each request is timed per stage: parse (form input), lookup (entry bar), window (search start),
+# hit_search, render and cache. With SERVER_TIMING set the stage durations are also sent back
+# in a Server-Timing header, so they show up in the browser's network panel.
+metrics = Metrics()
+metrics.describe('http_requests_total', 'counter', 'Requests handled, by endpoint and status code.')
+metrics.describe('http_request_duration_seconds', 'histogram', 'Request duration, by endpoint.')
+metrics.describe('backtest_stage_duration_seconds', 'histogram', 'Time spent in each stage of a request.')
+metrics.describe('backtest_bars_searched_total', 'counter', 'M1 bars the hit searches covered, by symbol.')
+metrics.describe('backtest_trades_total', 'counter', 'Trades resolved, by endpoint.')
+metrics.describe('backtest_errors_total', 'counter', 'Unexpected errors, by endpoint.')
+server_timing = os.environ.get('SERVER_TIMING', '').strip().lower() in ['true', '1', 'yes']
+
+# Function to time a block as a stage of the current request (does nothing outside a request, e.g. in jobs)
+def stage(name):
+    timer = g.get('timer') if has_request_context() else None
+    return timer.stage(name) if timer is not None else nullcontext()
+
+@app.before_request
+def start_request_timer():
+    g.timer = StageTimer()
+
+# A streamed body is produced after the view returns, so its request is recorded when the stream
+# closes, and it gets no Server-Timing header (the headers are sent before the work is done)
+@app.after_request
+def record_request_metrics(response):
+    timer = g.get('timer')
+    if timer is None:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    if response.is_streamed:
+        response.call_on_close(lambda: observe_request(timer, endpoint, response.status_code))
+        return response
+    observe_request(timer, endpoint, response.status_code)
+    if server_timing:
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+# Function to record the count, duration and stage timings of a finished request
+def observe_request(timer, endpoint, status_code):
+    metrics.inc('http_requests_total', endpoint=endpoint, status=str(status_code))
+    metrics.observe('http_request_duration_seconds', timer.elapsed(), endpoint=endpoint)
+    for name, seconds in timer.stages.items():
+        metrics.observe('backtest_stage_duration_seconds', seconds, stage=name)
 
 # Function to get the closing price for a specific date and time
-def get_closing_price(year, month, day, hour, minute):
-    input_time = pd.Timestamp(year, month, day, hour, minute)
-    try:
-        row = df.loc[df['Local time'] == input_time]
-        if not row.empty:
-            return row['Close'].iloc[0]
-        else:
-            return None
-    except Exception as e:
+def get_closing_price(year, month, day, hour, minute, symbol=None):
+    _, price_data = registry.get(symbol)
+    position = price_data.locate(pd.Timestamp(year, month, day, hour, minute))
+    if position is None:
         return None
+    return price_data.close[position]
 
-# Function to format runtime
-def format_runtime(runtime):
-    days = runtime.days
-    hours, remainder = divmod(runtime.seconds, 3600)
-    minutes, _ = divmod(remainder, 60)
-    formatted_runtime = ""
-    if days > 0:
-        formatted_runtime += f"{days}D "
-    if hours > 0:
-        formatted_runtime += f"{hours}H "
-    if minutes > 0:
-        formatted_runtime += f"{minutes}Min"
-    return formatted_runtime.strip()
-
-# Function to calculate pips
-def calculate_pips(entry_price, target_price):
-    return abs(target_price - entry_price) * 10
+# Function to calculate pips (pip_size is the price move of one pip: 0.1 for XAUUSD)
+def calculate_pips(entry_price, target_price, pip_size=0.1):
+    return abs(target_price - entry_price) * (1 / pip_size)
 
 # Function to validate trade inputs
 def validate_trade_inputs(entry_price, stoploss_price, takeprofit_price, trade_type):
@@ -77,275 +153,589 @@ def validate_trade_inputs(entry_price, stoploss_price, takeprofit_price, trade_t
         return "Invalid trade type. Please enter 'Buy' or 'Sell'."
     return None
 
-# Function to monitor trade and check SL/TP conditions
-def monitor_trade(entry_time, stoploss_price, takeprofit_price, trade_type, breakeven):
-    entry_price = get_closing_price(entry_time.year, entry_time.month, entry_time.day, entry_time.hour, entry_time.minute)
-    if entry_price is None:
-        return ["No data found for the specified entry time. Possible reasons: incorrect date/time or missing data in the CSV file."]
+# Function to get the intrabar tick source of a symbol (None unless it has a tick store)
+def intrabar_source(symbol):
+    ticks = registry.tick_store(symbol.name)
+    return None if ticks is None else ticks.path
+
+# Function to monitor trade and check SL/TP conditions.
+# Returns a TradeOutcome (see outcomes.py); its text is only built when a page renders it.
+# entry_position can be passed in when the caller has already located the entry bar
+def monitor_trade(entry_time, stoploss_price, takeprofit_price, trade_type, breakeven, entry_position=None, symbol=None):
+    symbol, price_data = registry.get(symbol)
+    outcome = TradeOutcome(symbol.name, trade_type, to_epoch_minutes(entry_time), breakeven,
+                           digits=symbol.digits, pip_size=symbol.pip_size)
+    if entry_position is None:
+        with stage('lookup'):
+            entry_position = price_data.locate(entry_time)
+    if entry_position is None:
+        outcome.error = "No data found for the specified entry time. Possible reasons: incorrect date/time or missing data in the CSV file."
+        return outcome
+    entry_price = float(price_data.close[entry_position])
 
     validation_error = validate_trade_inputs(entry_price, stoploss_price, takeprofit_price, trade_type)
     if validation_error:
-        return [validation_error]
-
-    results = []
-    results.append(f"Pair: XAUUSD")
-    results.append(f"Trade Type: {trade_type.capitalize()}")
-    results.append(f"Entry Price: {entry_price:.3f} | Time: {entry_time.strftime('%I:%M %p (%d %B %Y)')}")
-    results.append(f"SL Price: {stoploss_price:.3f} ({calculate_pips(entry_price, stoploss_price):.2f} pips) | TP Price: {takeprofit_price:.3f} ({calculate_pips(entry_price, takeprofit_price):.2f} pips)")
-
-    df_filtered = df[df['Local time'] > entry_time]
-    if df_filtered.empty:
-        return ["No data available after the specified entry time."]
-
-    sl_pips = calculate_pips(entry_price, stoploss_price)
-    tp_pips = calculate_pips(entry_price, takeprofit_price)
-
-    for _, row in df_filtered.iterrows():
-        current_high = row['High']
-        current_low = row['Low']
-        current_time = row['Local time']
-
-        if trade_type.lower() == 'buy':
-            if current_high >= takeprofit_price - 0.1:
-                runtime = current_time - entry_time
-                formatted_runtime = format_runtime(runtime)
-                tp_pips_hit = calculate_pips(entry_price, takeprofit_price)
-                rr = tp_pips_hit / sl_pips
-                results.append(f"Take Profit hit: {takeprofit_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                results.append(f"PnL: {rr:.2f}R\n")
-                break
-            elif current_low <= stoploss_price + 0.1:
-                runtime = current_time - entry_time
-                formatted_runtime = format_runtime(runtime)
-                sl_pips_hit = calculate_pips(entry_price, stoploss_price)
-                results.append(f"Stoploss hit: {stoploss_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                results.append(f"PnL: -1R\n")
-                break
-
-        elif trade_type.lower() == 'sell':
-            if current_low <= takeprofit_price + 0.1:
-                runtime = current_time - entry_time
-                formatted_runtime = format_runtime(runtime)
-                tp_pips_hit = calculate_pips(entry_price, takeprofit_price)
-                rr = tp_pips_hit / sl_pips
-                results.append(f"Take Profit hit: {takeprofit_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                results.append(f"PnL: {rr:.2f}R\n")
-                break
-            elif current_high >= stoploss_price - 0.1:
-                runtime = current_time - entry_time
-                formatted_runtime = format_runtime(runtime)
-                sl_pips_hit = calculate_pips(entry_price, stoploss_price)
-                results.append(f"Stoploss hit: {stoploss_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                results.append(f"PnL: -1R\n")
-                break
-
-    if breakeven:
-        three_r_pips = 3 * sl_pips
-        three_r_target = entry_price + three_r_pips / 10 if trade_type.lower() == 'buy' else entry_price - three_r_pips / 10
-        breakeven_triggered = False
-        results.append("(3R System)")
-        results.append(f"3R TP: {three_r_target:.3f} ({three_r_pips:.2f} pips)")
-
-        for _, row in df_filtered.iterrows():
-            current_high = row['High']
-            current_low = row['Low']
-            current_time = row['Local time']
-
-            if trade_type.lower() == 'buy':
-                # Check if SL is hit before breakeven
-                if current_low <= stoploss_price + 0.1:
-                    runtime = current_time - entry_time
-                    formatted_runtime = format_runtime(runtime)
-                    sl_pips_hit = calculate_pips(entry_price, stoploss_price)
-                    results.append(f"Stoploss hit: {stoploss_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                    results.append(f"PnL: -1R\n")
-                    return results
-
-                # Check breakeven trigger
-                if not breakeven_triggered and current_high >= entry_price + sl_pips / 10 - 0.1:
-                    breakeven_triggered = True
-                    breakeven_runtime = current_time - entry_time
-                    formatted_breakeven_runtime = format_runtime(breakeven_runtime)
-                    results.append(f"Breakeven at: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
-
-                # Check breakeven hit
-                if breakeven_triggered and current_low <= entry_price + 0.1:
-                    breakeven_runtime = current_time - entry_time
-                    formatted_breakeven_runtime = format_runtime(breakeven_runtime)
-                    results.append(f"Breakeven hit: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
-                    return results
-
-                # Check 3R target hit
-                if current_high >= three_r_target - 0.1:
-                    three_r_runtime = current_time - entry_time
-                    formatted_three_r_runtime = format_runtime(three_r_runtime)
-                    three_r_pips_hit = calculate_pips(entry_price, three_r_target)
-                    results.append(f"3R hit: {three_r_target:.3f} ({three_r_pips_hit:.2f} pips) | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_three_r_runtime}")
-                    return results
-
-            elif trade_type.lower() == 'sell':
-                # Check if SL is hit before breakeven
-                if current_high >= stoploss_price - 0.1:
-                    runtime = current_time - entry_time
-                    formatted_runtime = format_runtime(runtime)
-                    sl_pips_hit = calculate_pips(entry_price, stoploss_price)
-                    results.append(f"Stoploss hit: {stoploss_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                    results.append(f"PnL: -1R\n")
-                    return results
-
-                # Check breakeven trigger
-                if not breakeven_triggered and current_low <= entry_price - sl_pips / 10 + 0.1:
-                    breakeven_triggered = True
-                    breakeven_runtime = current_time - entry_time
-                    formatted_breakeven_runtime = format_runtime(breakeven_runtime)
-                    results.append(f"Breakeven at: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
-
-                # Check breakeven hit
-                if breakeven_triggered and current_high >= entry_price - 0.1:
-                    breakeven_runtime = current_time - entry_time
-                    formatted_breakeven_runtime = format_runtime(breakeven_runtime)
-                    results.append(f"Breakeven hit: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
-                    return results
-
-                # Check 3R target hit
-                if current_low <= three_r_target + 0.1:
-                    three_r_runtime = current_time - entry_time
-                    formatted_three_r_runtime = format_runtime(three_r_runtime)
-                    three_r_pips_hit = calculate_pips(entry_price, three_r_target)
-                    results.append(f"3R hit: {three_r_target:.3f} ({three_r_pips_hit:.2f} pips) | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_three_r_runtime}")
-                    return results
-                
+        outcome.error = validation_error
+        return outcome
+    outcome.entry_price = entry_price
+    outcome.stoploss_price = float(stoploss_price)
+    outcome.takeprofit_price = float(takeprofit_price)
+
+    # The search covers the bars after the entry time, from window_start to the end of the data
+    with stage('window'):
+        window_start = price_data.first_after(entry_time)
+    if window_start >= len(price_data):
+        outcome.error = "No data available after the specified entry time."
+        return outcome
+    three_r_pips = 3 * calculate_pips(entry_price, stoploss_price, symbol.pip_size)
+    outcome.three_r_target = entry_price + three_r_pips / symbol.pips_per_unit if trade_type.lower() == 'buy' else entry_price - three_r_pips / symbol.pips_per_unit
+
+    # SL/TP and the 3R system are resolved together in one pass over the bars; chunked data is
+    # read row group by row group until both have closed. With a tick store, bars reaching
+    # several levels are settled from their ticks.
+    intrabar = intrabar_source(symbol)
+    with stage('hit_search'):
+        if isinstance(price_data, ChunkedPriceFile):
+            hit, hit_index, breakeven_index, three_r_kind, three_r_index = price_data.find_trade_outcome(
+                entry_price, stoploss_price, takeprofit_price, outcome.three_r_target, trade_type, breakeven,
+                symbol.tolerance, start=window_start, intrabar=intrabar)
+        else:
+            hit, hit_index, breakeven_index, three_r_kind, three_r_index = find_trade_outcome(
+                price_data.high, price_data.low, entry_price, stoploss_price, takeprofit_price, outcome.three_r_target,
+                trade_type, breakeven, symbol.tolerance, start=window_start, extremes=price_data.hit_index,
+                minutes=price_data.minutes, intrabar=intrabar)
+    if hit is not None:
+        outcome.exit_kind, outcome.exit_index = hit, hit_index
+        outcome.exit_minute = int(price_data.minutes[hit_index])
+    if breakeven_index is not None:
+        outcome.breakeven_index = breakeven_index
+        outcome.breakeven_minute = int(price_data.minutes[breakeven_index])
+    if three_r_kind is not None:
+        outcome.three_r_kind, outcome.three_r_index = three_r_kind, three_r_index
+        outcome.three_r_minute = int(price_data.minutes[three_r_index])
+
+    # Excursions before each exit, from range queries over the extremes index (which chunked data has not)
+    if not isinstance(price_data, ChunkedPriceFile):
+        with stage('hit_search'):
+            outcome.mae_pips, outcome.mfe_pips, mfe_index, outcome.three_r_mfe_pips = trade_excursions(
+                price_data, entry_price, outcome.stoploss_price, outcome.takeprofit_price, outcome.three_r_target,
+                trade_type.lower() == 'buy', window_start, hit_index, three_r_index, symbol.pip_size)
+        if mfe_index is not None:
+            outcome.mfe_minute = int(price_data.minutes[mfe_index])
+
+    # The pass stops at the last event of both systems; an unresolved one runs to the end of the data
+    searched_to = len(price_data) if hit_index is None or three_r_index is None else max(hit_index, three_r_index) + 1
+    metrics.inc('backtest_bars_searched_total', searched_to - window_start, symbol=symbol.name)
+    return outcome
+
+# Function to read and validate the trade form, raising ValueError with a message for the user.
+# Returns the monitor_trade arguments as a dict.
+def parse_trade_form(form):
+    with stage('parse'):
+        return _parse_trade_form(form)
+
+# Function holding the form parsing steps of parse_trade_form
+def _parse_trade_form(form):
+    # Extract and validate input values
+    year = int(form['year'])
+    month = int(form['month'])
+    day = int(form['day'])
+    hour = int(form['hour'])
+    minute = int(form['minute'])
+
+    # Validate month, day, hour, minute
+    if not (1 <= month <= 12):
+        raise ValueError("Month must be between 1 and 12.")
+    
+    # Validate day according to the month
+    _, days_in_month = monthrange(year, month)
+    if not (1 <= day <= days_in_month):
+        raise ValueError(f"Day must be between 1 and {days_in_month} for the given month.")
+    
+    if not (0 <= hour <= 23):
+        raise ValueError("Hour must be between 0 and 23.")
+    if not (0 <= minute <= 59):
+        raise ValueError("Minute must be between 0 and 59.")
+
+    entry_time = pd.Timestamp(year, month, day, hour, minute)
+
+    # Validate trade type
+    trade_type = form['trade_type'].strip().lower()
+    if trade_type not in ['buy', 'sell']:
+        raise ValueError("Trade type must be 'buy' or 'sell'.")
+
+    # Extract input type and validate
+    input_type = form['input_type'].strip().lower()
+    if input_type not in ['prices', 'pips']:
+        raise ValueError("Input type must be 'prices' or 'pips'.")
+
+    # Look up the symbol (the form field is optional; the default symbol is used without it)
+    symbol, price_data = registry.get(form.get('symbol'))
+
+    # Locate the entry bar once and share it with the monitoring logic
+    with stage('lookup'):
+        entry_position = price_data.locate(entry_time)
+    if entry_position is None:
+        raise ValueError("No data found for the specified entry time.")
+    entry_price = price_data.close[entry_position]
+
+    # Validate and convert stoploss and takeprofit inputs based on input type
+    if input_type == 'prices':
+        stoploss_price = float(form['stoploss_price'])
+        takeprofit_price = float(form['takeprofit_price'])
+    elif input_type == 'pips':
+        stoploss_pips = float(form['stoploss_pips'])
+        takeprofit_pips = float(form['takeprofit_pips'])
+        if trade_type == 'buy':
+            stoploss_price = entry_price - stoploss_pips / symbol.pips_per_unit
+            takeprofit_price = entry_price + takeprofit_pips / symbol.pips_per_unit
+        elif trade_type == 'sell':
+            stoploss_price = entry_price + stoploss_pips / symbol.pips_per_unit
+            takeprofit_price = entry_price - takeprofit_pips / symbol.pips_per_unit
     else:
-        # Logic for when breakeven is False, but still use the 3R System
-        results.append("( 3R System (Without Breakeven) )")
-
-        # Calculate the 3R target
-        three_r_pips = 3 * sl_pips
-        three_r_target = entry_price + three_r_pips / 10 if trade_type.lower() == 'buy' else entry_price - three_r_pips / 10
-        results.append(f"3R TP: {three_r_target:.3f} ({three_r_pips:.2f} pips)")
-
-        for _, row in df_filtered.iterrows():
-            current_high = row['High']
-            current_low = row['Low']
-            current_time = row['Local time']
-
-            if trade_type.lower() == 'buy':
-                # Check if SL is hit before 3R
-                if current_low <= stoploss_price + 0.1:
-                    runtime = current_time - entry_time
-                    formatted_runtime = format_runtime(runtime)
-                    sl_pips_hit = calculate_pips(entry_price, stoploss_price)
-                    results.append(f"Stoploss hit: {stoploss_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                    results.append(f"PnL: -1R\n")
-                    return results
-
-                # Check if 3R target is hit
-                if current_high >= three_r_target - 0.1:
-                    three_r_runtime = current_time - entry_time
-                    formatted_three_r_runtime = format_runtime(three_r_runtime)
-                    three_r_pips_hit = calculate_pips(entry_price, three_r_target)
-                    results.append(f"3R hit: {three_r_target:.3f} ({three_r_pips_hit:.2f} pips) | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_three_r_runtime}")
-                    return results
-
-            elif trade_type.lower() == 'sell':
-                # Check if SL is hit before 3R
-                if current_high >= stoploss_price - 0.1:
-                    runtime = current_time - entry_time
-                    formatted_runtime = format_runtime(runtime)
-                    sl_pips_hit = calculate_pips(entry_price, stoploss_price)
-                    results.append(f"Stoploss hit: {stoploss_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                    results.append(f"PnL: -1R\n")
-                    return results
-
-                # Check if 3R target is hit
-                if current_low <= three_r_target + 0.1:
-                    three_r_runtime = current_time - entry_time
-                    formatted_three_r_runtime = format_runtime(three_r_runtime)
-                    three_r_pips_hit = calculate_pips(entry_price, three_r_target)
-                    results.append(f"3R hit: {three_r_target:.3f} ({three_r_pips_hit:.2f} pips) | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_three_r_runtime}")
-                    return results
-
-    return ["Neither Stoploss nor 3R Take Profit was hit within the given data range."]
+        raise ValueError("Invalid input type.")
+
+    # Validate breakeven input
+    breakeven_input = form['breakeven'].strip().lower()
+    breakeven = breakeven_input in ['true', '1', 'yes']
+
+    return {
+        'entry_time': entry_time,
+        'stoploss_price': stoploss_price,
+        'takeprofit_price': takeprofit_price,
+        'trade_type': trade_type,
+        'breakeven': breakeven,
+        'entry_position': entry_position,
+        'symbol': symbol.name,
+    }
+
+# Function to run monitor_trade for a parsed form, reusing the result of an identical earlier query
+def cached_monitor_trade(trade):
+    symbol, price_data = registry.get(trade['symbol'])
+    ticks = registry.tick_store(symbol.name)
+    dataset_version = f"{symbol.name}-{price_data.version}" + (f"-ticks-{ticks.version}" if ticks else "")
+    cache_key = make_key(to_epoch_minutes(trade['entry_time']), trade['trade_type'], trade['stoploss_price'],
+                         trade['takeprofit_price'], trade['breakeven'], symbol.tolerance, dataset_version, symbol.tick)
+    with stage('cache'):
+        outcome = result_cache.get(cache_key)
+    if outcome is None:
+        outcome = monitor_trade(**trade)
+        with stage('cache'):
+            result_cache.put(cache_key, outcome)
+    return outcome
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', symbols=list(registry.symbols), default_symbol=registry.default)
 
+# Trade form endpoint. The result page is the default; an optional 'format' field of
+# 'json' or 'csv' returns the outcome record instead.
 @app.route('/monitor_trade', methods=['POST'])
 def monitor_trade_route():
     try:
-        # Extract and validate input values
-        year = int(request.form['year'])
-        month = int(request.form['month'])
-        day = int(request.form['day'])
-        hour = int(request.form['hour'])
-        minute = int(request.form['minute'])
-
-        # Validate month, day, hour, minute
-        if not (1 <= month <= 12):
-            raise ValueError("Month must be between 1 and 12.")
-        
-        # Validate day according to the month
-        _, days_in_month = monthrange(year, month)
-        if not (1 <= day <= days_in_month):
-            raise ValueError(f"Day must be between 1 and {days_in_month} for the given month.")
-        
-        if not (0 <= hour <= 23):
-            raise ValueError("Hour must be between 0 and 23.")
-        if not (0 <= minute <= 59):
-            raise ValueError("Minute must be between 0 and 59.")
-
-        entry_time = pd.Timestamp(year, month, day, hour, minute)
-
-        # Validate trade type
-        trade_type = request.form['trade_type'].strip().lower()
-        if trade_type not in ['buy', 'sell']:
-            raise ValueError("Trade type must be 'buy' or 'sell'.")
-
-        # Extract input type and validate
-        input_type = request.form['input_type'].strip().lower()
-        if input_type not in ['prices', 'pips']:
-            raise ValueError("Input type must be 'prices' or 'pips'.")
-
-        # Get the entry price for the given entry time
-        entry_price = get_closing_price(entry_time.year, entry_time.month, entry_time.day, entry_time.hour, entry_time.minute)
-        if entry_price is None:
-            raise ValueError("No data found for the specified entry time.")
-
-        # Validate and convert stoploss and takeprofit inputs based on input type
-        if input_type == 'prices':
-            stoploss_price = float(request.form['stoploss_price'])
-            takeprofit_price = float(request.form['takeprofit_price'])
-        elif input_type == 'pips':
-            stoploss_pips = float(request.form['stoploss_pips'])
-            takeprofit_pips = float(request.form['takeprofit_pips'])
-            if trade_type == 'buy':
-                stoploss_price = entry_price - stoploss_pips / 10
-                takeprofit_price = entry_price + takeprofit_pips / 10
-            elif trade_type == 'sell':
-                stoploss_price = entry_price + stoploss_pips / 10
-                takeprofit_price = entry_price - takeprofit_pips / 10
-        else:
-            raise ValueError("Invalid input type.")
-
-        # Validate breakeven input
-        breakeven_input = request.form['breakeven'].strip().lower()
-        breakeven = breakeven_input in ['true', '1', 'yes']
-
-        # Call the monitoring logic
-        results = monitor_trade(entry_time, stoploss_price, takeprofit_price, trade_type, breakeven)
-
-        return render_template('results.html', results=results)
+        export_format = parse_export_format(request.form.get('format'), choices=('html', 'json', 'csv'))
+        outcome = cached_monitor_trade(parse_trade_form(request.form))
+        metrics.inc('backtest_trades_total', endpoint='monitor_trade')
+        with stage('render'):
+            if export_format == 'json':
+                return jsonify(outcome=outcome.to_dict())
+            if export_format == 'csv':
+                return csv_response([outcome], "outcome.csv")
+            return render_template('results.html', results=outcome.lines())
 
     except ValueError as ve:
         # Render error back to the form with an error message
-        return render_template('index.html', error=f"Invalid input: {ve}")
+        return render_template('index.html', error=f"Invalid input: {ve}",
+                               symbols=list(registry.symbols), default_symbol=registry.default)
     except Exception as e:
         # Log unexpected errors and show a generic error page with detailed information
         error_info = traceback.format_exc()
         print(f"Unexpected error: {e}\n{error_info}")  # Replace with proper logging
+        metrics.inc('backtest_errors_total', endpoint='monitor_trade')
         return render_template('error.html', error=f"An unexpected error occurred: {e}", error_info=error_info)
 
+# Function to read a requested output format, raising ValueError for unsupported ones
+def parse_export_format(value, choices=('json', 'csv')):
+    export_format = (value or choices[0]).strip().lower()
+    if export_format not in choices:
+        raise ValueError(f"Format must be one of: {', '.join(choices)}.")
+    return export_format
+
+# Function to answer with export records (dicts or TradeOutcome objects) as a CSV download
+def csv_response(records, filename):
+    return Response(records_to_csv(records), content_type='text/csv; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# Formats of the batch and strategy results: one JSON document, or records streamed as they resolve
+STREAM_FORMATS = ('csv', 'ndjson')
+
+# Function to answer with export records streamed as CSV or newline-delimited JSON.
+# record_chunks yields lists of records; each list is sent as soon as it is ready, so the server
+# never holds the whole result set and clients can read rows before the run finishes.
+def stream_response(record_chunks, export_format, filename):
+    if export_format == 'csv':
+        return Response(stream_with_context(timed_stream(csv_chunks(record_chunks))),
+                        content_type='text/csv; charset=utf-8',
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    return Response(stream_with_context(timed_stream(ndjson_chunks(record_chunks))), content_type='application/x-ndjson')
+
+# Function to time the making of each streamed piece as the render stage of the request; stages
+# run while making it (the hit search of each chunk) are counted on their own
+def timed_stream(pieces):
+    pieces = iter(pieces)
+    while True:
+        with stage('render'):
+            piece = next(pieces, None)
+        if piece is None:
+            return
+        yield piece
+
+# Function to resolve trades JOB_CHUNK_TRADES at a time, yielding each chunk's records as soon as it
+# resolves. Every chunk is added to the excursion histograms and, with an endpoint, to the trade count.
+def resolve_in_chunks(symbol, price_data, trades, tolerance, timeframe, endpoint=None):
+    for offset in range(0, len(trades), JOB_CHUNK_TRADES):
+        with stage('hit_search'):
+            records = resolve_trades(price_data, trades[offset:offset + JOB_CHUNK_TRADES], tolerance,
+                                     symbol.pip_size, timeframe, intrabar_source(symbol))
+        excursion_histograms.add(symbol.name, records)
+        if endpoint:
+            metrics.inc('backtest_trades_total', len(records), endpoint=endpoint)
+        yield records
+
+# Batch endpoint: resolves a JSON list of trades in one vectorized pass.
+# ?format=csv or ?format=ndjson streams the records instead, a chunk of trades at a time.
+@app.route('/backtest/batch', methods=['POST'])
+def backtest_batch_route():
+    try:
+        with stage('parse'):
+            export_format = parse_export_format(request.args.get('format'), choices=('json',) + STREAM_FORMATS)
+            symbol, price_data, trades, tolerance, timeframe = parse_batch_payload(request.get_json(silent=True))
+    except (TypeError, ValueError) as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+    if export_format in STREAM_FORMATS:
+        return stream_response(resolve_in_chunks(symbol, price_data, trades, tolerance, timeframe, 'backtest_batch'),
+                               export_format, "results.csv")
+    with stage('hit_search'):
+        results = resolve_trades(price_data, trades, tolerance, symbol.pip_size, timeframe, intrabar_source(symbol))
+    metrics.inc('backtest_trades_total', len(trades), endpoint='backtest_batch')
+    excursion_histograms.add(symbol.name, results)
+    with stage('render'):
+        return jsonify(symbol=symbol.name, timeframe=timeframe, results=results)
+
+# Portfolio endpoint: same body as /backtest/batch plus the portfolio settings ('system',
+# 'initial_equity', 'risk_per_trade', 'compound', 'max_open', 'curve_timeframe'); the trades are
+# simulated together as one account, returning the summary, per-trade sizing and the equity curve.
+@app.route('/backtest/portfolio', methods=['POST'])
+def backtest_portfolio_route():
+    try:
+        with stage('parse'):
+            payload = request.get_json(silent=True)
+            symbol, price_data, trades, tolerance, timeframe = parse_batch_payload(payload)
+            settings = PortfolioSettings.from_payload(payload)
+    except (TypeError, ValueError) as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+    with stage('hit_search'):
+        result = simulate_portfolio(price_data, trades, settings, tolerance, symbol.pip_size, timeframe,
+                                    intrabar_source(symbol))
+    metrics.inc('backtest_trades_total', len(trades), endpoint='backtest_portfolio')
+    with stage('render'):
+        return jsonify(symbol=symbol.name, timeframe=timeframe, **result)
+
+# Robustness endpoint: same body as /backtest/batch plus the robustness settings ('method',
+# 'samples', 'system', 'seed', 'entry_jitter', 'distance_jitter', 'include_samples'); the trades are
+# resampled, reshuffled or jittered and the distributions of expectancy, drawdown and losing streaks returned.
+@app.route('/backtest/robustness', methods=['POST'])
+def backtest_robustness_route():
+    try:
+        with stage('parse'):
+            payload = request.get_json(silent=True)
+            symbol, price_data, trades, tolerance, timeframe = parse_batch_payload(payload)
+            settings = RobustnessSettings.from_payload(payload)
+        with stage('hit_search'):
+            result = run_robustness(price_data, trades, settings, tolerance, symbol.pip_size, timeframe,
+                                    intrabar_source(symbol), include_samples=parse_flag(payload.get('include_samples', False)))
+    except (TypeError, ValueError) as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+    metrics.inc('backtest_trades_total', len(trades), endpoint='backtest_robustness')
+    with stage('render'):
+        return jsonify(symbol=symbol.name, timeframe=timeframe, **result)
+
+# Strategy endpoint: generates a strategy's entries over the symbol's whole history and resolves
+# them all. The body holds the strategy settings (see signals.StrategySettings) and optional
+# 'symbol' and 'tolerance'. ?format=csv or ?format=ndjson streams the per-trade records instead
+# of the JSON summary, a chunk of signals at a time.
+@app.route('/backtest/strategy', methods=['POST'])
+def backtest_strategy_route():
+    try:
+        with stage('parse'):
+            export_format = parse_export_format(request.args.get('format'), choices=('json',) + STREAM_FORMATS)
+            symbol, price_data, settings, tolerance = parse_strategy_payload(request.get_json(silent=True))
+    except (TypeError, ValueError) as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+    if export_format in STREAM_FORMATS:
+        with stage('hit_search'):
+            trades = generate_signals(price_data, settings, symbol.pip_size).trades()
+        return stream_response(resolve_in_chunks(symbol, price_data, trades, tolerance, settings.timeframe,
+                                                 'backtest_strategy'), export_format, "strategy.csv")
+    with stage('hit_search'):
+        result = backtest_strategy(price_data, settings, tolerance, symbol.pip_size, intrabar_source(symbol))
+    metrics.inc('backtest_trades_total', len(result['results']), endpoint='backtest_strategy')
+    excursion_histograms.add(symbol.name, result['results'])
+    with stage('render'):
+        return jsonify(symbol=symbol.name, **result)
+
+# Function to read a strategy request body, raising ValueError on invalid input
+def parse_strategy_payload(payload):
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object with the strategy settings.")
+    symbol, price_data = registry.get(payload.get('symbol'))
+    if symbol.chunked:
+        raise ValueError(f"Symbol {symbol.name} is scanned in chunks and only serves single trades at /monitor_trade.")
+    settings = StrategySettings.from_payload(payload)
+    tolerance = float(payload.get('tolerance', symbol.tolerance))
+    return symbol, price_data, settings, tolerance
+
+# Function to read a batch request body: a JSON list of trades or an object with 'trades'
+# and optional 'symbol', 'tolerance' and 'timeframe'. Raises ValueError on invalid input.
+def parse_batch_payload(payload):
+    if isinstance(payload, list):
+        payload = {'trades': payload}
+    if not isinstance(payload, dict) or not isinstance(payload.get('trades'), list):
+        raise ValueError("Request body must be a JSON object with a 'trades' list.")
+    symbol, price_data = registry.get(payload.get('symbol'))
+    if symbol.chunked:
+        raise ValueError(f"Symbol {symbol.name} is scanned in chunks and only serves single trades at /monitor_trade.")
+    trades = parse_trades(payload['trades'])
+    tolerance = float(payload.get('tolerance', symbol.tolerance))
+    timeframe = parse_timeframe(payload.get('timeframe'))
+    return symbol, price_data, trades, tolerance, timeframe
+
+# Background jobs (see jobs.py): long backtests run on a small thread pool instead of holding a
+# request open past the platform timeout. JOB_WORKERS bounds how many run at once, so heavy jobs
+# cannot starve form requests, and JOB_QUEUE_LIMIT how many may be queued or running.
+# JOB_KEEP_FINISHED and JOB_RESULTS_MB bound how many finished jobs, and how many MB of their
+# results, are kept for polling. Jobs live in the worker process that accepted them.
+job_queue = JobQueue(max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+                     max_pending=int(os.environ.get('JOB_QUEUE_LIMIT', 100)),
+                     keep_finished=int(os.environ.get('JOB_KEEP_FINISHED', 50)),
+                     max_result_bytes=int(float(os.environ.get('JOB_RESULTS_MB', 64)) * 2**20))
+
+# Trades resolved per step of a batch job or a streamed export; a job reports progress and checks
+# for cancellation between steps, and a stream sends each step's rows
+JOB_CHUNK_TRADES = 1000
+
+# Job submission: same body as /backtest/batch, returns a job id to poll at /jobs/<id>
+@app.route('/jobs/batch', methods=['POST'])
+def submit_batch_job_route():
+    try:
+        symbol, price_data, trades, tolerance, timeframe = parse_batch_payload(request.get_json(silent=True))
+    except (TypeError, ValueError) as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+
+    def work(job):
+        results = []
+        for records in resolve_in_chunks(symbol, price_data, trades, tolerance, timeframe):
+            results.extend(records)
+            job.report(len(results))
+        return {'symbol': symbol.name, 'timeframe': timeframe, 'results': results}
+
+    return job_submitted(job_queue.submit('batch', work, total=len(trades)))
+
+# Job submission: same body as /backtest/portfolio, for simulations that outlast a request; progress
+# counts trades with resolved exits and the job can be cancelled between blocks of trades
+@app.route('/jobs/portfolio', methods=['POST'])
+def submit_portfolio_job_route():
+    try:
+        payload = request.get_json(silent=True)
+        symbol, price_data, trades, tolerance, timeframe = parse_batch_payload(payload)
+        settings = PortfolioSettings.from_payload(payload)
+    except (TypeError, ValueError) as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+
+    def work(job):
+        result = simulate_portfolio(price_data, trades, settings, tolerance, symbol.pip_size, timeframe,
+                                    intrabar_source(symbol), block_trades=JOB_CHUNK_TRADES, on_block=job.report)
+        return dict(result, symbol=symbol.name, timeframe=timeframe)
+
+    return job_submitted(job_queue.submit('portfolio', work, total=len(trades)))
+
+# Job submission: same body as /backtest/strategy, for strategies over long histories; progress
+# counts resolved signals and the job can be cancelled between blocks of signals
+@app.route('/jobs/strategy', methods=['POST'])
+def submit_strategy_job_route():
+    try:
+        symbol, price_data, settings, tolerance = parse_strategy_payload(request.get_json(silent=True))
+    except (TypeError, ValueError) as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+
+    def work(job):
+        result = backtest_strategy(price_data, settings, tolerance, symbol.pip_size, intrabar_source(symbol),
+                                   block_trades=JOB_CHUNK_TRADES, on_block=job.report)
+        excursion_histograms.add(symbol.name, result['results'])
+        return dict(result, symbol=symbol.name)
+
+    # The signals are generated in the job, so their count (the total) is only known once it runs
+    return job_submitted(job_queue.submit('strategy', work))
+
+# Job submission: same body as /backtest/robustness; progress counts finished samples and the
+# job can be cancelled between blocks of samples
+@app.route('/jobs/robustness', methods=['POST'])
+def submit_robustness_job_route():
+    try:
+        payload = request.get_json(silent=True)
+        symbol, price_data, trades, tolerance, timeframe = parse_batch_payload(payload)
+        settings = RobustnessSettings.from_payload(payload)
+        include_samples = parse_flag(payload.get('include_samples', False))
+    except (TypeError, ValueError) as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+
+    def work(job):
+        result = run_robustness(price_data, trades, settings, tolerance, symbol.pip_size, timeframe,
+                                intrabar_source(symbol), on_block=job.report, include_samples=include_samples)
+        return dict(result, symbol=symbol.name, timeframe=timeframe)
+
+    return job_submitted(job_queue.submit('robustness', work, total=settings.samples))
+
+# Job submission: same form as /monitor_trade; the job result holds the outcome record
+@app.route('/jobs/monitor_trade', methods=['POST'])
+def submit_monitor_job_route():
+    try:
+        trade = parse_trade_form(request.form)
+    except KeyError as e:
+        return jsonify(error=f"Invalid input: missing field '{e.args[0]}'."), 400
+    except ValueError as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+
+    def work(job):
+        outcome = cached_monitor_trade(trade)
+        job.report(1)
+        return {'outcome': outcome.to_dict()}
+
+    return job_submitted(job_queue.submit('monitor_trade', work, total=1))
+
+# Function to answer a job submission: 202 with the job id, or 429 when the queue is full
+def job_submitted(job):
+    if job is None:
+        return jsonify(error="Too many pending jobs. Try again later."), 429
+    return jsonify(job_id=job.id, status=job.status, status_url=url_for('job_status_route', job_id=job.id)), 202
+
+# Job status, progress and (once done) results
+@app.route('/jobs/<job_id>')
+def job_status_route(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error=f"Unknown job: {job_id}"), 404
+    return jsonify(job.to_dict())
+
+# Job cancellation: queued jobs never start, running jobs stop at their next progress step
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job_route(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify(error=f"Unknown job: {job_id}"), 404
+    return jsonify(job.to_dict(include_result=False))
+
+# Job counts per state
+@app.route('/jobs')
+def jobs_route():
+    return jsonify(job_queue.stats())
+
+# Ingestion endpoint: appends an uploaded CSV/parquet chunk of new bars to a symbol.
+# When the symbol has an ingest directory the chunk is also saved there, so every worker picks it up.
+@app.route('/data/append', methods=['POST'])
+def data_append_route():
+    if not ingest_token:
+        return jsonify(error="Data ingestion is not enabled."), 404
+    if request.headers.get('X-Ingest-Token') != ingest_token:
+        return jsonify(error="Invalid ingest token."), 403
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify(error="Request must include a CSV or parquet 'file' upload."), 400
+    try:
+        symbol = registry.symbol(request.form.get('symbol'))
+    except ValueError as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+    if symbol.chunked:
+        return jsonify(error=f"Symbol {symbol.name} is scanned in chunks from parquet and cannot be appended to."), 400
+    file_format = "csv" if upload.filename.lower().endswith(".csv") else "parquet"
+    path = os.path.join(symbol.ingest_dir, os.path.basename(upload.filename)) if symbol.ingest_dir else None
+    if path and os.path.exists(path):
+        return jsonify(error=f"Chunk {os.path.basename(path)} was already uploaded."), 409
+    content = upload.read()
+    live_data = registry.live_dataset(symbol.name)
+    try:
+        added = live_data.append_file(io.BytesIO(content), file_format)
+    except ValueError as ve:
+        return jsonify(error=f"Invalid input: {ve}"), 400
+    if path:
+        live_data.mark_applied(path)
+        with open(path, "wb") as handle:
+            handle.write(content)
+    price_data = live_data.price_data
+    return jsonify(symbol=symbol.name, added=added, rows=len(price_data), last_time=str(price_data.time_at(-1)),
+                   dataset_version=price_data.version)
+
+# Configured symbols, what is loaded and how much memory it takes
+@app.route('/symbols')
+def symbols_route():
+    return jsonify(registry.stats())
+
+# Hit/miss counters of the result cache, for sizing it
+@app.route('/cache/stats')
+def cache_stats_route():
+    return jsonify(result_cache.stats())
+
+# Excursion histograms: MAE/MFE in R bins, split by outcome, over every batch resolved so far
+# (optionally ?symbol=NAME); DELETE starts them over
+@app.route('/excursions')
+def excursions_route():
+    symbol = request.args.get('symbol')
+    return jsonify(excursion_histograms.to_dict(symbol.upper() if symbol else None))
+
+@app.route('/excursions', methods=['DELETE'])
+def reset_excursions_route():
+    symbol = request.args.get('symbol')
+    excursion_histograms.reset(symbol.upper() if symbol else None)
+    return jsonify(status='reset')
+
+# Function to read the cache, dataset, memory and job figures for a metrics scrape
+def collect_app_metrics():
+    cache = result_cache.stats()
+    symbols = registry.stats()
+    jobs = job_queue.stats()
+    return [
+        ('result_cache_hits_total', 'counter', 'Result cache hits.', [({}, cache['hits'])]),
+        ('result_cache_misses_total', 'counter', 'Result cache misses.', [({}, cache['misses'])]),
+        ('result_cache_evictions_total', 'counter', 'Results evicted from the in-memory cache.', [({}, cache['evictions'])]),
+        ('result_cache_entries', 'gauge', 'Results held in the in-memory cache.', [({}, cache['size'])]),
+        ('dataset_loads_total', 'counter', 'Symbol datasets loaded.', [({}, symbols['loads'])]),
+        ('dataset_evictions_total', 'counter', 'Symbol datasets evicted to fit the memory budget.', [({}, symbols['evictions'])]),
+        ('dataset_load_seconds', 'gauge', 'Seconds the latest load of each symbol took.',
+         [({'symbol': name}, seconds) for name, seconds in symbols['load_seconds'].items()]),
+        ('dataset_resident_bytes', 'gauge', 'Process memory held by each loaded symbol (memory-mapped data excluded).',
+         [({'symbol': name}, size) for name, size in symbols['loaded'].items()]),
+        ('intrabar_bars_total', 'counter', 'Ambiguous M1 bars settled from ticks, by symbol.',
+         [({'symbol': name}, ticks['bars_served']) for name, ticks in symbols['tick_stores'].items()]),
+        ('intrabar_missing_total', 'counter', 'Ambiguous M1 bars without ticks, left to the rule order, by symbol.',
+         [({'symbol': name}, ticks['bars_missing']) for name, ticks in symbols['tick_stores'].items()]),
+        ('intrabar_days_loaded_total', 'counter', 'Days of ticks read from the tick stores, by symbol.',
+         [({'symbol': name}, ticks['days_loaded']) for name, ticks in symbols['tick_stores'].items()]),
+        ('process_resident_memory_bytes', 'gauge', 'Resident memory of this worker process.', [({}, resident_memory_bytes())]),
+        ('backtest_jobs', 'gauge', 'Background jobs, by state.',
+         [({'state': state}, jobs[state]) for state in (JOB_QUEUED, JOB_RUNNING) + FINISHED_STATES]),
+        ('backtest_job_result_bytes', 'gauge', 'Bytes of finished job results held, as JSON.',
+         [({}, jobs['result_bytes'])]),
+        ('backtest_job_result_bytes_limit', 'gauge', 'Bytes of finished job results kept before the oldest are dropped.',
+         [({}, jobs['max_result_bytes'])]),
+    ]
+
+metrics.register_collector(collect_app_metrics)
+
+# Prometheus scrape endpoint (per worker process)
+@app.route('/metrics')
+def metrics_route():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     app.run(debug=True)
     
@@ -1,37 +1,52 @@
+import argparse
+import csv
+import json
 import os
+import sys
 import pandas as pd
 
+from batch import load_trades_file, parse_trade_line, resolve_trades
+from excursions import trade_excursions
+from hit_search import find_trade_outcome
+from outcomes import RECORD_FIELDS, TradeOutcome
+from price_store import load_cached_price_file
+from tick_store import TickStore
+from timeframes import SEARCH_INDEXES, TIMEFRAMES, TimeframeIndex
+
 # Load the CSV file
 file_path = "xauusd.csv"
 if not os.path.exists(file_path):
     print(f"File not found: {file_path}")
     exit()
 
-df = pd.read_csv(file_path)
-
-# Convert 'Local time' column to datetime
+# Sorted epoch-minute index over the price columns, with the forward-extremes index for far hits.
+# The parsed bars are cached in xauusd.csv.cache, so the CSV is only parsed again after it changes.
 try:
-    df['Local time'] = pd.to_datetime(df['Local time'], format='%d.%m.%Y %H:%M:%S')
-except Exception as e:
-    print(f"Error parsing 'Local time' column: {e}")
+    price_data = load_cached_price_file(file_path)
+except ValueError as e:
+    print(e)
     exit()
 
+# Output formats of resolved trades
+OUTPUT_FORMATS = ('text', 'csv', 'json')
+
+# Symbol of the data in xauusd.csv, shown with resolved trades
+SYMBOL = "XAUUSD"
+
+# Function to find the position of the bar for a specific date and time
+def locate_entry(entry_time):
+    # Binary search for the exact minute
+    position = price_data.locate(entry_time)
+    if position is None:
+        print(f"No data found for the specified time: {entry_time}")
+    return position
+
 # Function to get the closing price for a specific date and time
 def get_closing_price(year, month, day, hour, minute):
-    # Create a timestamp for the input time
-    input_time = pd.Timestamp(year, month, day, hour, minute)
-    
-    # Filter the dataframe for the exact time
-    try:
-        row = df.loc[df['Local time'] == input_time]
-        if not row.empty:
-            return row['Close'].iloc[0]
-        else:
-            print(f"No data found for the specified time: {input_time}")
-            return None
-    except Exception as e:
-        print(f"Error fetching closing price: {e}")
+    position = locate_entry(pd.Timestamp(year, month, day, hour, minute))
+    if position is None:
         return None
+    return price_data.close[position]
 
 # Function to format runtime
 def format_runtime(runtime):
@@ -72,26 +87,28 @@ def validate_trade_inputs(entry_price, stoploss_price, takeprofit_price, trade_t
         return False
     return True
 
-# Function to monitor trade and check SL/TP conditions
-def monitor_trade(entry_time, stoploss_price, takeprofit_price, trade_type, tolerance=0.1):
+# Function to monitor trade and check SL/TP conditions.
+# intrabar is an optional tick source (TickStore.path) settling bars that reach several levels.
+def monitor_trade(entry_time, stoploss_price, takeprofit_price, trade_type, tolerance=0.1, intrabar=None):
     # Get the entry price based on input time (only using Close price)
-    entry_price = get_closing_price(entry_time.year, entry_time.month, entry_time.day, entry_time.hour, entry_time.minute)
-    if entry_price is None:
+    entry_position = locate_entry(entry_time)
+    if entry_position is None:
         return
+    entry_price = price_data.close[entry_position]
 
     # Validate trade inputs
     if not validate_trade_inputs(entry_price, stoploss_price, takeprofit_price, trade_type):
         return
 
     # Print entry details
-    print("Pair: XAUUSD")
+    print(f"Pair: {SYMBOL}")
     print(f"Trade Type: {trade_type.capitalize()}")
     print(f"Entry Price: {entry_price:.3f} | Time: {entry_time.strftime('%I:%M %p (%d %B %Y)')}")
     print(f"SL Price: {stoploss_price:.3f} ({calculate_pips(entry_price, stoploss_price):.2f} pips) | TP Price: {takeprofit_price:.3f} ({calculate_pips(entry_price, takeprofit_price):.2f} pips)")
 
-    # Filter the DataFrame for rows after the entry time
-    df_filtered = df[df['Local time'] > entry_time]
-    if df_filtered.empty:
+    # Position of the first bar after the entry time
+    window_start = price_data.first_after(entry_time)
+    if window_start >= len(price_data):
         print("No data available after the specified entry time.")
         return
 
@@ -99,102 +116,64 @@ def monitor_trade(entry_time, stoploss_price, takeprofit_price, trade_type, tole
     sl_pips = calculate_pips(entry_price, stoploss_price)
     tp_pips = calculate_pips(entry_price, takeprofit_price)
 
-    # Iterate through rows after the entry time
-    for _, row in df_filtered.iterrows():
-        current_high = row['High']
-        current_low = row['Low']
-        current_time = row['Local time']
-
-        # Logic for Buy
-        if trade_type.lower() == 'buy':
-            # Check if High exceeds TP or Low goes below SL for Buy
-            if current_high >= takeprofit_price - tolerance:  # TP for Buy
-                runtime = current_time - entry_time
-                formatted_runtime = format_runtime(runtime)
-                tp_pips_hit = calculate_pips(entry_price, takeprofit_price)
-                rr = tp_pips_hit / sl_pips
-                print(f"Take Profit hit: {takeprofit_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                print(f"PnL: {rr:.2f}R\n")
-                break
-            elif current_low <= stoploss_price + tolerance:  # SL for Buy
-                runtime = current_time - entry_time
-                formatted_runtime = format_runtime(runtime)
-                sl_pips_hit = calculate_pips(entry_price, stoploss_price)
-                print(f"Stoploss hit: {stoploss_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                print(f"PnL: -1R\n")
-                break
-
-        # Logic for Sell
-        elif trade_type.lower() == 'sell':
-            # Check if Low exceeds TP or High goes above SL for Sell
-            if current_low <= takeprofit_price + tolerance:  # TP for Sell
-                runtime = current_time - entry_time
-                formatted_runtime = format_runtime(runtime)
-                tp_pips_hit = calculate_pips(entry_price, takeprofit_price)
-                rr = tp_pips_hit / sl_pips
-                print(f"Take Profit hit: {takeprofit_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                print(f"PnL: {rr:.2f}R\n")
-                break
-            elif current_high >= stoploss_price - tolerance:  # SL for Sell
-                runtime = current_time - entry_time
-                formatted_runtime = format_runtime(runtime)
-                sl_pips_hit = calculate_pips(entry_price, stoploss_price)
-                print(f"Stoploss hit: {stoploss_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
-                print(f"PnL: -1R\n")
-                break
-
-    # Monitor for 3R or breakeven independently
+    # 3R target for the 3R system monitored alongside SL/TP
     three_r_pips = 3 * sl_pips
     three_r_target = entry_price + three_r_pips / 10 if trade_type.lower() == 'buy' else entry_price - three_r_pips / 10
-    breakeven_triggered = False
+
+    # Resolve both systems in one pass from window_start onwards: the first bar where TP or SL is hit
+    # (TP takes precedence within a bar), and the breakeven/3R outcome without the stop loss
+    hit, hit_index, breakeven_index, outcome, outcome_index = find_trade_outcome(
+        price_data.high, price_data.low, entry_price, stoploss_price, takeprofit_price, three_r_target, trade_type,
+        breakeven=True, tolerance=tolerance, check_stoploss=False, start=window_start, extremes=price_data.hit_index,
+        minutes=price_data.minutes, intrabar=intrabar)
+
+    # How far the trade moved against and for it before each exit
+    mae_pips, mfe_pips, mfe_index, three_r_mfe_pips = trade_excursions(
+        price_data, entry_price, stoploss_price, takeprofit_price, three_r_target, trade_type.lower() == 'buy',
+        window_start, hit_index, outcome_index)
+    excursion = f"MAE: {mae_pips:.2f} pips ({mae_pips / sl_pips:.2f}R) | MFE: {mfe_pips:.2f} pips ({mfe_pips / sl_pips:.2f}R)"
+    if mfe_index is not None:
+        excursion += f" | Time to MFE: {format_runtime(price_data.time_at(mfe_index) - entry_time)}"
+
+    if hit == 'tp':
+        current_time = price_data.time_at(hit_index)
+        formatted_runtime = format_runtime(current_time - entry_time)
+        rr = tp_pips / sl_pips
+        print(f"Take Profit hit: {takeprofit_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
+        print(excursion)
+        print(f"PnL: {rr:.2f}R\n")
+    elif hit == 'sl':
+        current_time = price_data.time_at(hit_index)
+        formatted_runtime = format_runtime(current_time - entry_time)
+        print(f"Stoploss hit: {stoploss_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_runtime}")
+        print(excursion)
+        print(f"PnL: -1R\n")
+
+    # Report the 3R system outcome
     print("(3R System)")
 
-    for _, row in df_filtered.iterrows():
-        current_high = row['High']
-        current_low = row['Low']
-        current_time = row['Local time']
-
-        # Logic for Buy
-        if trade_type.lower() == 'buy':
-            if not breakeven_triggered and current_high >= entry_price + sl_pips / 10 - tolerance:
-                breakeven_triggered = True
-                breakeven_runtime = current_time - entry_time
-                formatted_breakeven_runtime = format_runtime(breakeven_runtime)
-                print(f"Breakeven at: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
-            if breakeven_triggered and current_low <= entry_price + tolerance:
-                breakeven_runtime = current_time - entry_time
-                formatted_breakeven_runtime = format_runtime(breakeven_runtime)
-                print(f"Breakeven hit: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
-                return
-            if current_high >= three_r_target - tolerance:
-                three_r_runtime = current_time - entry_time
-                formatted_three_r_runtime = format_runtime(three_r_runtime)
-                three_r_pips_hit = calculate_pips(entry_price, three_r_target)
-                print(f"3R hit: {three_r_target:.3f} ({three_r_pips_hit:.2f} pips) | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_three_r_runtime}")
-                return
-
-        # Logic for Sell
-        elif trade_type.lower() == 'sell':
-            if not breakeven_triggered and current_low <= entry_price - sl_pips / 10 + tolerance:
-                breakeven_triggered = True
-                breakeven_runtime = current_time - entry_time
-                formatted_breakeven_runtime = format_runtime(breakeven_runtime)
-                print(f"Breakeven at: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
-            if breakeven_triggered and current_high >= entry_price - tolerance:
-                breakeven_runtime = current_time - entry_time
-                formatted_breakeven_runtime = format_runtime(breakeven_runtime)
-                print(f"Breakeven hit: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
-                return
-            if current_low <= three_r_target + tolerance:
-                three_r_runtime = current_time - entry_time
-                formatted_three_r_runtime = format_runtime(three_r_runtime)
-                three_r_pips_hit = calculate_pips(entry_price, three_r_target)
-                print(f"3R hit: {three_r_target:.3f} ({three_r_pips_hit:.2f} pips) | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_three_r_runtime}")
-                return
+    if breakeven_index is not None:
+        current_time = price_data.time_at(breakeven_index)
+        formatted_breakeven_runtime = format_runtime(current_time - entry_time)
+        print(f"Breakeven at: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
+
+    if outcome == 'breakeven':
+        current_time = price_data.time_at(outcome_index)
+        formatted_breakeven_runtime = format_runtime(current_time - entry_time)
+        print(f"Breakeven hit: {entry_price:.3f} | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_breakeven_runtime}")
+        print(f"R reached before exit: {three_r_mfe_pips / sl_pips:.2f}R")
+        return
+    if outcome == '3r':
+        current_time = price_data.time_at(outcome_index)
+        formatted_three_r_runtime = format_runtime(current_time - entry_time)
+        three_r_pips_hit = calculate_pips(entry_price, three_r_target)
+        print(f"3R hit: {three_r_target:.3f} ({three_r_pips_hit:.2f} pips) | Time: {current_time.strftime('%I:%M %p (%d %B %Y)')} | Runtime: {formatted_three_r_runtime}")
+        print(f"R reached before exit: {three_r_mfe_pips / sl_pips:.2f}R")
+        return
 
     # If no SL/TP is hit
-    last_time = df_filtered['Local time'].iloc[-1]
-    last_price = df_filtered['Close'].iloc[-1]
+    last_time = price_data.time_at(-1)
+    last_price = price_data.close[-1]
     print(f"No SL/TP hit. Last price checked: {last_price:.3f} at {last_time.strftime('%I:%M %p (%d %B %Y)')}.")
 
 # Input system to get trade details
@@ -224,8 +203,112 @@ def input_trade_details():
         print(f"Invalid input: {ve}")
         return None, None, None, None
 
+# Writes resolved trade records to a stream one at a time, flushing after each so a session
+# shows every result as soon as its trade is read: the result text, CSV rows or one JSON object per line.
+# symbol, digits and pip_size describe the traded symbol in the result text.
+class RecordWriter:
+    def __init__(self, output_format='text', handle=None, symbol=SYMBOL, digits=3, pip_size=0.1):
+        self.output_format = output_format
+        self.handle = handle or sys.stdout
+        self.symbol = symbol
+        self.digits = digits
+        self.pip_size = pip_size
+        self.csv_writer = None
+
+    def write(self, record):
+        if self.output_format == 'text':
+            line = ""
+            for line in TradeOutcome.from_record(record, self.symbol, self.digits, self.pip_size).lines():
+                print(line, file=self.handle)
+            # Results are separated by a blank line (result text may already end with one)
+            if not line.endswith("\n"):
+                print(file=self.handle)
+        elif self.output_format == 'csv':
+            if self.csv_writer is None:
+                self.csv_writer = csv.DictWriter(self.handle, fieldnames=RECORD_FIELDS, extrasaction='ignore')
+                self.csv_writer.writeheader()
+            self.csv_writer.writerow(record)
+        else:
+            print(json.dumps(record), file=self.handle)
+        self.handle.flush()
+
+# Function to resolve trades with the rules of this CLI, so a trade resolves the same in every mode:
+# the 3R system ignores the stop loss and always moves to breakeven, as in monitor_trade
+def resolve_cli_trades(trades, tolerance, timeframe='M1', intrabar=None):
+    return resolve_trades(price_data, trades, tolerance, timeframe=timeframe, intrabar=intrabar,
+                          check_stoploss=False, breakeven=True)
+
+# Function to resolve a file of trades in one pass and print the structured results (a JSON list by default)
+def run_batch(trades_path, tolerance, timeframe='M1', intrabar=None, output_format='json'):
+    try:
+        trades = load_trades_file(trades_path)
+    except (OSError, ValueError) as e:
+        print(f"Invalid trades file: {e}")
+        return
+    records = resolve_cli_trades(trades, tolerance, timeframe, intrabar)
+    if output_format == 'json':
+        print(json.dumps(records, indent=2))
+        return
+    writer = RecordWriter(output_format)
+    for record in records:
+        writer.write(record)
+
+# Function to read the lines of a trade session: prompted for at a terminal, otherwise streamed (e.g. a pipe)
+def session_lines(stream):
+    if not stream.isatty():
+        yield from stream
+        return
+    print("Enter trades as 'YYYY-MM-DD HH:MM buy|sell SL_PRICE TP_PRICE' or as JSON objects; "
+          "'quit' or Ctrl-D ends the session.", file=sys.stderr)
+    while True:
+        try:
+            yield input("trade> ")
+        except EOFError:
+            return
+
+# Function to run a session: resolve trades one per line from stdin against the data loaded once,
+# writing each result as soon as it is resolved. Lines that are not trades are reported on stderr.
+def run_session(tolerance, timeframe='M1', intrabar=None, output_format='text', stream=None):
+    writer = RecordWriter(output_format)
+    for number, line in enumerate(session_lines(stream or sys.stdin), start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.lower() in ['quit', 'exit']:
+            break
+        try:
+            trade = parse_trade_line(line)
+        except ValueError as ve:
+            print(f"Line {number}: Invalid input: {ve}", file=sys.stderr)
+            continue
+        writer.write(resolve_cli_trades([trade], tolerance, timeframe, intrabar)[0])
+
 # Main Execution
-entry_time, stoploss_price, takeprofit_price, trade_type = input_trade_details()
-if entry_time and stoploss_price and takeprofit_price and trade_type:
-    print()
-    monitor_trade(entry_time, stoploss_price, takeprofit_price, trade_type)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backtest XAUUSD trades against xauusd.csv.")
+    parser.add_argument('--batch', metavar='TRADES_FILE', help="resolve every trade in a .json or .csv file instead of prompting for one")
+    parser.add_argument('--session', action='store_true',
+                        help="keep the data loaded and resolve trades one per line from stdin, prompting at a terminal")
+    parser.add_argument('--format', dest='output_format', choices=OUTPUT_FORMATS,
+                        help="output of --batch and --session results (default: json for --batch, text for --session)")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="price tolerance used for SL/TP hits (default: 0.1)")
+    parser.add_argument('--timeframe', type=str.upper, choices=list(TIMEFRAMES), default='M1',
+                        help="timeframe of the batch entry bars; exits are still resolved on M1 (default: M1)")
+    parser.add_argument('--ticks', help="tick store directory used to settle bars that reach both SL and TP (see tick_store.py)")
+    parser.add_argument('--search-index', choices=SEARCH_INDEXES, default='pyramid',
+                        help="index used to find far-away hits: the forward-extremes pyramid or the coarse-to-fine "
+                             "search over M5..D1 bars (default: pyramid)")
+    args = parser.parse_args()
+
+    intrabar = TickStore(args.ticks).path if args.ticks else None
+    if args.search_index == 'timeframes':
+        price_data.search_index = TimeframeIndex.build(price_data)
+    if args.batch:
+        run_batch(args.batch, args.tolerance, args.timeframe, intrabar, args.output_format or 'json')
+    elif args.session:
+        run_session(args.tolerance, args.timeframe, intrabar, args.output_format or 'text')
+    else:
+        entry_time, stoploss_price, takeprofit_price, trade_type = input_trade_details()
+        if entry_time and stoploss_price and takeprofit_price and trade_type:
+            print()
+            monitor_trade(entry_time, stoploss_price, takeprofit_price, trade_type, args.tolerance, intrabar)
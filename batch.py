@@ -0,0 +1,277 @@
+import csv
+import json
+
+import numpy as np
+import pandas as pd
+
+from excursions import price_excursions
+from hit_search import HIT_BREAKEVEN, HIT_NAMES, HIT_THREE_R, HIT_TP, find_trade_outcomes
+from price_data import to_epoch_minutes_array
+from timeframes import parse_timeframe, timeframe_cache
+
+# Function to read an optional numeric field from a trade record
+def _optional_float(record, name):
+    value = record.get(name)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return float(value)
+
+# Function to read a boolean field that may arrive as a JSON bool or a form/CSV string
+def parse_flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ['true', '1', 'yes']
+
+# Function to read the entry time and side of a trade record (JSON object or CSV row)
+def parse_entry(record):
+    if not isinstance(record, dict):
+        raise ValueError("Each trade must be an object.")
+    if 'entry_time' not in record:
+        raise ValueError("Missing entry_time.")
+    try:
+        entry_time = pd.Timestamp(record['entry_time'])
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid entry_time: {e}")
+    if pd.isna(entry_time):
+        raise ValueError("Invalid entry_time.")
+
+    trade_type = str(record.get('trade_type', '')).strip().lower()
+    if trade_type not in ['buy', 'sell']:
+        raise ValueError("Trade type must be 'buy' or 'sell'.")
+    return entry_time, trade_type
+
+# Function to normalize one trade record into a plain dict.
+# SL/TP are given either as prices (stoploss_price/takeprofit_price) or as pips
+# (stoploss_pips/takeprofit_pips) measured from the entry close.
+def parse_trade(record):
+    entry_time, trade_type = parse_entry(record)
+    trade = {
+        'entry_time': entry_time,
+        'trade_type': trade_type,
+        'stoploss_price': _optional_float(record, 'stoploss_price'),
+        'takeprofit_price': _optional_float(record, 'takeprofit_price'),
+        'stoploss_pips': _optional_float(record, 'stoploss_pips'),
+        'takeprofit_pips': _optional_float(record, 'takeprofit_pips'),
+        'breakeven': parse_flag(record.get('breakeven', False)),
+    }
+    if trade['stoploss_price'] is not None and trade['takeprofit_price'] is not None:
+        trade['stoploss_pips'] = trade['takeprofit_pips'] = None
+    elif trade['stoploss_pips'] is None or trade['takeprofit_pips'] is None:
+        raise ValueError("Provide stoploss_price and takeprofit_price, or stoploss_pips and takeprofit_pips.")
+    return trade
+
+# Function to parse one line of a trade stream: a JSON trade object, or the short form
+# 'YYYY-MM-DD HH:MM buy|sell SL_PRICE TP_PRICE [breakeven]'
+def parse_trade_line(line):
+    line = line.strip()
+    if line.startswith('{'):
+        return parse_trade(json.loads(line))
+    fields = line.split()
+    if len(fields) not in [5, 6]:
+        raise ValueError("Expected 'YYYY-MM-DD HH:MM buy|sell SL_PRICE TP_PRICE [breakeven]' or a JSON trade object.")
+    return parse_trade({
+        'entry_time': f"{fields[0]} {fields[1]}",
+        'trade_type': fields[2],
+        'stoploss_price': fields[3],
+        'takeprofit_price': fields[4],
+        'breakeven': fields[5] if len(fields) == 6 else False,
+    })
+
+# Function to parse a list of trade records, reporting the position of the first bad one
+def parse_trades(records, parse=parse_trade):
+    trades = []
+    for number, record in enumerate(records, start=1):
+        try:
+            trades.append(parse(record))
+        except ValueError as ve:
+            raise ValueError(f"Trade {number}: {ve}")
+    return trades
+
+# Function to read raw trade records from a .csv file or a .json file (a list, or an object with a "trades" list)
+def read_trade_records(path):
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as handle:
+            return list(csv.DictReader(handle))
+    with open(path) as handle:
+        records = json.load(handle)
+    if isinstance(records, dict):
+        records = records.get('trades')
+    if not isinstance(records, list):
+        raise ValueError("Trades file must contain a list of trades.")
+    return records
+
+# Function to load and parse trade records from a .csv or .json file
+def load_trades_file(path):
+    return parse_trades(read_trade_records(path))
+
+# Function to format epoch minutes as ISO timestamps, with None for missing (-1) positions
+def _times_at(price_data, positions):
+    positions = np.asarray(positions)
+    text = np.datetime_as_string(price_data.minutes[np.maximum(positions, 0)].astype('datetime64[m]'))
+    return [value if position >= 0 else None for value, position in zip(text.tolist(), positions.tolist())]
+
+# Parsed trades located in the price data, as arrays: entry minutes, entry bar positions (-1 if
+# missing), the first bar after each entry, entry prices and SL/TP prices, side and breakeven
+# flags, and one error message per trade (None when it can be resolved, see the valid mask).
+class LocatedTrades:
+    def __init__(self, entry_minutes, positions, starts, entry_price, stoploss, takeprofit, is_buy, breakeven, errors):
+        self.entry_minutes = entry_minutes
+        self.positions = positions
+        self.starts = starts
+        self.entry_price = entry_price
+        self.stoploss = stoploss
+        self.takeprofit = takeprofit
+        self.is_buy = is_buy
+        self.breakeven = breakeven
+        self.errors = errors
+        self.valid = np.array([error is None for error in errors], dtype=bool)
+
+    def __len__(self):
+        return len(self.errors)
+
+    # Function to take a slice of the trades, e.g. to resolve them block by block
+    def __getitem__(self, items):
+        return LocatedTrades(self.entry_minutes[items], self.positions[items], self.starts[items],
+                             self.entry_price[items], self.stoploss[items], self.takeprofit[items], self.is_buy[items],
+                             self.breakeven[items], self.errors[items])
+
+# Function to locate parsed trades and validate their SL/TP against the entry price.
+# pip_size is the price move of one pip for the symbol (0.1 for XAUUSD).
+# With a higher timeframe (e.g. 'H1') entry times are bar open times of that timeframe and the
+# entry price is the bar's close; the trade starts at the first M1 bar after that bar.
+def locate_trades(price_data, trades, pip_size=0.1, timeframe='M1'):
+    timeframe = parse_timeframe(timeframe)
+    count = len(trades)
+    entry_minutes = to_epoch_minutes_array([trade['entry_time'] for trade in trades])
+    is_buy = np.array([trade['trade_type'] == 'buy' for trade in trades], dtype=bool)
+    breakeven = np.array([trade['breakeven'] for trade in trades], dtype=bool)
+
+    # Locate every entry bar with one binary search
+    if timeframe == 'M1':
+        positions, starts = price_data.locate_many(entry_minutes)
+        entry_close = price_data.close
+    else:
+        bars = timeframe_cache.get(price_data, timeframe)
+        positions, _ = bars.price_data.locate_many(entry_minutes)
+        starts = bars.bounds[positions + 1]
+        entry_close = bars.price_data.close
+    found = positions >= 0
+    entry_price = np.where(found, entry_close[np.maximum(positions, 0)], np.nan)
+
+    # Convert pip distances to prices the same way the form does
+    pips_per_unit = 1 / pip_size
+    def column(name):
+        return np.array([np.nan if trade[name] is None else trade[name] for trade in trades], dtype=np.float64)
+    uses_pips = np.array([trade['stoploss_pips'] is not None for trade in trades], dtype=bool)
+    stoploss_pips, takeprofit_pips = column('stoploss_pips'), column('takeprofit_pips')
+    stoploss = np.where(uses_pips, np.where(is_buy, entry_price - stoploss_pips / pips_per_unit, entry_price + stoploss_pips / pips_per_unit),
+                        column('stoploss_price'))
+    takeprofit = np.where(uses_pips, np.where(is_buy, entry_price + takeprofit_pips / pips_per_unit, entry_price - takeprofit_pips / pips_per_unit),
+                          column('takeprofit_price'))
+
+    errors = [None] * count
+    for i in range(count):
+        if not found[i]:
+            errors[i] = "No data found for the specified entry time."
+        elif is_buy[i] and stoploss[i] >= entry_price[i]:
+            errors[i] = "For a Buy trade, SL should be below the entry price."
+        elif is_buy[i] and takeprofit[i] <= entry_price[i]:
+            errors[i] = "For a Buy trade, TP should be above the entry price."
+        elif not is_buy[i] and stoploss[i] <= entry_price[i]:
+            errors[i] = "For a Sell trade, SL should be above the entry price."
+        elif not is_buy[i] and takeprofit[i] >= entry_price[i]:
+            errors[i] = "For a Sell trade, TP should be below the entry price."
+        elif starts[i] >= len(price_data):
+            errors[i] = "No data available after the specified entry time."
+    return LocatedTrades(entry_minutes, positions, starts, entry_price, stoploss, takeprofit, is_buy, breakeven, errors)
+
+# Function to resolve many parsed trades against the price data in one vectorized pass.
+# Returns one flat record per trade with the SL/TP outcome, the 3R system outcome and how far the
+# trade moved against and for it before each exit (see excursions.price_excursions).
+# pip_size is the price move of one pip for the symbol (0.1 for XAUUSD).
+# With a higher timeframe (e.g. 'H1') entry times are bar open times of that timeframe and the
+# entry price is the bar's close; exits are still searched bar by bar in the M1 data after it.
+# intrabar is an optional tick source (TickStore.path) settling M1 bars that reach several levels.
+# The 3R system follows the app's rules by default (SL checked, breakeven per trade); backtest_1.py
+# passes check_stoploss=False and breakeven=True to apply its own to every trade.
+def resolve_trades(price_data, trades, tolerance=0.1, pip_size=0.1, timeframe='M1', intrabar=None,
+                   check_stoploss=True, breakeven=None):
+    if len(trades) == 0:
+        return []
+    located = locate_trades(price_data, trades, pip_size, timeframe)
+    entry_minutes, starts, valid, errors = located.entry_minutes, located.starts, located.valid, located.errors
+    entry_price, stoploss, takeprofit = located.entry_price, located.stoploss, located.takeprofit
+    is_buy = located.is_buy
+    breakeven = located.breakeven if breakeven is None else np.full(len(trades), bool(breakeven))
+
+    pips_per_unit = 1 / pip_size
+    sl_pips = np.abs(stoploss - entry_price) * pips_per_unit
+    tp_pips = np.abs(takeprofit - entry_price) * pips_per_unit
+    three_r_pips = 3 * sl_pips
+    three_r_target = np.where(is_buy, entry_price + three_r_pips / pips_per_unit, entry_price - three_r_pips / pips_per_unit)
+
+    # Invalid trades get an empty search window
+    stops = np.where(valid, len(price_data), starts)
+    outcome, exit_index, trigger_index, three_r_outcome, three_r_index = find_trade_outcomes(
+        price_data.high, price_data.low, entry_price, stoploss, takeprofit, three_r_target, is_buy, breakeven,
+        starts, stops, tolerance, check_stoploss, extremes=price_data.hit_index, minutes=price_data.minutes,
+        intrabar=intrabar)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pnl_r = np.where(outcome == HIT_TP, tp_pips / sl_pips, -1.0)
+        three_r_pnl_r = np.select([three_r_outcome == HIT_THREE_R, three_r_outcome == HIT_BREAKEVEN],
+                                  [np.abs(three_r_target - entry_price) * pips_per_unit / sl_pips, 0.0], -1.0)
+    exit_minutes = price_data.minutes[np.maximum(exit_index, 0)] - entry_minutes
+
+    # Excursions while each system's trade was open: through its exit bar, or to the end of the data
+    mae, mfe, mfe_index = price_excursions(price_data, entry_price, is_buy, starts,
+                                           np.where(exit_index >= 0, exit_index + 1, stops), takeprofit, stoploss)
+    _, three_r_mfe, _ = price_excursions(price_data, entry_price, is_buy, starts,
+                                         np.where(three_r_index >= 0, three_r_index + 1, stops), three_r_target, stoploss)
+    mae_pips, mfe_pips, three_r_mfe_pips = mae * pips_per_unit, mfe * pips_per_unit, three_r_mfe * pips_per_unit
+    mfe_minutes = price_data.minutes[np.maximum(mfe_index, 0)] - entry_minutes
+    mfe_times = _times_at(price_data, mfe_index)
+    three_r_minutes = price_data.minutes[np.maximum(three_r_index, 0)] - entry_minutes
+
+    exit_times = _times_at(price_data, exit_index)
+    breakeven_times = _times_at(price_data, trigger_index)
+    three_r_times = _times_at(price_data, three_r_index)
+    entry_text = np.datetime_as_string(entry_minutes.astype('datetime64[m]')).tolist()
+
+    records = []
+    for i, trade in enumerate(trades):
+        record = {
+            'entry_time': entry_text[i],
+            'trade_type': trade['trade_type'],
+            'breakeven': bool(breakeven[i]),
+            'error': errors[i],
+        }
+        if errors[i] is None:
+            hit = int(outcome[i])
+            three_r_hit = int(three_r_outcome[i])
+            record.update({
+                'entry_price': float(entry_price[i]),
+                'stoploss_price': float(stoploss[i]),
+                'takeprofit_price': float(takeprofit[i]),
+                'stoploss_pips': float(sl_pips[i]),
+                'takeprofit_pips': float(tp_pips[i]),
+                'outcome': HIT_NAMES[hit],
+                'exit_time': exit_times[i],
+                'runtime_minutes': int(exit_minutes[i]) if hit else None,
+                'pnl_r': float(pnl_r[i]) if hit else None,
+                'three_r_target': float(three_r_target[i]),
+                'breakeven_time': breakeven_times[i],
+                'three_r_outcome': HIT_NAMES[three_r_hit],
+                'three_r_exit_time': three_r_times[i],
+                'three_r_runtime_minutes': int(three_r_minutes[i]) if three_r_hit else None,
+                'three_r_pnl_r': float(three_r_pnl_r[i]) if three_r_hit else None,
+                'mae_pips': float(mae_pips[i]),
+                'mfe_pips': float(mfe_pips[i]),
+                'mae_r': float(mae_pips[i] / sl_pips[i]),
+                'mfe_r': float(mfe_pips[i] / sl_pips[i]),
+                'mfe_time': mfe_times[i],
+                'minutes_to_mfe': int(mfe_minutes[i]) if mfe_index[i] >= 0 else None,
+                'three_r_mfe_r': float(three_r_mfe_pips[i] / sl_pips[i]),
+            })
+        records.append(record)
+    return records
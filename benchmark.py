@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from batch import parse_trades, resolve_trades
+from hit_search import find_trade_outcome
+from price_data import PriceData
+from price_store import convert_to_store, load_price_file, open_store
+
+# Default dataset sizes: a number followed by m (months) or y (years)
+DEFAULT_SIZES = ('1m', '1y', '5y', '20y')
+
+# Trades resolved by the batch benchmarks
+BATCH_SIZES = (1_000, 10_000)
+
+# First day of every synthetic series
+START_DATE = '2005-01-03'
+
+# Function to turn a size such as '6m' or '20y' into a number of months
+def parse_size(size):
+    size = size.strip().lower()
+    if len(size) < 2 or size[-1] not in 'my' or not size[:-1].isdigit():
+        raise ValueError(f"Invalid size: {size}. Use a number followed by m (months) or y (years), e.g. 6m or 20y.")
+    return int(size[:-1]) * (12 if size[-1] == 'y' else 1)
+
+# Function to generate a synthetic M1 OHLC series as a PriceData.
+# Bars cover every minute from Monday to Friday, and prices follow a seeded random walk
+# around 1800 with 3 decimals, so every run of the same size and seed sees the same data.
+def generate_prices(months, seed=1):
+    start = np.datetime64(START_DATE, 'm')
+    end = (pd.Timestamp(START_DATE) + pd.DateOffset(months=months)).to_datetime64().astype('datetime64[m]')
+    minutes = np.arange(start, end, dtype='datetime64[m]')
+    weekday = (minutes.astype('datetime64[D]').astype(np.int64) + 3) % 7
+    minutes = minutes[weekday < 5].astype(np.int64)
+
+    rng = np.random.default_rng(seed)
+    count = len(minutes)
+    close = np.round(1800 + rng.normal(0, 0.3, count).cumsum(), 3)
+    open_prices = np.concatenate([close[:1], close[:-1]])
+    high = np.round(np.maximum(open_prices, close) + rng.exponential(0.2, count), 3)
+    low = np.round(np.minimum(open_prices, close) - rng.exponential(0.2, count), 3)
+    price_data = PriceData(minutes, open_prices, high, low, close)
+    price_data.build_extremes()
+    return price_data
+
+# Function to write a PriceData as a parquet file in the layout of the real data files
+def write_parquet(price_data, path):
+    times = pd.Series(price_data.minutes.astype('datetime64[m]').astype('datetime64[ns]'))
+    pd.DataFrame({
+        'Local time': times.dt.strftime('%d.%m.%Y %H:%M:%S'),
+        'Open': price_data.open,
+        'High': price_data.high,
+        'Low': price_data.low,
+        'Close': price_data.close,
+        'Volume': 1.0,
+    }).to_parquet(path)
+
+# Function to time a call, returning (min, median) seconds over the repeats
+def time_call(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), statistics.median(timings)
+
+# Function to read the current resident set size of this process in bytes (Linux)
+def current_rss():
+    with open('/proc/self/statm') as handle:
+        return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+# Function to load a dataset the way the app would and report time and memory.
+# Runs in a fresh child process (see --cold-start), so nothing is already imported or cached.
+def cold_start_child(mode, path):
+    baseline = current_rss()
+    started = time.perf_counter()
+    price_data = open_store(path) if mode == 'store' else load_price_file(path)
+    seconds = time.perf_counter() - started
+    # Touch a bar near the end, as the first request would
+    price_data.locate(price_data.time_at(len(price_data) - 1))
+    print(json.dumps({
+        'seconds': seconds,
+        'rss_bytes': current_rss(),
+        'rss_added_bytes': current_rss() - baseline,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }))
+
+# Function to run a cold start in a child process and return its report
+def run_cold_start(mode, path):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--cold-start', mode, path],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+# Function to pick (trade type, SL, TP) for the single-trade benchmarks entered at bar `position`.
+# near: SL/TP 20 pips away. far: TP at the later extreme (the highest High or lowest Low after the
+# entry, whichever comes last), so it is first reached far away, with SL beyond the opposite extreme.
+# never: both levels outside the range of the later data.
+def single_trade_levels(price_data, position):
+    entry_price = float(price_data.close[position])
+    later_high = price_data.high[position + 1:]
+    later_low = price_data.low[position + 1:]
+    highest, lowest = float(later_high.max()), float(later_low.min())
+    if later_high.argmax() >= later_low.argmin():
+        far = ('buy', lowest - 1.0, highest)
+    else:
+        far = ('sell', highest + 1.0, lowest)
+    return {
+        'near': ('buy', entry_price - 2.0, entry_price + 2.0),
+        'far': far,
+        'never': ('buy', lowest - 1.0, highest + 1.0),
+    }
+
+# Function to run the in-process benchmarks for one dataset.
+# Returns one record per benchmark with min/median seconds and details.
+def run_dataset(price_data, repeat, seed=1):
+    rng = np.random.default_rng(seed)
+    records = []
+
+    def record(name, func, repeat=repeat, **details):
+        best, median = time_call(func, repeat)
+        records.append(dict({'benchmark': name, 'min_seconds': best, 'median_seconds': median,
+                             'repeat': repeat}, **details))
+
+    # Entry lookup: one timestamp at a time (as the form does) and many at once (as a batch does)
+    lookups = [price_data.time_at(int(position)) for position in rng.integers(0, len(price_data), 1000)]
+    record('entry_lookup', lambda: [price_data.locate(timestamp) for timestamp in lookups], calls=len(lookups))
+    minutes = price_data.minutes[rng.integers(0, len(price_data), 100_000)]
+    record('entry_lookup_many', lambda: price_data.locate_many(minutes), calls=len(minutes))
+
+    # Single trade, resolved like monitor_trade: SL/TP and the 3R system in one pass
+    position = len(price_data) // 100
+    entry_price = float(price_data.close[position])
+    for case, (trade_type, stoploss, takeprofit) in single_trade_levels(price_data, position).items():
+        three_r_target = entry_price + 3 * (entry_price - stoploss)
+
+        def resolve():
+            return find_trade_outcome(price_data.high, price_data.low, entry_price, stoploss, takeprofit,
+                                      three_r_target, trade_type, True, start=position + 1,
+                                      extremes=price_data.extremes)
+
+        _, hit_index, _, _, _ = resolve()
+        record(f'single_trade_{case}', resolve,
+               bars_to_exit=None if hit_index is None else hit_index - position)
+
+    # Batch resolution of random trades with SL/TP between 5 and 500 pips
+    for size in BATCH_SIZES:
+        positions = rng.integers(0, len(price_data) - 1, size)
+        trades = parse_trades([{
+            'entry_time': str(price_data.time_at(int(entry))),
+            'trade_type': 'buy' if is_buy else 'sell',
+            'stoploss_pips': float(stoploss_pips),
+            'takeprofit_pips': float(takeprofit_pips),
+            'breakeven': bool(breakeven),
+        } for entry, is_buy, stoploss_pips, takeprofit_pips, breakeven in zip(
+            positions, rng.integers(0, 2, size), rng.integers(5, 500, size), rng.integers(5, 500, size),
+            rng.integers(0, 2, size))])
+        record(f'batch_{size}', lambda: resolve_trades(price_data, trades), repeat=max(1, repeat // 2), trades=size)
+
+    # Memory held by the arrays and the forward-extremes index
+    records.append({
+        'benchmark': 'memory',
+        'series_bytes': sum(values.nbytes for values in (price_data.minutes, price_data.open, price_data.high,
+                                                         price_data.low, price_data.close)),
+        'extremes_bytes': price_data.extremes.high_max.nbytes + price_data.extremes.low_min.nbytes,
+    })
+    return records
+
+# Function to run the whole suite and return the JSON report
+def run_suite(sizes, repeat, workdir, seed=1, cold_start=True):
+    report = {'meta': environment_info(seed, repeat), 'results': []}
+    for size in sizes:
+        started = time.perf_counter()
+        price_data = generate_prices(parse_size(size), seed)
+        print(f"{size}: {len(price_data)} bars generated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        records = run_dataset(price_data, repeat, seed)
+
+        if cold_start:
+            parquet_path = os.path.join(workdir, f"bench_{size}_{seed}.parquet")
+            if not os.path.exists(parquet_path):
+                write_parquet(price_data, parquet_path)
+            started = time.perf_counter()
+            store_path = convert_to_store(parquet_path)
+            records.append({'benchmark': 'convert_to_store', 'seconds': time.perf_counter() - started})
+            for mode, path in (('parquet', parquet_path), ('store', store_path)):
+                records.append(dict({'benchmark': f'cold_start_{mode}'}, **run_cold_start(mode, path)))
+
+        for record in records:
+            report['results'].append(dict({'size': size, 'bars': len(price_data)}, **record))
+        print(f"{size}: done", file=sys.stderr)
+    return report
+
+# Function to describe the machine and code the benchmarks ran on
+def environment_info(seed, repeat):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'repeat': repeat,
+    }
+
+# Function to print the timing ratio of every benchmark found in two reports (new / old)
+def compare_reports(old_path, new_path):
+    with open(old_path) as handle:
+        old = json.load(handle)
+    with open(new_path) as handle:
+        new = json.load(handle)
+    old_results = {(result['size'], result['benchmark']): result for result in old['results']}
+    print(f"{'size':>6}  {'benchmark':<24}  {'old':>10}  {'new':>10}  {'ratio':>6}")
+    for result in new['results']:
+        previous = old_results.get((result['size'], result['benchmark']))
+        key = 'median_seconds' if 'median_seconds' in result else 'seconds'
+        if previous is None or key not in result or key not in previous:
+            continue
+        ratio = result[key] / previous[key] if previous[key] else float('nan')
+        print(f"{result['size']:>6}  {result['benchmark']:<24}  {previous[key]:>10.6f}  {result[key]:>10.6f}  {ratio:>6.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark data loading and trade resolution on synthetic M1 data.")
+    parser.add_argument('--sizes', nargs='+', default=list(DEFAULT_SIZES),
+                        help=f"dataset sizes, e.g. 1m 6m 1y 20y (default: {' '.join(DEFAULT_SIZES)})")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per benchmark (default: 5)")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for data and trades (default: 1)")
+    parser.add_argument('--workdir', help="directory for generated parquet files and stores (default: a temporary directory)")
+    parser.add_argument('--no-cold-start', action='store_true', help="skip the parquet/store loading benchmarks")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two JSON reports and exit")
+    parser.add_argument('--cold-start', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start:
+        cold_start_child(*args.cold_start)
+    elif args.compare:
+        compare_reports(*args.compare)
+    else:
+        try:
+            for size in args.sizes:
+                parse_size(size)
+        except ValueError as e:
+            parser.error(str(e))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            report = run_suite(args.sizes, args.repeat, args.workdir or temp_dir, args.seed, not args.no_cold_start)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as handle:
+                handle.write(text + "\n")
+        else:
+            print(text)
@@ -0,0 +1,114 @@
+import threading
+
+import numpy as np
+
+from forward_extremes import ForwardExtremes
+
+# Excursion columns added to each resolved trade record
+EXCURSION_FIELDS = ['mae_pips', 'mfe_pips', 'mae_r', 'mfe_r', 'mfe_time', 'minutes_to_mfe', 'three_r_mfe_r']
+
+# Width of the histogram bins in R, and the R from which everything falls in one overflow bin
+EXCURSION_BIN_R = 0.25
+EXCURSION_MAX_R = 10.0
+
+# Histograms kept per measure, with the record field that splits them by outcome (None for trades still open)
+HISTOGRAM_MEASURES = (('mae_r', 'outcome'), ('mfe_r', 'outcome'), ('three_r_mfe_r', 'three_r_outcome'))
+
+# Function to measure how far each trade moved against and for it while it was open.
+# The window of trade i is bars [starts[i], stops[i]) (through the exit bar, or to the end of the
+# data while open). Its highest High and lowest Low come from range queries over the forward-extremes
+# pyramid, and the first bar reaching the favorable extreme from its first-reach search, so no bar
+# is visited one by one. Excursions stop at favorable_limit and adverse_limit (the exit levels):
+# the exit bar may trade past them, but the trade was closed there.
+# Returns (adverse distances, favorable distances, first bar of the favorable extreme or -1), with
+# distances in price units, never negative, and NaN for empty windows.
+def price_excursions(price_data, entry_price, is_buy, starts, stops, favorable_limit, adverse_limit):
+    extremes = price_data.extremes
+    if extremes is None:
+        extremes = ForwardExtremes.build(price_data.high, price_data.low)
+    high = extremes.high_max_between(starts, stops)
+    low = extremes.low_min_between(starts, stops)
+    favorable_level = np.where(is_buy, np.minimum(high, favorable_limit), np.maximum(low, favorable_limit))
+    adverse_level = np.where(is_buy, np.maximum(low, adverse_limit), np.minimum(high, adverse_limit))
+    direction = np.where(is_buy, 1.0, -1.0)
+    favorable = np.maximum((favorable_level - entry_price) * direction, 0.0)
+    adverse = np.maximum((entry_price - adverse_level) * direction, 0.0)
+
+    # A trade that never moved in its favor has no MFE bar
+    favorable_index = np.full(len(favorable), -1, dtype=np.int64)
+    moved = favorable > 0
+    for side, search in ((is_buy, extremes.first_high_at_or_above), (~is_buy, extremes.first_low_at_or_below)):
+        chosen = np.flatnonzero(moved & side)
+        if chosen.size:
+            favorable_index[chosen] = search(favorable_level[chosen], np.asarray(starts)[chosen],
+                                             np.asarray(stops)[chosen])
+    return adverse, favorable, favorable_index
+
+# Function to measure the excursions of one trade whose window starts at bar start: before the SL/TP
+# exit at exit_index and before the 3R system exit at three_r_index (None while still open).
+# Returns (MAE pips, MFE pips, MFE bar or None, 3R system MFE pips).
+def trade_excursions(price_data, entry_price, stoploss_price, takeprofit_price, three_r_target, is_buy, start,
+                     exit_index, three_r_index, pip_size=0.1):
+    pips_per_unit = 1 / pip_size
+    entry, side, starts = np.array([entry_price]), np.array([is_buy]), np.array([start])
+    stop = len(price_data) if exit_index is None else exit_index + 1
+    mae, mfe, mfe_index = price_excursions(price_data, entry, side, starts, np.array([stop]),
+                                           np.array([takeprofit_price]), np.array([stoploss_price]))
+    stop = len(price_data) if three_r_index is None else three_r_index + 1
+    _, three_r_mfe, _ = price_excursions(price_data, entry, side, starts, np.array([stop]),
+                                         np.array([three_r_target]), np.array([stoploss_price]))
+    return (float(mae[0] * pips_per_unit), float(mfe[0] * pips_per_unit),
+            int(mfe_index[0]) if mfe_index[0] >= 0 else None, float(three_r_mfe[0] * pips_per_unit))
+
+# Running excursion histograms, aggregated over every batch added and kept per symbol.
+# Each measure (MAE and MFE of the SL/TP exits, MFE of the 3R system) is counted in R bins of
+# bin_r width, split by the trade's outcome, so SL/TP placement and the 3R/breakeven rules can be
+# tuned from how far winners went against them and how far losers went for them.
+class ExcursionHistograms:
+    def __init__(self, bin_r=EXCURSION_BIN_R, max_r=EXCURSION_MAX_R):
+        self.bin_r = bin_r
+        self.max_r = max_r
+        # Lower edges of the bins; the last bin holds everything from max_r up
+        self.edges = np.arange(0.0, max_r + bin_r / 2, bin_r)
+        self._counts = {}
+        self._trades = {}
+        self._lock = threading.Lock()
+
+    # Function to add resolved trade records (see batch.resolve_trades) to a symbol's histograms
+    def add(self, symbol, records):
+        counts = {}
+        for measure, split in HISTOGRAM_MEASURES:
+            groups = {}
+            for record in records:
+                if record.get(measure) is not None:
+                    groups.setdefault(record[split] or 'open', []).append(record[measure])
+            for group, values in groups.items():
+                bins = np.searchsorted(self.edges, np.asarray(values, dtype=np.float64), side='right') - 1
+                counts[(measure, group)] = np.bincount(bins, minlength=len(self.edges))
+        resolved = sum(1 for record in records if record.get('mae_r') is not None)
+        with self._lock:
+            totals = self._counts.setdefault(symbol, {})
+            for key, values in counts.items():
+                totals[key] = totals[key] + values if key in totals else values
+            self._trades[symbol] = self._trades.get(symbol, 0) + resolved
+
+    # Function to forget the histograms of one symbol, or of every symbol
+    def reset(self, symbol=None):
+        with self._lock:
+            for table in (self._counts, self._trades):
+                if symbol is None:
+                    table.clear()
+                else:
+                    table.pop(symbol, None)
+
+    # Function to describe the histograms as {'bin_r', 'edges', 'symbols': {symbol: {'trades', measure: {outcome: counts}}}}
+    def to_dict(self, symbol=None):
+        with self._lock:
+            names = [symbol] if symbol is not None else list(self._counts)
+            symbols = {}
+            for name in names:
+                histograms = {'trades': self._trades.get(name, 0)}
+                for (measure, group), values in sorted(self._counts.get(name, {}).items()):
+                    histograms.setdefault(measure, {})[group] = values.tolist()
+                symbols[name] = histograms
+        return {'bin_r': self.bin_r, 'edges': self.edges.tolist(), 'symbols': symbols}
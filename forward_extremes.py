@@ -0,0 +1,173 @@
+import os
+
+import numpy as np
+
+# Index over the High/Low series answering "first bar at or after i where High >= X"
+# and "first bar at or after i where Low <= Y" in O(log n) steps.
+# It keeps a pyramid of block extremes: level k holds max(High) and min(Low) over
+# aligned blocks of 2**k bars (level 0 is the series itself). A query climbs the
+# pyramid, skipping whole blocks that cannot reach the level, then descends into the
+# first block that can. The pyramid takes about as much memory as the series.
+class ForwardExtremes:
+    def __init__(self, high, low, high_max, low_min):
+        self.high = high
+        self.low = low
+        self.high_max = high_max
+        self.low_min = low_min
+        self.offsets = _level_offsets(len(high))
+
+    # Function to build the pyramids for a High/Low series
+    @classmethod
+    def build(cls, high, low):
+        return cls(high, low, _build_pyramid(high, np.fmax), _build_pyramid(low, np.fmin))
+
+    # Function to find, for each query, the first bar in [start, stop) whose High is >= level (-1 if none)
+    def first_high_at_or_above(self, levels, starts, stops):
+        return _first_reaching(self.high, self.high_max, self.offsets, np.greater_equal, levels, starts, stops)
+
+    # Function to find, for each query, the first bar in [start, stop) whose Low is <= level (-1 if none)
+    def first_low_at_or_below(self, levels, starts, stops):
+        return _first_reaching(self.low, self.low_min, self.offsets, np.less_equal, levels, starts, stops)
+
+    # Function to find, for each window [start, stop), its highest High (NaN for an empty window)
+    def high_max_between(self, starts, stops):
+        return _window_extreme(self.high, self.high_max, self.offsets, np.fmax, starts, stops)
+
+    # Function to find, for each window [start, stop), its lowest Low (NaN for an empty window)
+    def low_min_between(self, starts, stops):
+        return _window_extreme(self.low, self.low_min, self.offsets, np.fmin, starts, stops)
+
+    # Function to recompute the pyramid nodes covering bars [start, stop) after those bars changed.
+    # Only the blocks that contain the changed bars are touched, so appending a chunk costs
+    # O(chunk + log n). The high/low arrays must already hold the new values.
+    def update(self, start, stop):
+        if stop <= start:
+            return
+        self.high_max = _writable(self.high_max)
+        self.low_min = _writable(self.low_min)
+        for pyramid, values, reducer in ((self.high_max, self.high, np.fmax), (self.low_min, self.low, np.fmin)):
+            child = np.asarray(values, dtype=np.float64)
+            for level in range(1, len(self.offsets)):
+                offset = self.offsets[level - 1]
+                size = self.offsets[level] - offset
+                blocks = np.arange(start >> level, min((stop - 1) >> level, size - 1) + 1)
+                right = 2 * blocks + 1
+                right_values = np.where(right < len(child), child[np.minimum(right, len(child) - 1)], np.nan)
+                pyramid[offset + blocks] = reducer(child[2 * blocks], right_values)
+                child = pyramid[offset:offset + size]
+
+    # Function to write the pyramids into a directory (normally the price store)
+    def save(self, directory):
+        np.save(os.path.join(directory, "high_max.npy"), self.high_max)
+        np.save(os.path.join(directory, "low_min.npy"), self.low_min)
+
+    # Function to load saved pyramids for a High/Low series, or None if they are missing or stale
+    @classmethod
+    def load(cls, directory, high, low, mmap_mode='r'):
+        paths = [os.path.join(directory, name) for name in ("high_max.npy", "low_min.npy")]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        high_max, low_min = [np.load(path, mmap_mode=mmap_mode) for path in paths]
+        expected = _level_offsets(len(high))[-1]
+        if len(high_max) != expected or len(low_min) != expected:
+            return None
+        return cls(high, low, high_max, low_min)
+
+# Function to compute where each pyramid level starts in the flattened array.
+# Level k >= 1 has ceil(n / 2**k) blocks; offsets[k - 1] is its start and offsets[-1] the total length.
+def _level_offsets(count):
+    sizes = []
+    size = count
+    while size > 1:
+        size = (size + 1) // 2
+        sizes.append(size)
+    return np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]).astype(np.int64)
+
+# Function to get an in-memory writable copy of a (possibly memory-mapped, read-only) array
+def _writable(values):
+    if isinstance(values, np.memmap) or not values.flags.writeable:
+        return np.array(values)
+    return values
+
+# Function to build the flattened pyramid of block extremes with a NaN-ignoring reducer (np.fmax / np.fmin)
+def _build_pyramid(values, reducer):
+    levels = []
+    current = np.asarray(values, dtype=np.float64)
+    while len(current) > 1:
+        if len(current) % 2:
+            current = np.append(current, np.nan)
+        current = reducer(current[0::2], current[1::2])
+        levels.append(current)
+    if not levels:
+        return np.empty(0, dtype=np.float64)
+    return np.concatenate(levels)
+
+# Function to read the pyramid node at (level, block) for many queries; level 0 reads the series itself
+def _node_values(values, pyramid, offsets, level, position):
+    result = np.empty(len(level), dtype=np.float64)
+    base = level == 0
+    result[base] = values[position[base]]
+    upper = ~base
+    result[upper] = pyramid[offsets[level[upper] - 1] + (position[upper] >> level[upper])]
+    return result
+
+# Function to run the climb-then-descend search for many queries at once
+def _first_reaching(values, pyramid, offsets, condition, levels, starts, stops):
+    levels = np.asarray(levels, dtype=np.float64)
+    position = np.asarray(starts, dtype=np.int64).copy()
+    stops = np.minimum(np.asarray(stops, dtype=np.int64), len(values))
+    top = len(offsets) - 1
+    level = np.zeros(len(position), dtype=np.int64)
+    result = np.full(len(position), -1, dtype=np.int64)
+
+    # Climb: position is always aligned to 2**level, so each step tests one whole block
+    climbing = np.flatnonzero(position < stops)
+    found = []
+    while climbing.size:
+        hit = condition(_node_values(values, pyramid, offsets, level[climbing], position[climbing]), levels[climbing])
+        found.append(climbing[hit])
+        moving = climbing[~hit]
+        position[moving] += np.int64(1) << level[moving]
+        moving = moving[position[moving] < stops[moving]]
+        # Move up a level once the next block starts on a boundary of the level above
+        up = ((position[moving] >> level[moving]) & 1) == 0
+        up &= level[moving] < top
+        level[moving[up]] += 1
+        climbing = moving
+
+    # Descend: keep the left child if it reaches the level, otherwise move to the right child
+    descending = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+    descending = descending[level[descending] > 0]
+    while descending.size:
+        level[descending] -= 1
+        left = condition(_node_values(values, pyramid, offsets, level[descending], position[descending]),
+                         levels[descending])
+        right = descending[~left]
+        position[right] += np.int64(1) << level[right]
+        descending = descending[level[descending] > 0]
+
+    if found:
+        hits = np.concatenate(found)
+        hits = hits[position[hits] < stops[hits]]
+        result[hits] = position[hits]
+    return result
+
+# Function to reduce every window [start, stop) at once by covering it with aligned pyramid blocks:
+# each step takes the largest block that starts at the current position and fits in what is left
+# of the window, so a window of any length is covered in O(log n) steps.
+def _window_extreme(values, pyramid, offsets, reducer, starts, stops):
+    position = np.asarray(starts, dtype=np.int64).copy()
+    stops = np.minimum(np.asarray(stops, dtype=np.int64), len(values))
+    result = np.full(len(position), np.nan)
+    top = len(offsets) - 1
+    active = np.flatnonzero(position < stops)
+    while active.size:
+        at = position[active]
+        # Blocks of 2**k bars start at multiples of 2**k; position 0 starts a block of every level
+        aligned = np.where(at > 0, at & -at, np.int64(1) << top)
+        fits = np.int64(1) << np.floor(np.log2(stops[active] - at)).astype(np.int64)
+        level = np.minimum(np.log2(np.minimum(aligned, fits)).astype(np.int64), top)
+        result[active] = reducer(result[active], _node_values(values, pyramid, offsets, level, at))
+        position[active] = at + (np.int64(1) << level)
+        active = active[position[active] < stops[active]]
+    return result
@@ -0,0 +1,338 @@
+import numpy as np
+
+# Number of bars examined by the first chunk of a forward search. Each following
+# chunk doubles in size, so near hits stay cheap and far hits need few passes.
+INITIAL_CHUNK_SIZE = 1024
+
+# Upper bound on the number of (trade, bar) cells compared in one vectorized step
+MAX_CHUNK_CELLS = 1 << 22
+
+# Bars scanned directly before falling back to the forward-extremes index, when one is given.
+# Most levels are hit within this window, where a plain scan is cheaper than the index descent.
+NEAR_SCAN_BARS = INITIAL_CHUNK_SIZE
+
+# Outcome codes returned by the vectorized resolvers
+HIT_NONE = 0
+HIT_TP = 1
+HIT_SL = 2
+HIT_BREAKEVEN = 3
+HIT_THREE_R = 4
+
+HIT_NAMES = {HIT_NONE: None, HIT_TP: 'tp', HIT_SL: 'sl', HIT_BREAKEVEN: 'breakeven', HIT_THREE_R: '3r'}
+
+# Function to scan bars [start, stop) for many trades at once, watching several levels per trade.
+# Each search is (values, condition, levels) and matches the first bar where
+# condition(value, level) holds. A trade stops scanning after the chunk in which any
+# of its searches matched, so the cost follows the distance to its earliest event.
+# Returns one int64 array per search: the first matching bar, or -1 if that search did
+# not match before the trade stopped. Levels set to NaN never match.
+def first_events_many(searches, starts, stops):
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.minimum(np.asarray(stops, dtype=np.int64), min(len(values) for values, _, _ in searches))
+    searches = [(values, condition, np.asarray(levels, dtype=np.float64)) for values, condition, levels in searches]
+    results = [np.full(len(starts), -1, dtype=np.int64) for _ in searches]
+    position = starts.copy()
+    active = np.flatnonzero(position < stops)
+    chunk_size = INITIAL_CHUNK_SIZE
+    while active.size:
+        current = position[active]
+        limit = stops[active]
+        width = min(chunk_size, max(MAX_CHUNK_CELLS // (active.size * len(searches)), 1),
+                    int((limit - current).max()))
+        offsets = current[:, None] + np.arange(width)
+        inside = offsets < limit[:, None]
+        gather = np.where(inside, offsets, 0)
+        done = np.zeros(active.size, dtype=bool)
+        for (values, condition, levels), result in zip(searches, results):
+            mask = condition(values[gather], levels[active][:, None]) & inside
+            hit = mask.any(axis=1)
+            result[active[hit]] = current[hit] + mask[hit].argmax(axis=1)
+            done |= hit
+        position[active] = current + width
+        active = active[~done & (position[active] < limit)]
+        chunk_size *= 2
+    return results
+
+# Sides of an exit rule level. Favorable levels are reached on High for a Buy and on Low for a Sell;
+# adverse levels on Low for a Buy and on High for a Sell.
+FAVORABLE = 'favorable'
+ADVERSE = 'adverse'
+
+# One exit rule of a managed leg: a price level per trade and what happens when a bar reaches it.
+# outcome is the code reported when the rule closes the leg; fraction is the share of the leg it
+# closes (1 for rules with an outcome, 0 for pure triggers), so fraction < 1 is a partial close and
+# the leg stays open. enables/disables name rules of the same leg switched on or off when the rule
+# fires; a rule fires at most once. Levels set to NaN never fire, and active may be set per trade.
+class ExitRule:
+    def __init__(self, name, side, levels, outcome=HIT_NONE, fraction=None, enables=(), disables=(), active=True):
+        self.name = name
+        self.side = side
+        self.levels = levels
+        self.outcome = outcome
+        self.fraction = (1.0 if outcome != HIT_NONE else 0.0) if fraction is None else fraction
+        self.enables = tuple(enables)
+        self.disables = tuple(disables)
+        self.active = active
+
+# One position managed by exit rules. Within a bar the rules are checked in list order, so earlier
+# rules win ties; a rule switched on by an earlier rule is checked on the same bar, one switched on
+# by a later rule from the next bar. Trailing stops are chains of rules, e.g. a favorable rule at
+# +2R that disables the stop and enables a stop at +1R.
+class ManagedLeg:
+    def __init__(self, name, rules):
+        self.name = name
+        self.rules = list(rules)
+
+# Resolution of one leg for many trades: the outcome code and bar of the rule that closed it
+# (HIT_NONE and -1 while open), the bar each rule fired at by name (-1 if it never did), and the
+# fraction of the leg still open.
+class LegResult:
+    def __init__(self, outcome, index, fired, remaining):
+        self.outcome = outcome
+        self.index = index
+        self.fired = fired
+        self.remaining = remaining
+
+# Function to check, for each trade, whether the bar at `bars` reaches its level on the given side
+def _touches(high, low, levels, side, is_buy, bars, tolerance):
+    upward = is_buy == (side == FAVORABLE)
+    return np.where(upward, high[bars] >= levels - tolerance, low[bars] <= levels + tolerance)
+
+# Function to find, for each trade, the first bar in [start, stop) that reaches any of its levels.
+# levels[k] is watched on sides[k]; NaN levels are not watched. Returns -1 where none is reached.
+# Only the nearest level on each side of the price matters, so however many levels are watched
+# the scan compares High against the lowest level above and Low against the highest level below.
+# With a ForwardExtremes index, trades still open after NEAR_SCAN_BARS are finished
+# with O(log n) index queries instead of scanning on.
+def _first_touch(high, low, levels, sides, is_buy, starts, stops, tolerance, extremes=None):
+    above = np.full(len(is_buy), np.nan)
+    below = np.full(len(is_buy), np.nan)
+    for level, side in zip(levels, sides):
+        upward = is_buy == (side == FAVORABLE)
+        above = np.where(upward, np.fmin(above, level - tolerance), above)
+        below = np.where(upward, below, np.fmax(below, level + tolerance))
+
+    near_stops = stops if extremes is None else np.minimum(stops, starts + NEAR_SCAN_BARS)
+    high_index, low_index = first_events_many([(high, np.greater_equal, above), (low, np.less_equal, below)],
+                                              starts, near_stops)
+    if extremes is not None:
+        far = np.flatnonzero((high_index < 0) & (low_index < 0) & (near_stops < stops))
+        up = far[~np.isnan(above[far])]
+        high_index[up] = extremes.first_high_at_or_above(above[up], near_stops[up], stops[up])
+        down = far[~np.isnan(below[far])]
+        low_index[down] = extremes.first_low_at_or_below(below[down], near_stops[down], stops[down])
+    return np.where((high_index >= 0) & ((low_index < 0) | (high_index <= low_index)), high_index, low_index)
+
+# Exit rule state of many trades, advanced over bars that may arrive in pieces.
+# Every step scans from each trade's position to the first bar reaching any level its open legs
+# watch, then applies the rules of all legs on that bar and continues from the next one, so the
+# bars after the entry are scanned once however many rules and legs are managed. The state carries
+# over between advance() calls, so a history read chunk by chunk resolves exactly like one array.
+# An M1 bar only tells which levels were reached, not in which order, so a bar reaching several
+# levels (e.g. SL and TP) is settled by the rule order. Given an intrabar source (see tick_store.py)
+# such bars are instead replayed over their ticks, and the rules fire in the order the price
+# actually reached the levels; bars without ticks keep the rule order.
+class TradeManager:
+    def __init__(self, legs, is_buy, tolerance=0.1):
+        self.legs = list(legs)
+        self.is_buy = np.asarray(is_buy, dtype=bool)
+        count = len(self.is_buy)
+        self.tolerance, = _trade_arrays(count, tolerance)
+
+        self.rules = [(number, rule) for number, leg in enumerate(self.legs) for rule in leg.rules]
+        self.rule_number = {(number, rule.name): i for i, (number, rule) in enumerate(self.rules)}
+        self.rule_leg = np.array([number for number, _ in self.rules], dtype=np.int64)
+        self.levels = [_trade_arrays(count, rule.levels)[0] for _, rule in self.rules]
+        self.sides = [rule.side for _, rule in self.rules]
+        self.active = np.array([np.broadcast_to(np.asarray(rule.active, dtype=bool), (count,)) for _, rule in self.rules])
+        self.fired = np.full((len(self.rules), count), -1, dtype=np.int64)
+        self.remaining = np.ones((len(self.legs), count))
+        self.leg_open = np.ones((len(self.legs), count), dtype=bool)
+        self.outcome = np.full((len(self.legs), count), HIT_NONE, dtype=np.int64)
+        self.index = np.full((len(self.legs), count), -1, dtype=np.int64)
+        # Rules that switch each rule on, for telling which levels a bar could still reach
+        self.enablers = [[self.rule_number[number, other.name] for other in self.legs[number].rules if rule.name in other.enables]
+                         for number, rule in self.rules]
+        # Ambiguous bars replayed over ticks, and those left to the rule order for lack of ticks
+        self.intrabar_bars = 0
+        self.intrabar_missing = 0
+
+    # Function to run the rules over bars [start, stop) of high/low for each trade.
+    # offset is the position of high[0] in the whole series; it is added to the bars recorded.
+    # intrabar is an optional source of tick prices by epoch minute (TickStore.path), with minutes
+    # the epoch minute of each bar of high/low; it settles bars that reach several levels.
+    def advance(self, high, low, starts, stops, extremes=None, offset=0, minutes=None, intrabar=None):
+        self._scan(high, low, np.arange(len(self.is_buy)), starts, stops, extremes, offset, minutes, intrabar)
+
+    # Function to scan bars for a subset of trades, applying the rules at each bar where a level is reached.
+    # Events are recorded at bar + offset, or at the fixed bar `at` when replaying the ticks of one bar.
+    def _scan(self, high, low, trades, starts, stops, extremes=None, offset=0, minutes=None, intrabar=None, at=None):
+        active, leg_open = self.active, self.leg_open
+        position = np.asarray(starts, dtype=np.int64).copy()
+        stops = np.minimum(np.asarray(stops, dtype=np.int64), len(high))
+        pending = np.flatnonzero(position < stops)
+        while pending.size:
+            ids = trades[pending]
+            watching = active[:, ids] & leg_open[self.rule_leg][:, ids]
+            keep = watching.any(axis=0)
+            pending, ids, watching = pending[keep], ids[keep], watching[:, keep]
+            bar = _first_touch(high, low, [np.where(watching[i], self.levels[i][ids], np.nan) for i in range(len(self.rules))],
+                               self.sides, self.is_buy[ids], position[pending], stops[pending], self.tolerance[ids], extremes)
+            found = bar >= 0
+            pending, ids, bar = pending[found], ids[found], bar[found]
+
+            by_bar = np.ones(len(ids), dtype=bool)
+            if intrabar is not None:
+                # In time order, so consecutive bars share the tick data the source has loaded
+                ambiguous = np.flatnonzero(self._ambiguous(high, low, ids, bar))
+                for k in ambiguous[np.argsort(bar[ambiguous], kind='stable')]:
+                    prices = intrabar(int(minutes[bar[k]]))
+                    if not len(prices):
+                        self.intrabar_missing += 1
+                        continue
+                    self.intrabar_bars += 1
+                    by_bar[k] = False
+                    self._scan(prices, prices, ids[k:k + 1], [0], [len(prices)], at=bar[k] + offset)
+            recorded = bar + offset if at is None else np.full(len(bar), at, dtype=np.int64)
+            self._apply(high, low, ids[by_bar], bar[by_bar], recorded[by_bar])
+
+            position[pending] = bar + 1
+            pending = pending[position[pending] < stops[pending]]
+
+    # Function to apply the rules of all legs on one bar per trade, in order; rules enabled along
+    # the way are checked when their turn comes. Events are recorded at the `recorded` bars.
+    def _apply(self, high, low, trades, bar, recorded):
+        active, leg_open, is_buy, tolerance = self.active, self.leg_open, self.is_buy, self.tolerance
+        for i, (number, rule) in enumerate(self.rules):
+            live = active[i, trades] & leg_open[number, trades]
+            touched = live & _touches(high, low, self.levels[i][trades], rule.side, is_buy[trades], bar, tolerance[trades])
+            hit, at = trades[touched], recorded[touched]
+            if not hit.size:
+                continue
+            self.fired[i, hit] = at
+            active[i, hit] = False
+            for name in rule.enables:
+                active[self.rule_number[number, name], hit] = True
+            for name in rule.disables:
+                active[self.rule_number[number, name], hit] = False
+            if rule.fraction:
+                self.remaining[number, hit] -= rule.fraction
+                closed = self.remaining[number, hit] <= 1e-9
+                leg_open[number, hit[closed]] = False
+                self.outcome[number, hit[closed]] = rule.outcome
+                self.index[number, hit[closed]] = at[closed]
+
+    # Function to flag trades whose bar reaches two or more levels of one open leg, counting active
+    # rules and the rules an active one would switch on; only then does the order of the touches
+    # inside the bar change the outcome
+    def _ambiguous(self, high, low, trades, bar):
+        touches = np.zeros((len(self.legs), len(trades)), dtype=np.int64)
+        for i, (number, rule) in enumerate(self.rules):
+            armed = self.active[i, trades].copy()
+            for enabler in self.enablers[i]:
+                armed |= self.active[enabler, trades]
+            touches[number] += armed & self.leg_open[number, trades] & _touches(
+                high, low, self.levels[i][trades], rule.side, self.is_buy[trades], bar, self.tolerance[trades])
+        return (touches > 1).any(axis=0)
+
+    # Function to tell, for each trade, whether an open leg still watches a level (more bars can change it)
+    def watching(self):
+        live = self.active & self.leg_open[self.rule_leg] & ~np.isnan(np.array(self.levels))
+        return live.any(axis=0) if len(self.rules) else np.zeros(len(self.is_buy), dtype=bool)
+
+    # Function to get one LegResult per leg
+    def results(self):
+        results = []
+        for number, leg in enumerate(self.legs):
+            rule_fired = {rule.name: self.fired[self.rule_number[number, rule.name]] for rule in leg.rules}
+            results.append(LegResult(self.outcome[number], self.index[number], rule_fired,
+                                     np.maximum(self.remaining[number], 0.0)))
+        return results
+
+# Function to run the exit rules of several legs for many trades in one pass over the bars (see TradeManager).
+# starts/stops bound the bars each trade may look at; extremes is an optional ForwardExtremes
+# index over the same high/low arrays, and minutes/intrabar settle ambiguous bars from ticks.
+# Returns one LegResult per leg.
+def manage_trades(high, low, legs, is_buy, starts, stops, tolerance=0.1, extremes=None, minutes=None, intrabar=None):
+    manager = TradeManager(legs, is_buy, tolerance)
+    manager.advance(high, low, starts, stops, extremes, minutes=minutes, intrabar=intrabar)
+    return manager.results()
+
+# Function to broadcast the per-trade inputs of the vectorized resolvers to arrays
+def _trade_arrays(count, *values):
+    return [np.broadcast_to(np.asarray(value, dtype=np.float64), (count,)) for value in values]
+
+# Function to build the plain SL/TP leg. TP is checked before SL within a bar, so a bar touching both counts as TP.
+def sl_tp_leg(stoploss, takeprofit):
+    return ManagedLeg('sl_tp', [ExitRule('tp', FAVORABLE, takeprofit, HIT_TP),
+                                ExitRule('sl', ADVERSE, stoploss, HIT_SL)])
+
+# Function to build the 3R system leg. Within a bar the rules are applied in order: SL (when
+# check_stoploss is set), breakeven trigger, breakeven exit, 3R target. With breakeven the trigger
+# sits 1R from the entry and arms the breakeven exit. The target is watched from the start either
+# way, so a target nearer than 1R (e.g. a sweep cell with rr < 1) is still taken before the trigger.
+# After the trigger the SL still wins a bar that also reaches it.
+def three_r_leg(entry_price, stoploss, three_r_target, is_buy, breakeven, check_stoploss=True):
+    entry_price = np.asarray(entry_price, dtype=np.float64)
+    stoploss = np.asarray(stoploss, dtype=np.float64)
+    breakeven = np.asarray(breakeven, dtype=bool)
+    sl_pips = np.abs(stoploss - entry_price) * 10
+    breakeven_level = np.where(is_buy, entry_price + sl_pips / 10, entry_price - sl_pips / 10)
+    return ManagedLeg('three_r', [
+        ExitRule('sl', ADVERSE, stoploss if check_stoploss else np.nan, HIT_SL),
+        ExitRule('trigger', FAVORABLE, np.where(breakeven, breakeven_level, np.nan), enables=('breakeven',)),
+        ExitRule('breakeven', ADVERSE, entry_price, HIT_BREAKEVEN, active=False),
+        ExitRule('3r', FAVORABLE, three_r_target, HIT_THREE_R),
+    ])
+
+# Function to find the 3R system outcome for many trades (rules as in three_r_leg).
+# Returns (breakeven trigger indices, outcome codes, bar indices), with -1 for missing indices.
+def find_three_r_hits(high, low, entry_price, stoploss, three_r_target, is_buy, breakeven,
+                      starts, stops, tolerance=0.1, check_stoploss=True, extremes=None):
+    is_buy = np.asarray(is_buy, dtype=bool)
+    result, = manage_trades(high, low, [three_r_leg(entry_price, stoploss, three_r_target, is_buy, breakeven,
+                                                    check_stoploss)],
+                            is_buy, starts, stops, tolerance, extremes)
+    return result.fired['trigger'], result.outcome, result.index
+
+# Function to set up a TradeManager for the SL/TP leg and the 3R system leg of many trades
+def trade_outcome_manager(entry_price, stoploss, takeprofit, three_r_target, is_buy, breakeven, tolerance=0.1,
+                          check_stoploss=True):
+    is_buy = np.asarray(is_buy, dtype=bool)
+    return TradeManager([sl_tp_leg(stoploss, takeprofit),
+                         three_r_leg(entry_price, stoploss, three_r_target, is_buy, breakeven, check_stoploss)],
+                        is_buy, tolerance)
+
+# Function to read the outcomes of a trade_outcome_manager.
+# Returns (SL/TP outcome codes, SL/TP bar indices, breakeven trigger indices, 3R outcome codes, 3R bar indices).
+def trade_outcome_results(manager):
+    sl_tp, three_r = manager.results()
+    return sl_tp.outcome, sl_tp.index, three_r.fired['trigger'], three_r.outcome, three_r.index
+
+# Function to resolve the SL/TP and the 3R system outcomes of many trades together in one pass.
+# Returns (SL/TP outcome codes, SL/TP bar indices, breakeven trigger indices, 3R outcome codes, 3R bar indices).
+def find_trade_outcomes(high, low, entry_price, stoploss, takeprofit, three_r_target, is_buy, breakeven,
+                        starts, stops, tolerance=0.1, check_stoploss=True, extremes=None, minutes=None, intrabar=None):
+    manager = trade_outcome_manager(entry_price, stoploss, takeprofit, three_r_target, is_buy, breakeven,
+                                    tolerance, check_stoploss)
+    manager.advance(high, low, starts, stops, extremes, minutes=minutes, intrabar=intrabar)
+    return trade_outcome_results(manager)
+
+# Function to describe the first trade of find_trade_outcomes-style results by names and optional indices
+def first_trade_outcome(hit, hit_index, trigger_index, outcome, index):
+    return (HIT_NAMES[int(hit[0])], _optional_index(hit_index[0]), _optional_index(trigger_index[0]),
+            HIT_NAMES[int(outcome[0])], _optional_index(index[0]))
+
+# Function to resolve the SL/TP and the 3R system outcomes of one trade at or after bar start, in one pass.
+# minutes/intrabar optionally settle bars reaching several levels from ticks (see TradeManager).
+# Returns ('tp' | 'sl' | None, bar index or None, breakeven trigger index or None,
+#          'sl' | 'breakeven' | '3r' | None, bar index or None).
+def find_trade_outcome(high, low, entry_price, stoploss_price, takeprofit_price, three_r_target, trade_type,
+                       breakeven, tolerance=0.1, check_stoploss=True, start=0, extremes=None, minutes=None, intrabar=None):
+    return first_trade_outcome(*find_trade_outcomes(
+        high, low, entry_price, stoploss_price, takeprofit_price, three_r_target, [trade_type.lower() == 'buy'],
+        breakeven, [start], [len(high)], tolerance, check_stoploss, extremes, minutes, intrabar))
+
+# Function to turn a -1 sentinel index into None
+def _optional_index(index):
+    return None if index < 0 else int(index)
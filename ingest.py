@@ -0,0 +1,170 @@
+import argparse
+import os
+import threading
+
+import numpy as np
+
+from forward_extremes import ForwardExtremes
+from price_data import PriceData, from_epoch_minutes
+from price_store import load_price_file, open_store, read_price_frame, write_store
+
+# File extensions picked up from an ingest directory
+CHUNK_SUFFIXES = ('.csv', '.parquet')
+
+# Bars reserved when the buffers are first created or grown, on top of what is needed
+MIN_SPARE_BARS = 1 << 16
+
+# Function to read a CSV or parquet chunk of new M1 bars.
+# Returns (epoch minutes, open, high, low, close) in file order; ordering is checked on append.
+def read_bars(source, file_format=None):
+    df = read_price_frame(source, file_format)
+    minutes = df['Local time'].to_numpy().astype('datetime64[m]').astype(np.int64)
+    return (minutes,) + tuple(df[name].to_numpy(dtype=np.float64) for name in ('Open', 'High', 'Low', 'Close'))
+
+# Function to check that a chunk continues a series: strictly increasing minutes, all after last_minute
+def validate_bars(minutes, last_minute=None):
+    if len(minutes) > 1:
+        steps = np.diff(minutes)
+        if np.any(steps == 0):
+            duplicate = minutes[1:][steps == 0][0]
+            raise ValueError(f"Duplicate bar at {from_epoch_minutes(duplicate)}.")
+        if np.any(steps < 0):
+            position = int(np.flatnonzero(steps < 0)[0]) + 1
+            raise ValueError(f"Bars are not in time order: {from_epoch_minutes(minutes[position])} "
+                             f"follows {from_epoch_minutes(minutes[position - 1])}.")
+    if len(minutes) and last_minute is not None and minutes[0] <= last_minute:
+        raise ValueError(f"First new bar {from_epoch_minutes(minutes[0])} is not after the last loaded bar "
+                         f"{from_epoch_minutes(last_minute)}.")
+
+# Price data that grows as new bars arrive.
+# Bars live in buffers with spare capacity, so an append writes past the end and updates only
+# the forward-extremes blocks it touches. Each append publishes a new PriceData snapshot made
+# of views over the buffers; requests keep the snapshot they started with, and bars below its
+# length never change, so appends never block or disturb in-flight requests.
+class LiveDataset:
+    def __init__(self, price_data, on_update=None):
+        self.on_update = on_update
+        self._lock = threading.Lock()
+        self._seen_files = set()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        self._allocate(price_data, len(price_data) + MIN_SPARE_BARS)
+
+    # Function to get the latest snapshot
+    @property
+    def price_data(self):
+        return self._snapshot
+
+    # Bytes held by the buffers and the extremes index
+    @property
+    def nbytes(self):
+        return (sum(buffer.nbytes for buffer in self._buffers())
+                + self._extremes.high_max.nbytes + self._extremes.low_min.nbytes)
+
+    # Function to append bars after the last loaded bar. Returns the number of bars added.
+    def append(self, minutes, open_prices, high, low, close):
+        minutes = np.asarray(minutes, dtype=np.int64)
+        with self._lock:
+            count = len(self._snapshot)
+            validate_bars(minutes, int(self._minutes[count - 1]) if count else None)
+            if not len(minutes):
+                return 0
+            total = count + len(minutes)
+            if total > len(self._minutes):
+                # Grow into new buffers; snapshots already handed out keep the old ones
+                self._allocate(self._snapshot, max(2 * len(self._minutes), total + MIN_SPARE_BARS))
+            for buffer, values in zip(self._buffers(), (minutes, open_prices, high, low, close)):
+                buffer[count:total] = values
+            self._extremes.update(count, total)
+            self._publish(total)
+            snapshot = self._snapshot
+        if self.on_update is not None:
+            self.on_update(snapshot)
+        return len(minutes)
+
+    # Function to append the bars of a CSV or parquet chunk (path or file object)
+    def append_file(self, source, file_format=None):
+        return self.append(*read_bars(source, file_format))
+
+    # Function to append every chunk file in a directory not applied yet, in file name order.
+    # Chunk files are expected to be named so that name order is time order (e.g. by date).
+    def sync_directory(self, directory):
+        added = 0
+        for file_name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, file_name)
+            if not file_name.lower().endswith(CHUNK_SUFFIXES) or path in self._seen_files:
+                continue
+            self._seen_files.add(path)
+            try:
+                added += self.append_file(path)
+            except ValueError as e:
+                print(f"Skipped price chunk {path}: {e}")
+        return added
+
+    # Function to record a chunk file as applied, so sync_directory skips it
+    def mark_applied(self, path):
+        self._seen_files.add(path)
+
+    # Function to poll a directory for new chunk files in a background thread
+    def watch_directory(self, directory, interval=5.0):
+        if self._watcher is not None:
+            return
+        self.sync_directory(directory)
+
+        def poll():
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.sync_directory(directory)
+                except OSError as e:
+                    print(f"Error reading price chunks from {directory}: {e}")
+
+        self._watcher = threading.Thread(target=poll, name="price-ingest", daemon=True)
+        self._watcher.start()
+
+    # Function to stop the background watcher
+    def stop(self):
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    # Function to copy the current bars into fresh buffers with room for `capacity` bars.
+    # The price tails are NaN, which never reach a level, so the extremes index can be built
+    # over the whole buffer once and then updated block by block.
+    def _allocate(self, price_data, capacity):
+        count = len(price_data)
+        self._minutes = np.zeros(capacity, dtype=np.int64)
+        self._minutes[:count] = price_data.minutes
+        self._open, self._high, self._low, self._close = [np.full(capacity, np.nan) for _ in range(4)]
+        for buffer, values in zip(self._buffers()[1:], (price_data.open, price_data.high, price_data.low,
+                                                         price_data.close)):
+            buffer[:count] = values
+        self._extremes = ForwardExtremes.build(self._high, self._low)
+        self._publish(count)
+
+    # Function to list the buffers in PriceData column order
+    def _buffers(self):
+        return self._minutes, self._open, self._high, self._low, self._close
+
+    # Function to publish a snapshot over the first `count` bars
+    def _publish(self, count):
+        self._snapshot = PriceData(*(buffer[:count] for buffer in self._buffers()), extremes=self._extremes)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Append chunks of new M1 bars to a price file or store.")
+    parser.add_argument('data', help="price store directory, or a parquet/CSV file")
+    parser.add_argument('chunks', nargs='+', help="CSV or parquet chunks of new M1 bars, in time order")
+    parser.add_argument('--output', help="store directory to write the extended data to (default: only validate)")
+    args = parser.parse_args()
+
+    live = LiveDataset(open_store(args.data) if os.path.isdir(args.data) else load_price_file(args.data))
+    for chunk in args.chunks:
+        try:
+            print(f"{chunk}: {live.append_file(chunk)} bars")
+        except ValueError as e:
+            parser.exit(1, f"{chunk}: {e}\n")
+    price_data = live.price_data
+    print(f"{len(price_data)} bars up to {price_data.time_at(-1)}")
+    if args.output:
+        write_store(price_data, args.output, source=os.path.basename(args.data))
+        print(f"Wrote price store: {args.output}")
@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Job states reported by /jobs/<id>
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+# Raised inside a job's work function when the job was cancelled
+class JobCancelled(Exception):
+    pass
+
+# One submitted unit of work with its status, progress and result
+class Job:
+    def __init__(self, kind, total=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = JOB_QUEUED
+        self.completed = 0
+        self.total = total
+        self.result = None
+        # Size of the result as JSON, counted against the queue's budget for finished results
+        self.result_bytes = 0
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+
+    # Function to record progress; raises JobCancelled so the work stops at the next checkpoint
+    def report(self, completed, total=None):
+        self.completed = completed
+        if total is not None:
+            self.total = total
+        self.check_cancelled()
+
+    # Function to stop the work if the job was cancelled
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    # Function to describe the job as a JSON-serializable dict
+    def to_dict(self, include_result=True):
+        info = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': {
+                'completed': self.completed,
+                'total': self.total,
+                'fraction': self.completed / self.total if self.total else None,
+            },
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'error': self.error,
+        }
+        if include_result and self.status == JOB_DONE:
+            info['result'] = self.result
+        return info
+
+# Background job runner with bounded concurrency.
+# At most max_workers jobs run at once on a thread pool (NumPy releases the GIL in the scans,
+# so request threads stay responsive); at most max_pending jobs may wait or run, further
+# submissions are refused. Finished jobs are kept for polling, the oldest dropped past keep_finished
+# or once their results take more than max_result_bytes as JSON; a result larger than that on its
+# own is not kept, and its job fails.
+class JobQueue:
+    def __init__(self, max_workers=2, max_pending=100, keep_finished=50, max_result_bytes=64 * 2**20):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self.max_result_bytes = max_result_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backtest-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Function to submit work(job) as a new job. Returns the Job, or None when the queue is full.
+    # work receives the Job so it can call job.report() between steps; its return value is the result.
+    def submit(self, kind, work, total=None):
+        job = Job(kind, total)
+        with self._lock:
+            if self._pending_count() >= self.max_pending:
+                return None
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, work)
+        return job
+
+    # Function to look up a job by id (None if unknown or already dropped)
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    # Function to cancel a job. A queued job never starts; a running job stops at its next progress report.
+    # Returns the job, or None if unknown.
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status not in FINISHED_STATES:
+                job._cancel.set()
+                if job.status == JOB_QUEUED:
+                    job.status = JOB_CANCELLED
+                    job.finished = time.time()
+            return job
+
+    # Function to count jobs per state
+    def stats(self):
+        with self._lock:
+            counts = {state: 0 for state in (JOB_QUEUED, JOB_RUNNING) + FINISHED_STATES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            result_bytes = sum(job.result_bytes for job in self._jobs.values())
+        return dict(counts, max_workers=self.max_workers, max_pending=self.max_pending, result_bytes=result_bytes,
+                    max_result_bytes=self.max_result_bytes)
+
+    # Function to shut the worker threads down, cancelling whatever is still queued or running
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                job._cancel.set()
+        self._executor.shutdown(wait=True)
+
+    # Function to run one job on a worker thread
+    def _run(self, job, work):
+        with self._lock:
+            if job.cancel_requested:
+                return
+            job.status = JOB_RUNNING
+            job.started = time.time()
+        try:
+            result = work(job)
+        except JobCancelled:
+            status, result, error = JOB_CANCELLED, None, None
+        except Exception as e:
+            status, result, error = JOB_FAILED, None, f"{type(e).__name__}: {e}"
+        else:
+            status, error = JOB_DONE, None
+        result_bytes = len(json.dumps(result, default=str)) if status == JOB_DONE else 0
+        if result_bytes > self.max_result_bytes:
+            status, result, error = JOB_FAILED, None, (f"Result of {result_bytes / 2**20:.1f} MB exceeds the "
+                                                       f"{self.max_result_bytes / 2**20:.1f} MB kept for finished jobs.")
+            result_bytes = 0
+        with self._lock:
+            job.result = result
+            job.result_bytes = result_bytes
+            job.error = error
+            job.status = status
+            job.finished = time.time()
+            self._prune()
+
+    # Function to count jobs that are queued or running
+    def _pending_count(self):
+        return sum(job.status not in FINISHED_STATES for job in self._jobs.values())
+
+    # Function to drop the oldest finished jobs past keep_finished, then while the finished results
+    # take more than max_result_bytes
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[job_id]
+        finished = finished[max(len(finished) - self.keep_finished, 0):]
+        result_bytes = sum(self._jobs[job_id].result_bytes for job_id in finished)
+        while finished and result_bytes > self.max_result_bytes:
+            result_bytes -= self._jobs.pop(finished.pop(0)).result_bytes
@@ -0,0 +1,141 @@
+import os
+import resource
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage timings of one request, in the order the stages first ran.
+# Stages may nest; time spent in a nested stage is not counted in the enclosing one,
+# so the stages add up to at most the request's total time.
+class StageTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = OrderedDict()
+        self._running = []
+        self._mark = self.started
+
+    # Function to time a block as a named stage; repeated stages add up
+    @contextmanager
+    def stage(self, name):
+        self._charge()
+        self._running.append(name)
+        self.stages.setdefault(name, 0.0)
+        try:
+            yield
+        finally:
+            self._charge()
+            self._running.pop()
+
+    # Function to add the time since the last mark to the innermost running stage
+    def _charge(self):
+        now = time.perf_counter()
+        if self._running:
+            self.stages[self._running[-1]] += now - self._mark
+        self._mark = now
+
+    # Function to get the seconds since the request started
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    # Function to format the stages as a Server-Timing header value (durations in milliseconds)
+    def server_timing(self):
+        entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.3f}")
+        return ", ".join(entries)
+
+# In-process counters and histograms rendered in the Prometheus text format.
+# Values that already live elsewhere (cache stats, memory, loaded datasets) are read at scrape
+# time from collector functions, which return (name, type, help, [(labels, value), ...]) tuples.
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._help = OrderedDict()
+        self._counters = OrderedDict()
+        self._histograms = OrderedDict()
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    # Function to declare a metric's type and help text
+    def describe(self, name, metric_type, help_text):
+        self._help[name] = (metric_type, help_text)
+
+    # Function to add to a counter
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # Function to record one observation in a histogram
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    # Function to add a collector called at every scrape
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    # Function to render every metric in the Prometheus text exposition format
+    def render(self):
+        samples = OrderedDict()
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                samples.setdefault(name, []).append((name, labels, value))
+            for (name, labels), (counts, total, count) in self._histograms.items():
+                lines = samples.setdefault(name, [])
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append((f"{name}_bucket", labels + (('le', _format_value(bound)),), bucket_count))
+                lines.append((f"{name}_bucket", labels + (('le', '+Inf'),), count))
+                lines.append((f"{name}_sum", labels, total))
+                lines.append((f"{name}_count", labels, count))
+        help_texts = OrderedDict(self._help)
+        for collector in self._collectors:
+            for name, metric_type, help_text, values in collector():
+                help_texts[name] = (metric_type, help_text)
+                samples[name] = [(name, tuple(sorted(labels.items())), value) for labels, value in values]
+
+        output = []
+        for name, lines in samples.items():
+            if name in help_texts:
+                metric_type, help_text = help_texts[name]
+                output.append(f"# HELP {name} {help_text}")
+                output.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in lines:
+                output.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(output) + "\n"
+
+# Function to read the resident set size of this process in bytes (peak RSS where /proc is missing)
+def resident_memory_bytes():
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Function to format label pairs as {name="value",...}
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+# Function to format a sample value
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value)) if value else "0"
+    return repr(value) if isinstance(value, float) else str(value)
@@ -0,0 +1,296 @@
+import csv
+import io
+import json
+
+import numpy as np
+
+from excursions import EXCURSION_FIELDS
+from price_data import from_epoch_minutes
+
+# Columns of an exported trade record, shared by single-trade outcomes and batch results
+RECORD_FIELDS = [
+    'entry_time', 'trade_type', 'breakeven', 'error', 'entry_price', 'stoploss_price', 'takeprofit_price',
+    'stoploss_pips', 'takeprofit_pips', 'outcome', 'exit_time', 'runtime_minutes', 'pnl_r', 'three_r_target',
+    'breakeven_time', 'three_r_outcome', 'three_r_exit_time', 'three_r_runtime_minutes', 'three_r_pnl_r',
+] + EXCURSION_FIELDS
+
+# Function to format a runtime given in minutes, e.g. "1D 2H 5Min"
+def format_runtime_minutes(minutes):
+    days, remainder = divmod(int(minutes), 1440)
+    hours, minutes = divmod(remainder, 60)
+    formatted_runtime = ""
+    if days > 0:
+        formatted_runtime += f"{days}D "
+    if hours > 0:
+        formatted_runtime += f"{hours}H "
+    if minutes > 0:
+        formatted_runtime += f"{minutes}Min"
+    return formatted_runtime.strip()
+
+# Function to format epoch minutes the way the result page shows times
+def format_minute(minute):
+    return from_epoch_minutes(minute).strftime('%I:%M %p (%d %B %Y)')
+
+# Function to format epoch minutes as an ISO timestamp (None stays None)
+def _iso_minute(minute):
+    return None if minute is None else str(np.datetime64(int(minute), 'm'))
+
+# Function to read an ISO timestamp back to epoch minutes (None stays None)
+def _record_minute(text):
+    return None if text is None else int(np.datetime64(text, 'm').astype(np.int64))
+
+# Outcome of one monitored trade, kept as numbers: bar indexes and epoch minutes of each event.
+# Prices, pips, R multiples and runtimes are derived on access, and the result page text is only
+# built by lines(), so callers that need the numbers never pay for string formatting.
+# exit_kind is 'tp', 'sl' or None; three_r_kind is 'sl', 'breakeven', '3r' or None (unresolved).
+# mae_pips/mfe_pips are the excursions before the SL/TP exit and three_r_mfe_pips the favorable one
+# before the 3R system exit (None when they were not measured, e.g. for data scanned in chunks).
+# A trade that could not be monitored only has its inputs and an error message.
+class TradeOutcome:
+    __slots__ = ('symbol', 'digits', 'pip_size', 'trade_type', 'breakeven', 'entry_minute', 'entry_price',
+                 'stoploss_price', 'takeprofit_price', 'exit_kind', 'exit_index', 'exit_minute', 'three_r_target',
+                 'breakeven_index', 'breakeven_minute', 'three_r_kind', 'three_r_index', 'three_r_minute', 'error',
+                 'mae_pips', 'mfe_pips', 'mfe_minute', 'three_r_mfe_pips')
+
+    def __init__(self, symbol, trade_type, entry_minute, breakeven, digits=3, pip_size=0.1, entry_price=None,
+                 stoploss_price=None, takeprofit_price=None, exit_kind=None, exit_index=None, exit_minute=None,
+                 three_r_target=None, breakeven_index=None, breakeven_minute=None, three_r_kind=None,
+                 three_r_index=None, three_r_minute=None, error=None, mae_pips=None, mfe_pips=None, mfe_minute=None,
+                 three_r_mfe_pips=None):
+        self.symbol = symbol
+        self.digits = digits
+        self.pip_size = pip_size
+        self.trade_type = trade_type
+        self.breakeven = breakeven
+        self.entry_minute = entry_minute
+        self.entry_price = entry_price
+        self.stoploss_price = stoploss_price
+        self.takeprofit_price = takeprofit_price
+        self.exit_kind = exit_kind
+        self.exit_index = exit_index
+        self.exit_minute = exit_minute
+        self.three_r_target = three_r_target
+        self.breakeven_index = breakeven_index
+        self.breakeven_minute = breakeven_minute
+        self.three_r_kind = three_r_kind
+        self.three_r_index = three_r_index
+        self.three_r_minute = three_r_minute
+        self.error = error
+        self.mae_pips = mae_pips
+        self.mfe_pips = mfe_pips
+        self.mfe_minute = mfe_minute
+        self.three_r_mfe_pips = three_r_mfe_pips
+
+    # Function to convert a price distance from the entry to pips
+    def pips_to(self, price):
+        return abs(price - self.entry_price) * (1 / self.pip_size)
+
+    @property
+    def stoploss_pips(self):
+        return self.pips_to(self.stoploss_price)
+
+    @property
+    def takeprofit_pips(self):
+        return self.pips_to(self.takeprofit_price)
+
+    @property
+    def exit_price(self):
+        return {'tp': self.takeprofit_price, 'sl': self.stoploss_price}.get(self.exit_kind)
+
+    # R multiple of the SL/TP exit (None while open)
+    @property
+    def pnl_r(self):
+        if self.exit_kind is None:
+            return None
+        return self.takeprofit_pips / self.stoploss_pips if self.exit_kind == 'tp' else -1.0
+
+    @property
+    def runtime_minutes(self):
+        return None if self.exit_minute is None else self.exit_minute - self.entry_minute
+
+    @property
+    def three_r_exit_price(self):
+        return {'sl': self.stoploss_price, 'breakeven': self.entry_price, '3r': self.three_r_target}.get(self.three_r_kind)
+
+    # R multiple of the 3R system exit (None while open)
+    @property
+    def three_r_pnl_r(self):
+        if self.three_r_kind is None:
+            return None
+        if self.three_r_kind != '3r':
+            return -1.0 if self.three_r_kind == 'sl' else 0.0
+        return self.pips_to(self.three_r_target) / self.stoploss_pips
+
+    @property
+    def three_r_runtime_minutes(self):
+        return None if self.three_r_minute is None else self.three_r_minute - self.entry_minute
+
+    @property
+    def mae_r(self):
+        return None if self.mae_pips is None else self.mae_pips / self.stoploss_pips
+
+    @property
+    def mfe_r(self):
+        return None if self.mfe_pips is None else self.mfe_pips / self.stoploss_pips
+
+    @property
+    def minutes_to_mfe(self):
+        return None if self.mfe_minute is None else self.mfe_minute - self.entry_minute
+
+    # R reached before the 3R system exit
+    @property
+    def three_r_mfe_r(self):
+        return None if self.three_r_mfe_pips is None else self.three_r_mfe_pips / self.stoploss_pips
+
+    # Function to describe the excursions before the SL/TP exit as one result line
+    def _excursion_line(self):
+        line = f"MAE: {self.mae_pips:.2f} pips ({self.mae_r:.2f}R) | MFE: {self.mfe_pips:.2f} pips ({self.mfe_r:.2f}R)"
+        if self.mfe_minute is not None:
+            line += f" | Time to MFE: {format_runtime_minutes(self.minutes_to_mfe)}"
+        return line
+
+    # Function to build the result page lines (a generator, so the page formats them while rendering)
+    def lines(self):
+        if self.error is not None:
+            yield self.error
+            return
+        if self.three_r_kind is None:
+            yield "Neither Stoploss nor 3R Take Profit was hit within the given data range."
+            return
+        digits = self.digits
+        yield f"Pair: {self.symbol}"
+        yield f"Trade Type: {self.trade_type.capitalize()}"
+        yield f"Entry Price: {self.entry_price:.{digits}f} | Time: {format_minute(self.entry_minute)}"
+        yield (f"SL Price: {self.stoploss_price:.{digits}f} ({self.stoploss_pips:.2f} pips) | "
+               f"TP Price: {self.takeprofit_price:.{digits}f} ({self.takeprofit_pips:.2f} pips)")
+        event = f"Time: {format_minute(self.exit_minute)} | Runtime: {format_runtime_minutes(self.runtime_minutes)}" \
+            if self.exit_kind else None
+        if self.exit_kind == 'tp':
+            yield f"Take Profit hit: {self.takeprofit_price:.{digits}f} | {event}"
+        elif self.exit_kind == 'sl':
+            yield f"Stoploss hit: {self.stoploss_price:.{digits}f} | {event}"
+        if self.exit_kind and self.mae_pips is not None:
+            yield self._excursion_line()
+        if self.exit_kind == 'tp':
+            yield f"PnL: {self.pnl_r:.2f}R\n"
+        elif self.exit_kind == 'sl':
+            yield f"PnL: -1R\n"
+
+        yield "(3R System)" if self.breakeven else "( 3R System (Without Breakeven) )"
+        yield f"3R TP: {self.three_r_target:.{digits}f} ({3 * self.stoploss_pips:.2f} pips)"
+        if self.breakeven_minute is not None:
+            yield (f"Breakeven at: {self.entry_price:.{digits}f} | Time: {format_minute(self.breakeven_minute)} | "
+                   f"Runtime: {format_runtime_minutes(self.breakeven_minute - self.entry_minute)}")
+        event = f"Time: {format_minute(self.three_r_minute)} | Runtime: {format_runtime_minutes(self.three_r_runtime_minutes)}"
+        if self.three_r_kind == 'sl':
+            yield f"Stoploss hit: {self.stoploss_price:.{digits}f} | {event}"
+        elif self.three_r_kind == 'breakeven':
+            yield f"Breakeven hit: {self.entry_price:.{digits}f} | {event}"
+        else:
+            yield f"3R hit: {self.three_r_target:.{digits}f} ({self.pips_to(self.three_r_target):.2f} pips) | {event}"
+        if self.three_r_mfe_pips is not None:
+            yield f"R reached before exit: {self.three_r_mfe_r:.2f}R"
+        if self.three_r_kind == 'sl':
+            yield f"PnL: -1R\n"
+
+    # Function to describe the outcome as an export record with the RECORD_FIELDS columns
+    def to_dict(self):
+        record = {
+            'entry_time': _iso_minute(self.entry_minute),
+            'trade_type': self.trade_type,
+            'breakeven': bool(self.breakeven),
+            'error': self.error,
+        }
+        if self.error is None:
+            record.update({
+                'entry_price': self.entry_price,
+                'stoploss_price': self.stoploss_price,
+                'takeprofit_price': self.takeprofit_price,
+                'stoploss_pips': self.stoploss_pips,
+                'takeprofit_pips': self.takeprofit_pips,
+                'outcome': self.exit_kind,
+                'exit_time': _iso_minute(self.exit_minute),
+                'runtime_minutes': self.runtime_minutes,
+                'pnl_r': self.pnl_r,
+                'three_r_target': self.three_r_target,
+                'breakeven_time': _iso_minute(self.breakeven_minute),
+                'three_r_outcome': self.three_r_kind,
+                'three_r_exit_time': _iso_minute(self.three_r_minute),
+                'three_r_runtime_minutes': self.three_r_runtime_minutes,
+                'three_r_pnl_r': self.three_r_pnl_r,
+                'mae_pips': self.mae_pips,
+                'mfe_pips': self.mfe_pips,
+                'mae_r': self.mae_r,
+                'mfe_r': self.mfe_r,
+                'mfe_time': _iso_minute(self.mfe_minute),
+                'minutes_to_mfe': self.minutes_to_mfe,
+                'three_r_mfe_r': self.three_r_mfe_r,
+            })
+        return record
+
+    # Function to rebuild an outcome from an export record (e.g. a batch result), so it can be
+    # rendered with lines(); bar indexes are not part of a record and stay None
+    @classmethod
+    def from_record(cls, record, symbol, digits=3, pip_size=0.1):
+        outcome = cls(symbol, record['trade_type'], _record_minute(record['entry_time']), record['breakeven'],
+                      digits, pip_size, error=record['error'])
+        if record['error'] is None:
+            outcome.entry_price = record['entry_price']
+            outcome.stoploss_price = record['stoploss_price']
+            outcome.takeprofit_price = record['takeprofit_price']
+            outcome.exit_kind = record['outcome']
+            outcome.exit_minute = _record_minute(record['exit_time'])
+            outcome.three_r_target = record['three_r_target']
+            outcome.breakeven_minute = _record_minute(record['breakeven_time'])
+            outcome.three_r_kind = record['three_r_outcome']
+            outcome.three_r_minute = _record_minute(record['three_r_exit_time'])
+            outcome.mae_pips = record.get('mae_pips')
+            outcome.mfe_pips = record.get('mfe_pips')
+            outcome.mfe_minute = _record_minute(record.get('mfe_time'))
+            if record.get('three_r_mfe_r') is not None:
+                outcome.three_r_mfe_pips = record['three_r_mfe_r'] * record['stoploss_pips']
+        return outcome
+
+    # Function to get every slot as a JSON-serializable dict (for the result cache)
+    def to_state(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    # Function to rebuild an outcome from to_state() output
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+# Function to get a record as a plain dict, whether it is one already or a TradeOutcome
+def _export_dict(record):
+    return record.to_dict() if isinstance(record, TradeOutcome) else record
+
+# Function to write export records (dicts or TradeOutcome objects) as CSV with the RECORD_FIELDS columns
+def write_csv(records, handle):
+    writer = csv.DictWriter(handle, fieldnames=RECORD_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow(_export_dict(record))
+
+# Function to render export records as CSV text
+def records_to_csv(records):
+    handle = io.StringIO()
+    write_csv(records, handle)
+    return handle.getvalue()
+
+# Function to render chunks of export records as CSV text: the header first, then one piece of
+# text per chunk, so a streamed response sends every chunk as soon as it is ready
+def csv_chunks(record_chunks):
+    handle = io.StringIO()
+    writer = csv.DictWriter(handle, fieldnames=RECORD_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    yield handle.getvalue()
+    for records in record_chunks:
+        handle.seek(0)
+        handle.truncate()
+        writer.writerows(_export_dict(record) for record in records)
+        yield handle.getvalue()
+
+# Function to render chunks of export records as newline-delimited JSON, one piece of text per chunk
+def ndjson_chunks(record_chunks):
+    for records in record_chunks:
+        yield "".join(json.dumps(_export_dict(record)) + "\n" for record in records)
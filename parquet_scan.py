@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+import fastparquet
+import numpy as np
+
+from hit_search import first_trade_outcome, trade_outcome_manager, trade_outcome_results
+from price_data import from_epoch_minutes, to_epoch_minutes
+from price_store import clean_price_frame
+
+# Columns read from each row group
+PRICE_COLUMNS = ['Local time', 'Open', 'High', 'Low', 'Close']
+
+# Sidecar file holding the row group index of a parquet file (or of a partition directory)
+INDEX_SUFFIX = ".groups.json"
+
+# Format version written to the sidecar, bumped when its layout changes
+INDEX_FORMAT = 1
+
+# Function to list the parquet files behind a path: the file itself, or the .parquet files of a
+# directory in name order (one file per time partition, e.g. xauusd_2019.parquet, xauusd_2020.parquet)
+def parquet_parts(path):
+    if not os.path.isdir(path):
+        return [path]
+    parts = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(".parquet"))
+    if not parts:
+        raise ValueError(f"No .parquet files found in {path}.")
+    return parts
+
+# Function to describe the parquet files of a path by size and modification time, so a stale index is noticed
+def _fingerprint(parts):
+    return [[os.path.basename(part), os.path.getsize(part), os.stat(part).st_mtime_ns] for part in parts]
+
+# Bars of one decoded row group, positioned in the whole series by offset
+class RowGroup:
+    def __init__(self, offset, minutes, open_prices, high, low, close):
+        self.offset = offset
+        self.minutes = minutes
+        self.open = open_prices
+        self.high = high
+        self.low = low
+        self.close = close
+
+    def __len__(self):
+        return len(self.minutes)
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in (self.minutes, self.open, self.high, self.low, self.close))
+
+# One column of a ChunkedPriceFile read by position (only scalar positions are supported)
+class ChunkedColumn:
+    def __init__(self, source, name):
+        self.source = source
+        self.name = name
+
+    def __getitem__(self, position):
+        position = int(position)
+        if position < 0:
+            position += len(self.source)
+        group = self.source.read_group(self.source.group_of(position))
+        return getattr(group, self.name)[position - group.offset]
+
+    def __len__(self):
+        return len(self.source)
+
+# M1 price data scanned from parquet row groups on demand instead of loaded whole.
+# A small index of every row group (its first and last minute and bar count) is built once by
+# streaming the file and kept in a sidecar next to it; lookups then read only the row group holding
+# the entry, and a trade is resolved by reading the following row groups until it closes, so
+# memory stays at a few row groups however long the history is. path may also be a directory of
+# parquet files, one per time partition, read in name order. The bars must be in time order.
+class ChunkedPriceFile:
+    def __init__(self, path, cache_groups=2):
+        self.path = path
+        self.cache_groups = max(int(cache_groups), 1)
+        self.parts = parquet_parts(path)
+        # Row groups decoded so far (reads that missed the cache of recent row groups)
+        self.groups_read = 0
+        self.extremes = None
+        self._files = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        groups = self._load_index()
+        # Non-empty row groups as (part number, row group number), with their minute range and bar counts
+        self.groups = [(part, number) for part, number, _, _, _ in groups]
+        self.first_minutes = np.array([first for _, _, first, _, _ in groups], dtype=np.int64)
+        self.last_minutes = np.array([last for _, _, _, last, _ in groups], dtype=np.int64)
+        self.bounds = np.concatenate([[0], np.cumsum([rows for _, _, _, _, rows in groups])]).astype(np.int64)
+        self.minutes = ChunkedColumn(self, 'minutes')
+        self.open = ChunkedColumn(self, 'open')
+        self.high = ChunkedColumn(self, 'high')
+        self.low = ChunkedColumn(self, 'low')
+        self.close = ChunkedColumn(self, 'close')
+
+    # Function to fingerprint the data from the row group index (see PriceData.version)
+    @property
+    def version(self):
+        if len(self) == 0:
+            return "empty"
+        checksum = zlib.crc32(np.concatenate([self.first_minutes, self.last_minutes, self.bounds]).tobytes())
+        return f"{len(self)}-{int(self.first_minutes[0])}-{int(self.last_minutes[-1])}-{checksum:08x}"
+
+    def __len__(self):
+        return int(self.bounds[-1])
+
+    # Bytes held by the decoded row groups currently cached
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(group.nbytes for group in self._cache.values())
+
+    # Function to find the position of the bar at the given minute, or None when missing
+    def locate(self, timestamp):
+        minute = to_epoch_minutes(timestamp)
+        number = int(np.searchsorted(self.last_minutes, minute, side='left'))
+        if number == len(self.groups):
+            return None
+        group = self.read_group(number)
+        position = int(np.searchsorted(group.minutes, minute, side='left'))
+        if position < len(group) and group.minutes[position] == minute:
+            return group.offset + position
+        return None
+
+    # Function to find the position of the first bar strictly after the given minute
+    def first_after(self, timestamp):
+        minute = to_epoch_minutes(timestamp)
+        number = int(np.searchsorted(self.last_minutes, minute, side='right'))
+        if number == len(self.groups):
+            return len(self)
+        if self.first_minutes[number] > minute:
+            return int(self.bounds[number])
+        group = self.read_group(number)
+        return group.offset + int(np.searchsorted(group.minutes, minute, side='right'))
+
+    # Function to get the timestamp of the bar at a position
+    def time_at(self, position):
+        return from_epoch_minutes(self.minutes[position])
+
+    # Function to find the row group holding the bar at a position
+    def group_of(self, position):
+        if not 0 <= position < len(self):
+            raise IndexError(f"Bar {position} is outside the data ({len(self)} bars).")
+        return int(np.searchsorted(self.bounds, position, side='right')) - 1
+
+    # Function to get a decoded row group, reading it from disk unless it is among the recently used ones
+    def read_group(self, number):
+        with self._lock:
+            if number in self._cache:
+                self._cache.move_to_end(number)
+                return self._cache[number]
+        part, row_group = self.groups[number]
+        group = self._decode(part, row_group, int(self.bounds[number]))
+        if len(group) != self.bounds[number + 1] - self.bounds[number]:
+            raise ValueError(f"{self.parts[part]} changed since its row group index was built; restart to rebuild it.")
+        with self._lock:
+            self.groups_read += 1
+            self._cache[number] = group
+            while len(self._cache) > self.cache_groups:
+                self._cache.popitem(last=False)
+        return group
+
+    # Function to resolve the SL/TP and the 3R system outcomes of one trade from bar start on
+    # (see hit_search.find_trade_outcome), reading row groups only until both systems have closed.
+    # Returns the same five values, with positions in the whole series.
+    def find_trade_outcome(self, entry_price, stoploss_price, takeprofit_price, three_r_target, trade_type,
+                           breakeven, tolerance=0.1, check_stoploss=True, start=0, intrabar=None):
+        manager = trade_outcome_manager(entry_price, stoploss_price, takeprofit_price, three_r_target,
+                                        [trade_type.lower() == 'buy'], breakeven, tolerance, check_stoploss)
+        number = self.group_of(start) if start < len(self) else len(self.groups)
+        while number < len(self.groups) and manager.watching()[0]:
+            group = self.read_group(number)
+            manager.advance(group.high, group.low, [max(start - group.offset, 0)], [len(group)], offset=group.offset,
+                            minutes=group.minutes, intrabar=intrabar)
+            number += 1
+        return first_trade_outcome(*trade_outcome_results(manager))
+
+    # Function to open (once) the parquet file of a partition
+    def _file(self, part):
+        if part not in self._files:
+            self._files[part] = fastparquet.ParquetFile(self.parts[part])
+        return self._files[part]
+
+    # Function to read and clean one row group of a partition into arrays
+    def _decode(self, part, row_group, offset):
+        df = clean_price_frame(self._file(part)[row_group].to_pandas(columns=PRICE_COLUMNS))
+        minutes = df['Local time'].to_numpy().astype('datetime64[m]').astype(np.int64)
+        return RowGroup(offset, minutes, *[df[name].to_numpy(dtype=np.float64) for name in PRICE_COLUMNS[1:]])
+
+    # Function to get the path of the sidecar index file
+    def _index_path(self):
+        if os.path.isdir(self.path):
+            return os.path.join(self.path, INDEX_SUFFIX)
+        return self.path + INDEX_SUFFIX
+
+    # Function to load the row group index from the sidecar, rebuilding it when missing or stale
+    def _load_index(self):
+        fingerprint = _fingerprint(self.parts)
+        index_path = self._index_path()
+        try:
+            with open(index_path) as handle:
+                index = json.load(handle)
+            if index.get('format') == INDEX_FORMAT and index.get('files') == fingerprint:
+                return index['groups']
+        except (OSError, ValueError):
+            pass
+
+        groups = self._build_index()
+        try:
+            with open(index_path + ".tmp", "w") as handle:
+                json.dump({'format': INDEX_FORMAT, 'files': fingerprint, 'groups': groups}, handle)
+            os.replace(index_path + ".tmp", index_path)
+        except OSError:
+            # A read-only data directory only costs rebuilding the index on the next start
+            pass
+        return groups
+
+    # Function to build the row group index by reading the row groups one at a time.
+    # Raises ValueError if the bars are not in time order, since positions could not be found by minute then.
+    def _build_index(self):
+        groups = []
+        previous = None
+        for part in range(len(self.parts)):
+            for row_group in range(len(self._file(part).row_groups)):
+                group = self._decode(part, row_group, 0)
+                if not len(group):
+                    continue
+                if np.any(group.minutes[1:] < group.minutes[:-1]) or (previous is not None and group.minutes[0] < previous):
+                    raise ValueError(f"{self.parts[part]} row group {row_group} is not in time order; "
+                                     "sort the data or convert it to a price store instead of scanning it in chunks.")
+                previous = int(group.minutes[-1])
+                groups.append([part, row_group, int(group.minutes[0]), previous, len(group)])
+        return groups
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the row group index of a parquet price file for chunked scans.")
+    parser.add_argument("path", help="Parquet file, or directory of parquet files (one per time partition)")
+    args = parser.parse_args()
+    data = ChunkedPriceFile(args.path)
+    print(f"Indexed {len(data)} bars in {len(data.groups)} row groups "
+          f"({data.time_at(0)} to {data.time_at(len(data) - 1)}) -> {data._index_path()}")
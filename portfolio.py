@@ -0,0 +1,262 @@
+import argparse
+import heapq
+import json
+import sys
+
+import numpy as np
+
+from batch import load_trades_file, locate_trades, parse_flag
+from hit_search import HIT_BREAKEVEN, HIT_NAMES, HIT_SL, HIT_THREE_R, HIT_TP, manage_trades, sl_tp_leg, three_r_leg
+from symbols import Symbol, load_symbol_data
+from tick_store import TickStore
+from timeframes import TIMEFRAMES, parse_timeframe, timeframe_cache
+
+# Exit systems a portfolio can trade: the plain SL/TP exits or the 3R system (with each trade's breakeven flag)
+EXIT_SYSTEMS = ('sl_tp', '3r')
+
+# M1 bars of equity computed per step of the curve sweep, bounding its memory use
+CURVE_CHUNK_BARS = 1 << 20
+
+# Settings of a portfolio simulation. Each trade risks risk_per_trade of the account: of the
+# realized balance at its entry when compound is set, of initial_equity otherwise. Its size is
+# the risk divided by the entry-to-SL distance, so one unit gains one unit of account currency
+# per unit of price. With max_open, entries arriving while that many positions are open are skipped.
+class PortfolioSettings:
+    def __init__(self, system='sl_tp', initial_equity=10_000.0, risk_per_trade=0.01, compound=True, max_open=None,
+                 curve_timeframe='D1'):
+        if system not in EXIT_SYSTEMS:
+            raise ValueError(f"Exit system must be one of: {', '.join(EXIT_SYSTEMS)}.")
+        if not initial_equity > 0:
+            raise ValueError("Initial equity must be positive.")
+        if not 0 < risk_per_trade <= 1:
+            raise ValueError("Risk per trade must be a fraction between 0 and 1.")
+        if max_open is not None and max_open < 1:
+            raise ValueError("Max open positions must be at least 1.")
+        self.system = system
+        self.initial_equity = float(initial_equity)
+        self.risk_per_trade = float(risk_per_trade)
+        self.compound = bool(compound)
+        self.max_open = None if max_open is None else int(max_open)
+        self.curve_timeframe = parse_timeframe(curve_timeframe)
+
+    # Function to read the settings from a request body, raising ValueError on invalid input
+    @classmethod
+    def from_payload(cls, payload):
+        max_open = payload.get('max_open')
+        return cls(system=str(payload.get('system', 'sl_tp')).strip().lower(),
+                   initial_equity=float(payload.get('initial_equity', 10_000.0)),
+                   risk_per_trade=float(payload.get('risk_per_trade', 0.01)),
+                   compound=parse_flag(payload.get('compound', True)),
+                   max_open=int(max_open) if max_open not in (None, '') else None,
+                   curve_timeframe=payload.get('curve_timeframe', 'D1'))
+
+# Function to resolve every valid trade with the chosen exit system.
+# Returns (outcome codes, exit bar indices, exit prices), with HIT_NONE / -1 / NaN for trades still open.
+# intrabar is an optional tick source (TickStore.path) settling M1 bars that reach several levels.
+def resolve_exits(price_data, located, system, tolerance, pip_size, intrabar=None):
+    entry_price, stoploss, is_buy = located.entry_price, located.stoploss, located.is_buy
+    if system == 'sl_tp':
+        leg = sl_tp_leg(stoploss, located.takeprofit)
+        target = located.takeprofit
+    else:
+        pips_per_unit = 1 / pip_size
+        three_r_pips = 3 * np.abs(stoploss - entry_price) * pips_per_unit
+        target = np.where(is_buy, entry_price + three_r_pips / pips_per_unit, entry_price - three_r_pips / pips_per_unit)
+        leg = three_r_leg(entry_price, stoploss, target, is_buy, located.breakeven)
+    stops = np.where(located.valid, len(price_data), located.starts)
+    result, = manage_trades(price_data.high, price_data.low, [leg], is_buy, located.starts, stops, tolerance,
+                            extremes=price_data.hit_index, minutes=price_data.minutes, intrabar=intrabar)
+    exit_price = np.select([result.outcome == HIT_TP, result.outcome == HIT_THREE_R,
+                            result.outcome == HIT_SL, result.outcome == HIT_BREAKEVEN],
+                           [located.takeprofit, target, stoploss, entry_price], np.nan)
+    return result.outcome, result.index, exit_price
+
+# Function to simulate a portfolio over a stream of parsed trades.
+# All trades are resolved together by the hit search; one chronological pass then sizes each
+# entry from the balance realized so far, and a sweep over the M1 closes marks the open
+# positions to market to build the equity curve and drawdown.
+# With block_trades the exits are resolved that many trades at a time, and on_block is called with
+# the number of trades resolved after each block (e.g. to report progress).
+# Returns {'summary': {...}, 'trades': [...], 'equity_curve': [...]}.
+def simulate_portfolio(price_data, trades, settings=None, tolerance=0.1, pip_size=0.1, timeframe='M1', intrabar=None,
+                       block_trades=None, on_block=None):
+    settings = settings or PortfolioSettings()
+    located = locate_trades(price_data, trades, pip_size, timeframe)
+    block_trades = block_trades or max(len(located), 1)
+    blocks = []
+    for offset in range(0, max(len(located), 1), block_trades):
+        blocks.append(resolve_exits(price_data, located[offset:offset + block_trades], settings.system, tolerance,
+                                    pip_size, intrabar))
+        if on_block:
+            on_block(min(offset + block_trades, len(located)))
+    outcome, exit_index, exit_price = (np.concatenate(values) for values in zip(*blocks))
+    entry_bar = located.starts - 1
+    direction = np.where(located.is_buy, 1.0, -1.0)
+    risk_distance = np.abs(located.entry_price - located.stoploss)
+
+    # Chronological pass: exits realized up to an entry bar are booked before the entry is sized
+    count = len(located)
+    units = np.zeros(count)
+    pnl = np.full(count, np.nan)
+    balance_after = np.full(count, np.nan)
+    status = ['invalid' if error else None for error in located.errors]
+    balance = settings.initial_equity
+    exits = []
+    # Positions without an exit in the data stay open to the end
+    never_closed = 0
+    max_open_positions = 0
+    for i in sorted(np.flatnonzero(located.valid).tolist(), key=lambda i: entry_bar[i]):
+        while exits and exits[0][0] <= entry_bar[i]:
+            _, j = heapq.heappop(exits)
+            balance += pnl[j]
+            balance_after[j] = balance
+        if balance <= 0 or (settings.max_open is not None and len(exits) + never_closed >= settings.max_open):
+            status[i] = 'skipped'
+            continue
+        risk = (balance if settings.compound else settings.initial_equity) * settings.risk_per_trade
+        units[i] = risk / risk_distance[i]
+        if exit_index[i] >= 0:
+            status[i] = 'closed'
+            pnl[i] = units[i] * (exit_price[i] - located.entry_price[i]) * direction[i]
+            heapq.heappush(exits, (int(exit_index[i]), i))
+        else:
+            status[i] = 'open'
+            never_closed += 1
+        max_open_positions = max(max_open_positions, len(exits) + never_closed)
+    while exits:
+        _, j = heapq.heappop(exits)
+        balance += pnl[j]
+        balance_after[j] = balance
+
+    taken = units > 0
+    summary, curve = _equity_sweep(price_data, settings, entry_bar[taken], exit_index[taken],
+                                   (units * direction)[taken], located.entry_price[taken], np.nan_to_num(pnl[taken]))
+    closed = np.array([state == 'closed' for state in status], dtype=bool)
+    wins, losses = pnl[closed & (pnl > 0)], pnl[closed & (pnl < 0)]
+    summary.update({
+        'trades': count,
+        'taken': int(taken.sum()),
+        'skipped': status.count('skipped'),
+        'invalid': status.count('invalid'),
+        'open_at_end': int((taken & ~closed).sum()),
+        'wins': int(wins.size),
+        'losses': int(losses.size),
+        'win_rate': float(wins.size / closed.sum()) if closed.any() else None,
+        'profit_factor': float(wins.sum() / -losses.sum()) if losses.size else None,
+        'final_balance': float(balance),
+        'max_open_positions': max_open_positions,
+    })
+
+    entry_text = np.datetime_as_string(located.entry_minutes.astype('datetime64[m]')).tolist()
+    exit_text = np.datetime_as_string(price_data.minutes[np.maximum(exit_index, 0)].astype('datetime64[m]')).tolist()
+    records = []
+    for i in range(count):
+        record = {'entry_time': entry_text[i], 'trade_type': 'buy' if located.is_buy[i] else 'sell',
+                  'status': status[i], 'error': located.errors[i]}
+        if taken[i]:
+            record.update({
+                'entry_price': float(located.entry_price[i]),
+                'stoploss_price': float(located.stoploss[i]),
+                'units': float(units[i]),
+                'risk': float(units[i] * risk_distance[i]),
+                'outcome': HIT_NAMES[int(outcome[i])],
+                'exit_time': exit_text[i] if exit_index[i] >= 0 else None,
+                'exit_price': float(exit_price[i]) if exit_index[i] >= 0 else None,
+                'pnl': float(pnl[i]) if exit_index[i] >= 0 else None,
+                'r_multiple': float(pnl[i] / (units[i] * risk_distance[i])) if exit_index[i] >= 0 else None,
+                'balance_after': float(balance_after[i]) if exit_index[i] >= 0 else None,
+            })
+        records.append(record)
+    return {'summary': summary, 'trades': records, 'equity_curve': curve}
+
+# Function to mark the taken positions to market at every M1 close from the first entry on.
+# Realized PnL, signed units and signed entry cost change only at entry and exit bars, so each
+# chunk of bars gets them from a cumulative sum of those changes, and
+#   equity = balance + close * open units - open cost.
+# Returns (summary figures, equity curve sampled at the close of each curve_timeframe bar).
+def _equity_sweep(price_data, settings, entry_bar, exit_index, signed_units, entry_price, pnl):
+    summary = {'initial_equity': settings.initial_equity, 'final_equity': settings.initial_equity,
+               'total_return': 0.0, 'max_drawdown': 0.0, 'max_drawdown_pct': 0.0, 'max_drawdown_time': None}
+    if entry_bar.size == 0:
+        return summary, []
+    closed = exit_index >= 0
+    first = int(entry_bar.min())
+    last = len(price_data) if not closed.all() else int(exit_index.max()) + 1
+
+    # Change points: a position counts from its entry close until its exit bar, where its PnL is realized
+    unit_bars = np.concatenate([entry_bar, exit_index[closed]]) - first
+    unit_changes = np.concatenate([signed_units, -signed_units[closed]])
+    cost_changes = np.concatenate([signed_units * entry_price, -(signed_units * entry_price)[closed]])
+    order = np.argsort(unit_bars, kind='stable')
+    unit_bars, unit_changes, cost_changes = unit_bars[order], unit_changes[order], cost_changes[order]
+    pnl_bars = exit_index[closed] - first
+    order = np.argsort(pnl_bars, kind='stable')
+    pnl_bars, pnl_changes = pnl_bars[order], pnl[closed][order]
+
+    curve_bars = timeframe_cache.get(price_data, settings.curve_timeframe).bounds[1:] - 1
+    curve_bars = curve_bars[(curve_bars >= first) & (curve_bars < last)]
+    curve = []
+    carry_balance, carry_units, carry_cost = settings.initial_equity, 0.0, 0.0
+    peak = settings.initial_equity
+    equity = settings.initial_equity
+    for start in range(first, last, CURVE_CHUNK_BARS):
+        stop = min(start + CURVE_CHUNK_BARS, last)
+        width = stop - start
+
+        def changes(bars, values):
+            low, high = np.searchsorted(bars, [start - first, stop - first])
+            return np.bincount(bars[low:high] - (start - first), weights=values[low:high], minlength=width)
+
+        balance = carry_balance + np.cumsum(changes(pnl_bars, pnl_changes))
+        open_units = carry_units + np.cumsum(changes(unit_bars, unit_changes))
+        open_cost = carry_cost + np.cumsum(changes(unit_bars, cost_changes))
+        equity_values = balance + np.asarray(price_data.close[start:stop], dtype=np.float64) * open_units - open_cost
+        peaks = np.maximum.accumulate(np.maximum(equity_values, peak))
+        drawdown = peaks - equity_values
+        worst = int(drawdown.argmax())
+        if drawdown[worst] > summary['max_drawdown']:
+            summary['max_drawdown'] = float(drawdown[worst])
+            summary['max_drawdown_time'] = str(price_data.minutes[start + worst].astype('datetime64[m]'))
+        summary['max_drawdown_pct'] = max(summary['max_drawdown_pct'], float((drawdown / peaks).max()))
+
+        for bar in curve_bars[(curve_bars >= start) & (curve_bars < stop)].tolist():
+            offset = bar - start
+            curve.append({'time': str(price_data.minutes[bar].astype('datetime64[m]')),
+                          'equity': float(equity_values[offset]), 'balance': float(balance[offset]),
+                          'drawdown': float(drawdown[offset])})
+        carry_balance, carry_units, carry_cost = balance[-1], open_units[-1], open_cost[-1]
+        peak = peaks[-1]
+        equity = equity_values[-1]
+
+    summary['final_equity'] = float(equity)
+    summary['total_return'] = float(equity / settings.initial_equity - 1)
+    return summary, curve
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate a portfolio of trades: sizing, overlapping positions, equity and drawdown.")
+    parser.add_argument('data', help="price store directory, or a parquet/CSV file of M1 bars")
+    parser.add_argument('trades', help=".json or .csv file of trades (same fields as the batch endpoint)")
+    parser.add_argument('--system', choices=EXIT_SYSTEMS, default='sl_tp', help="exit system (default: sl_tp)")
+    parser.add_argument('--equity', type=float, default=10_000.0, help="initial equity (default: 10000)")
+    parser.add_argument('--risk', type=float, default=0.01, help="fraction of the account risked per trade (default: 0.01)")
+    parser.add_argument('--fixed', action='store_true', help="risk a fixed share of the initial equity instead of compounding")
+    parser.add_argument('--max-open', type=int, help="skip entries while this many positions are open")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="price tolerance used for SL/TP hits (default: 0.1)")
+    parser.add_argument('--pip-size', type=float, default=0.1, help="price move of one pip (default: 0.1, as for XAUUSD)")
+    parser.add_argument('--timeframe', type=str.upper, choices=list(TIMEFRAMES), default='M1',
+                        help="timeframe of the entry bars; exits are still resolved on M1 (default: M1)")
+    parser.add_argument('--curve', type=str.upper, choices=list(TIMEFRAMES), default='D1',
+                        help="timeframe at which the equity curve is sampled (default: D1)")
+    parser.add_argument('--ticks', help="tick store directory used to settle M1 bars that reach several levels")
+    parser.add_argument('--summary', action='store_true', help="print only the summary")
+    args = parser.parse_args()
+
+    try:
+        trades = load_trades_file(args.trades)
+        settings = PortfolioSettings(args.system, args.equity, args.risk, not args.fixed, args.max_open, args.curve)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Invalid input: {e}")
+    price_data = load_symbol_data(Symbol("DATA", args.data, pip_size=args.pip_size, tolerance=args.tolerance))
+    intrabar = TickStore(args.ticks).path if args.ticks else None
+    result = simulate_portfolio(price_data, trades, settings, args.tolerance, args.pip_size, args.timeframe, intrabar)
+    print(json.dumps(result['summary'] if args.summary else result, indent=2))
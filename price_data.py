@@ -0,0 +1,101 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from forward_extremes import ForwardExtremes
+
+# Function to convert a timestamp to integer minutes since the Unix epoch
+def to_epoch_minutes(timestamp):
+    return int(pd.Timestamp(timestamp).to_datetime64().astype('datetime64[m]').astype(np.int64))
+
+# Function to convert a sequence of timestamps to an int64 epoch-minute array
+def to_epoch_minutes_array(timestamps):
+    values = np.array([pd.Timestamp(timestamp).to_datetime64() for timestamp in timestamps], dtype='datetime64[ns]')
+    return values.astype('datetime64[m]').astype(np.int64)
+
+# Function to convert integer epoch minutes back to a timestamp
+def from_epoch_minutes(minutes):
+    return pd.Timestamp(np.datetime64(int(minutes), 'm'))
+
+# Price series indexed by a sorted int64 epoch-minute array.
+# Lookups are binary searches and windows are positional views, so neither copies the data.
+class PriceData:
+    def __init__(self, minutes, open_prices, high, low, close, extremes=None):
+        self.minutes = minutes
+        self.open = open_prices
+        self.high = high
+        self.low = low
+        self.close = close
+        # Optional ForwardExtremes index over high/low for far-away hit searches
+        self.extremes = extremes
+        # Optional index answering the hit searches in place of extremes (e.g. a TimeframeIndex)
+        self.search_index = None
+        # Fingerprint of the bars, computed on first use (the arrays are never changed in place)
+        self._version = None
+
+    # Function to build the index from a DataFrame with a parsed 'Local time' column
+    @classmethod
+    def from_frame(cls, df):
+        minutes = df['Local time'].to_numpy().astype('datetime64[m]').astype(np.int64)
+        columns = [df[name].to_numpy() for name in ('Open', 'High', 'Low', 'Close')]
+        if len(minutes) > 1 and np.any(minutes[1:] < minutes[:-1]):
+            # A stable sort keeps the first row of any duplicated minute first
+            order = np.argsort(minutes, kind='stable')
+            minutes = minutes[order]
+            columns = [values[order] for values in columns]
+        return cls(minutes, *columns)
+
+    # Function to build the forward-extremes index over the High/Low columns
+    def build_extremes(self):
+        self.extremes = ForwardExtremes.build(self.high, self.low)
+        return self.extremes
+
+    # Index the hit searches use for far-away levels: the search index when one is set, else the extremes
+    @property
+    def hit_index(self):
+        return self.search_index if self.search_index is not None else self.extremes
+
+    # Function to fingerprint the data, so cached results are not reused after the data changes.
+    # Combines the row count and time range with a checksum over every bar of every column; it keys
+    # the persistent result cache, so a change to any single bar has to show.
+    @property
+    def version(self):
+        if self._version is None:
+            if len(self) == 0:
+                self._version = "empty"
+            else:
+                checksum = zlib.crc32(np.ascontiguousarray(self.minutes, dtype=np.int64))
+                for values in (self.open, self.high, self.low, self.close):
+                    checksum = zlib.crc32(np.ascontiguousarray(values, dtype=np.float64), checksum)
+                self._version = f"{len(self)}-{int(self.minutes[0])}-{int(self.minutes[-1])}-{checksum:08x}"
+        return self._version
+
+    def __len__(self):
+        return len(self.minutes)
+
+    # Function to find the position of the bar at the given minute, or None when missing
+    def locate(self, timestamp):
+        minute = to_epoch_minutes(timestamp)
+        position = int(np.searchsorted(self.minutes, minute, side='left'))
+        if position < len(self.minutes) and self.minutes[position] == minute:
+            return position
+        return None
+
+    # Function to locate many entry minutes at once.
+    # Returns (positions of the entry bars with -1 where missing, positions of the first bar after each entry).
+    def locate_many(self, entry_minutes):
+        entry_minutes = np.asarray(entry_minutes, dtype=np.int64)
+        positions = np.searchsorted(self.minutes, entry_minutes, side='left')
+        found = positions < len(self.minutes)
+        found[found] = self.minutes[positions[found]] == entry_minutes[found]
+        starts = np.searchsorted(self.minutes, entry_minutes, side='right')
+        return np.where(found, positions, -1), starts
+
+    # Function to find the position of the first bar strictly after the given minute
+    def first_after(self, timestamp):
+        return int(np.searchsorted(self.minutes, to_epoch_minutes(timestamp), side='right'))
+
+    # Function to get the timestamp of the bar at a position
+    def time_at(self, position):
+        return from_epoch_minutes(self.minutes[position])
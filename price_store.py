@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from forward_extremes import ForwardExtremes
+from price_data import PriceData
+
+# Directory suffix of a converted price store
+STORE_SUFFIX = ".store"
+
+# Format version written to meta.json, bumped when the layout changes
+STORE_FORMAT = 1
+
+# One .npy file per column: int64 epoch minutes plus the OHLC prices
+STORE_COLUMNS = ('minutes', 'open', 'high', 'low', 'close')
+
+# Suffix of the store kept next to a CSV or parquet file by load_cached_price_file
+CACHE_SUFFIX = ".cache"
+
+# Function to read a parquet or CSV price file (path or file object) into a cleaned DataFrame.
+# file_format is 'csv' or 'parquet'; by default it follows the file extension.
+def read_price_frame(source, file_format=None):
+    if file_format is None:
+        file_format = "csv" if str(source).lower().endswith(".csv") else "parquet"
+    if file_format == "csv":
+        df = pd.read_csv(source)
+    else:
+        df = pd.read_parquet(source)
+    return clean_price_frame(df)
+
+# Byte positions of the digits and separators in a 'dd.mm.YYYY HH:MM:SS' timestamp
+LOCAL_TIME_DIGITS = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]
+LOCAL_TIME_SEPARATORS = {2: b'.', 5: b'.', 10: b' ', 13: b':', 16: b':'}
+
+# Function to parse 'dd.mm.YYYY HH:MM:SS' strings (with milliseconds=True 'dd.mm.YYYY HH:MM:SS.fff',
+# as in tick files) to datetime64[us] with integer arithmetic instead of strptime.
+# Returns None unless every value is a valid timestamp in exactly that format, so the caller can
+# fall back to pandas (and its error messages) for anything unusual.
+def parse_local_times(values, milliseconds=False):
+    width = 23 if milliseconds else 19
+    try:
+        raw = np.asarray(values, dtype=object).astype(f'S{width + 1}').view(np.uint8).reshape(-1, width + 1)
+    except (UnicodeEncodeError, ValueError, TypeError):
+        return None
+    positions = LOCAL_TIME_DIGITS + ([20, 21, 22] if milliseconds else [])
+    separators = {**LOCAL_TIME_SEPARATORS, 19: b'.'} if milliseconds else LOCAL_TIME_SEPARATORS
+    digits = raw[:, positions].astype(np.int64) - ord('0')
+    if raw[:, width].any() or ((digits < 0) | (digits > 9)).any():
+        return None
+    if any((raw[:, position] != ord(separator)).any() for position, separator in separators.items()):
+        return None
+    day, month = digits[:, 0] * 10 + digits[:, 1], digits[:, 2] * 10 + digits[:, 3]
+    year = digits[:, 4] * 1000 + digits[:, 5] * 100 + digits[:, 6] * 10 + digits[:, 7]
+    hour, minute, second = (digits[:, 8] * 10 + digits[:, 9], digits[:, 10] * 10 + digits[:, 11],
+                            digits[:, 12] * 10 + digits[:, 13])
+    if ((month < 1) | (month > 12) | (hour > 23) | (minute > 59) | (second > 59)).any():
+        return None
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days_in_month = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+    if ((day < 1) | (day > days_in_month)).any():
+        return None
+    millis = ((day - 1) * 86400 + hour * 3600 + minute * 60 + second) * 1000
+    if milliseconds:
+        millis += digits[:, 14] * 100 + digits[:, 15] * 10 + digits[:, 16]
+    return (months.astype('datetime64[ms]') + millis.astype('timedelta64[ms]')).astype('datetime64[us]')
+
+# Function to parse the 'Local time' column of a raw price frame and drop incomplete bars
+def clean_price_frame(df):
+    # Convert 'Local time' column to datetime; well-formed columns take the vectorized parser
+    times = parse_local_times(df['Local time'].to_numpy())
+    if times is not None:
+        df['Local time'] = times
+        return df.dropna(subset=['Open', 'High', 'Low', 'Close'])
+    try:
+        df['Local time'] = pd.to_datetime(df['Local time'], format='%d.%m.%Y %H:%M:%S')
+    except Exception as e:
+        raise ValueError(f"Error parsing 'Local time' column: {e}")
+
+    # Drop rows with NaN values in the 'Open', 'High', 'Low', 'Close' columns
+    return df.dropna(subset=['Open', 'High', 'Low', 'Close'])
+
+# Function to load a parquet or CSV price file into a PriceData index
+def load_price_file(file_path):
+    price_data = PriceData.from_frame(read_price_frame(file_path))
+    price_data.build_extremes()
+    return price_data
+
+# Function to write a PriceData index to a store directory.
+# The store is built in a temporary directory and swapped in, so readers never see a partial store.
+# source_stamp (see source_stamp()) records which version of the source file the store was built from.
+def write_store(price_data, store_path, source=None, dtype=np.float64, source_stamp=None):
+    temp_path = store_path + ".tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    columns = {'minutes': np.ascontiguousarray(price_data.minutes, dtype=np.int64)}
+    for name in STORE_COLUMNS[1:]:
+        columns[name] = np.ascontiguousarray(getattr(price_data, name), dtype=dtype)
+    for name, values in columns.items():
+        np.save(os.path.join(temp_path, f"{name}.npy"), values)
+
+    # Persist the forward-extremes index, built from the prices exactly as stored
+    ForwardExtremes.build(columns['high'], columns['low']).save(temp_path)
+
+    meta = {
+        'format': STORE_FORMAT,
+        'rows': len(price_data),
+        'dtype': np.dtype(dtype).name,
+        'source': source,
+        'source_stamp': source_stamp,
+        'first_minute': int(price_data.minutes[0]) if len(price_data) else None,
+        'last_minute': int(price_data.minutes[-1]) if len(price_data) else None,
+    }
+    with open(os.path.join(temp_path, "meta.json"), "w") as handle:
+        json.dump(meta, handle, indent=2)
+
+    old_path = store_path + ".old"
+    if os.path.exists(store_path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(store_path, old_path)
+    os.rename(temp_path, store_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+# Function to open a store with memory-mapped, read-only arrays.
+# Pages are loaded on demand and shared between processes through the OS page cache.
+def open_store(store_path):
+    with open(os.path.join(store_path, "meta.json")) as handle:
+        meta = json.load(handle)
+    if meta.get('format') != STORE_FORMAT:
+        raise ValueError(f"Unsupported price store format in {store_path}: {meta.get('format')}")
+    arrays = [np.load(os.path.join(store_path, f"{name}.npy"), mmap_mode='r') for name in STORE_COLUMNS]
+    if any(len(values) != meta['rows'] for values in arrays):
+        raise ValueError(f"Price store {store_path} is incomplete: expected {meta['rows']} rows.")
+    price_data = PriceData(*arrays)
+    # Stores written before the index existed get it rebuilt in memory
+    price_data.extremes = ForwardExtremes.load(store_path, price_data.high, price_data.low)
+    if price_data.extremes is None:
+        price_data.build_extremes()
+    return price_data
+
+# Function to convert a parquet or CSV price file into a store next to it, stamped with the file's version
+def convert_to_store(source_path, store_path=None, dtype=np.float64):
+    if store_path is None:
+        store_path = os.path.splitext(source_path)[0] + STORE_SUFFIX
+    stamp = source_stamp(source_path)
+    price_data = load_price_file(source_path)
+    write_store(price_data, store_path, source=os.path.basename(source_path), dtype=dtype, source_stamp=stamp)
+    return store_path
+
+# Function to describe a source file by size and modification time, so a stale cache is noticed
+def source_stamp(source_path):
+    stat = os.stat(source_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+# Function to tell whether a store was built from the current version of a source file
+def store_matches_source(store_path, source_path):
+    try:
+        with open(os.path.join(store_path, "meta.json")) as handle:
+            meta = json.load(handle)
+    except (OSError, ValueError):
+        return False
+    return meta.get('format') == STORE_FORMAT and meta.get('source_stamp') == source_stamp(source_path)
+
+# Function to load a parquet or CSV price file, parsing it only when it changed since the last load.
+# The parsed bars are kept in a store next to the file (source name plus CACHE_SUFFIX) keyed on the
+# file's size and modification time; later loads memory-map that store instead of parsing the text again.
+def load_cached_price_file(source_path, cache_path=None):
+    cache_path = cache_path or source_path + CACHE_SUFFIX
+    stamp = source_stamp(source_path)
+    if store_matches_source(cache_path, source_path):
+        try:
+            return open_store(cache_path)
+        except (OSError, ValueError):
+            pass
+
+    price_data = load_price_file(source_path)
+    try:
+        write_store(price_data, cache_path, source=os.path.basename(source_path), source_stamp=stamp)
+    except OSError:
+        # A read-only data directory only costs parsing the file again on the next load
+        pass
+    return price_data
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a parquet or CSV price file into a memory-mapped price store.")
+    parser.add_argument('source', help="parquet or CSV file with 'Local time', 'Open', 'High', 'Low', 'Close' columns")
+    parser.add_argument('store', nargs='?', help=f"output directory (default: source name with a {STORE_SUFFIX} suffix)")
+    parser.add_argument('--float32', action='store_true',
+                        help="store prices as float32 to halve the size (hit checks then use float32-rounded prices)")
+    args = parser.parse_args()
+
+    store_path = convert_to_store(args.source, args.store, np.float32 if args.float32 else np.float64)
+    print(f"Wrote price store: {store_path}")
@@ -0,0 +1,129 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Price step used to normalize SL/TP prices in cache keys
+DEFAULT_TICK = 0.001
+
+# Function to build a normalized cache key for one trade query.
+# Prices are rounded to the tick so the same trade entered as prices or as pips maps to one key.
+def make_key(entry_minute, trade_type, stoploss_price, takeprofit_price, breakeven, tolerance,
+             dataset_version, tick=DEFAULT_TICK):
+    return "|".join([
+        str(int(entry_minute)),
+        trade_type.lower(),
+        str(round(stoploss_price / tick)),
+        str(round(takeprofit_price / tick)),
+        "1" if breakeven else "0",
+        repr(float(tolerance)),
+        str(dataset_version),
+    ])
+
+# Bounded in-process LRU cache of results, optionally backed by SQLite
+# so entries survive worker restarts and are shared by workers on the same machine.
+# encode/decode convert a result to and from a JSON-serializable value for the disk store;
+# rows that no longer decode (e.g. written by an older version) are treated as misses.
+class ResultCache:
+    def __init__(self, maxsize=1024, path=None, disk_maxsize=100_000, encode=None, decode=None):
+        self.maxsize = maxsize
+        self.disk_maxsize = disk_maxsize
+        self.encode = encode
+        self.decode = decode
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_writes = 0
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False, timeout=5)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS results "
+                               "(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)")
+            self._disk.commit()
+
+    # Function to look up a key, returning None on a miss
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            value = self._disk_get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, value)
+            return value
+
+    # Function to store a result under a key
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+            self._disk_put(key, value)
+
+    # Function to drop every entry from memory and disk
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM results")
+                self._disk.commit()
+
+    # Function to report hit/miss counters for sizing the cache
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'disk': self._disk is not None,
+            }
+
+    # Function to insert into the in-memory LRU, evicting the least recently used entries
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # Function to read a result from the disk store
+    def _disk_get(self, key):
+        if self._disk is None:
+            return None
+        row = self._disk.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._disk.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        value = json.loads(row[0])
+        if self.decode is not None:
+            try:
+                value = self.decode(value)
+            except (TypeError, KeyError, ValueError):
+                self._disk.execute("DELETE FROM results WHERE key = ?", (key,))
+                value = None
+        self._disk.commit()
+        return value
+
+    # Function to write a result to the disk store, pruning the oldest rows past disk_maxsize
+    def _disk_put(self, key, value):
+        if self._disk is None:
+            return
+        self._disk_writes += 1
+        self._disk.execute("INSERT OR REPLACE INTO results (key, value, used) VALUES (?, ?, ?)",
+                           (key, json.dumps(value if self.encode is None else self.encode(value)), time.time()))
+        if self._disk_writes % 1000 == 0:
+            self._disk.execute("DELETE FROM results WHERE key NOT IN "
+                               "(SELECT key FROM results ORDER BY used DESC LIMIT ?)", (self.disk_maxsize,))
+        self._disk.commit()
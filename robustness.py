@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch import LocatedTrades, load_trades_file, locate_trades
+from portfolio import EXIT_SYSTEMS, resolve_exits
+from price_store import open_store
+from sweep import resolve_store_path
+from tick_store import TickStore
+from timeframes import TIMEFRAMES
+
+# Ways of drawing robustness samples from a set of resolved trades:
+#   bootstrap - resample the trades' R multiples with replacement
+#   shuffle   - reorder the same R multiples (expectancy is fixed; drawdown and streaks vary)
+#   jitter    - move every entry by up to entry_jitter minutes and scale its SL/TP distances by up to
+#               distance_jitter either way, then resolve the perturbed trades again
+ROBUSTNESS_METHODS = ('bootstrap', 'shuffle', 'jitter')
+
+# Figures computed for every sample
+SAMPLE_METRICS = ('expectancy', 'total_r', 'win_rate', 'max_drawdown_r', 'max_losing_streak')
+
+# Percentiles reported for each figure's distribution
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Upper bound on the (sample, trade) cells handled per block; blocks are the unit of work of a process
+MAX_BLOCK_CELLS = 1 << 16
+
+# Resolved trades and price data shared by every block run in a worker process
+_worker_state = {}
+
+# Settings of a robustness run: the sampling method, how many samples to draw and the exit system
+# the trades are resolved with. seed makes runs repeatable whatever the number of processes.
+class RobustnessSettings:
+    def __init__(self, method='bootstrap', samples=1000, system='sl_tp', seed=None, entry_jitter=0,
+                 distance_jitter=0.0):
+        if method not in ROBUSTNESS_METHODS:
+            raise ValueError(f"Method must be one of: {', '.join(ROBUSTNESS_METHODS)}.")
+        if system not in EXIT_SYSTEMS:
+            raise ValueError(f"Exit system must be one of: {', '.join(EXIT_SYSTEMS)}.")
+        if not 1 <= samples <= 1_000_000:
+            raise ValueError("Samples must be between 1 and 1000000.")
+        if entry_jitter < 0:
+            raise ValueError("Entry jitter must not be negative.")
+        if not 0 <= distance_jitter < 1:
+            raise ValueError("Distance jitter must be a fraction between 0 and 1.")
+        if method == 'jitter' and not (entry_jitter or distance_jitter):
+            raise ValueError("The jitter method needs an entry_jitter or a distance_jitter.")
+        self.method = method
+        self.samples = int(samples)
+        self.system = system
+        self.seed = None if seed is None else int(seed)
+        self.entry_jitter = int(entry_jitter)
+        self.distance_jitter = float(distance_jitter)
+
+    # Function to read the settings from a request body, raising ValueError on invalid input
+    @classmethod
+    def from_payload(cls, payload):
+        seed = payload.get('seed')
+        return cls(method=str(payload.get('method', 'bootstrap')).strip().lower(),
+                   samples=int(payload.get('samples', 1000)),
+                   system=str(payload.get('system', 'sl_tp')).strip().lower(),
+                   seed=int(seed) if seed not in (None, '') else None,
+                   entry_jitter=int(payload.get('entry_jitter', 0)),
+                   distance_jitter=float(payload.get('distance_jitter', 0.0)))
+
+    # Function to describe the settings for a report
+    def to_dict(self):
+        return {'method': self.method, 'samples': self.samples, 'system': self.system, 'seed': self.seed,
+                'entry_jitter': self.entry_jitter, 'distance_jitter': self.distance_jitter}
+
+# Function to get the R multiple of every located trade under an exit system, NaN where it is invalid or never exits
+def r_multiples(price_data, located, system, tolerance, pip_size, intrabar=None):
+    _, exit_index, exit_price = resolve_exits(price_data, located, system, tolerance, pip_size, intrabar)
+    direction = np.where(located.is_buy, 1.0, -1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_values = (exit_price - located.entry_price) * direction / np.abs(located.entry_price - located.stoploss)
+    return np.where(located.valid & (exit_index >= 0), r_values, np.nan)
+
+# Function to compute the SAMPLE_METRICS of every row of an (samples, trades) matrix of R multiples.
+# Trades run in column order; trades that never exit (NaN) are left out of expectancy and win rate
+# and count as flat in the drawdown and losing streaks.
+def sample_metrics(r_matrix):
+    resolved = ~np.isnan(r_matrix)
+    values = np.where(resolved, r_matrix, 0.0)
+    counts = resolved.sum(axis=1)
+    total = values.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expectancy = np.where(counts > 0, total / counts, np.nan)
+        win_rate = np.where(counts > 0, (values > 0).sum(axis=1) / counts, np.nan)
+
+    # Drawdown from the running peak of cumulative R, starting from a flat account
+    equity = np.cumsum(values, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), 0.0)
+    drawdown = (peak - equity).max(axis=1, initial=0.0)
+
+    # Longest run of losses: the loss count minus its value at the latest non-loss
+    losing = values < 0
+    losses_so_far = np.cumsum(losing, axis=1)
+    at_last_break = np.maximum.accumulate(np.where(losing, 0, losses_so_far), axis=1)
+    streak = (losses_so_far - at_last_break).max(axis=1, initial=0)
+    return {'expectancy': expectancy, 'total_r': total, 'win_rate': win_rate, 'max_drawdown_r': drawdown,
+            'max_losing_streak': streak.astype(np.float64)}
+
+# Function to describe a distribution of sample values by mean, spread and percentiles (None when all are NaN)
+def summarize_distribution(values):
+    values = values[~np.isnan(values)]
+    if not values.size:
+        return None
+    summary = {'mean': float(values.mean()), 'std': float(values.std()), 'min': float(values.min())}
+    summary.update({f'p{q}': float(value) for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))})
+    summary['max'] = float(values.max())
+    return summary
+
+# Function to draw one block of samples and compute their metrics.
+# state holds the baseline R multiples ('r_multiples') and, for jitter, the price data, the located
+# valid trades and the resolution settings. Returns {metric: array of one value per sample}.
+def run_block(state, settings, samples, seed):
+    rng = np.random.default_rng(seed)
+    base = state['r_multiples']
+    count = len(base)
+    if settings.method == 'bootstrap':
+        r_matrix = base[rng.integers(0, count, (samples, count))]
+    elif settings.method == 'shuffle':
+        r_matrix = base[rng.permuted(np.tile(np.arange(count), (samples, 1)), axis=1)]
+    else:
+        r_matrix = _jittered_r_multiples(state, settings, samples, rng)
+    return sample_metrics(r_matrix)
+
+# Function to resolve `samples` perturbed copies of the trades and get their R multiples.
+# Each entry moves by a whole number of minutes in [-entry_jitter, entry_jitter] to the first bar at
+# or after the new time, and enters at that bar's close; SL and TP distances are scaled independently.
+def _jittered_r_multiples(state, settings, samples, rng):
+    price_data, trades = state['price_data'], state['trades']
+    shape = (samples, len(trades.entry_minutes))
+    minutes = trades.entry_minutes + rng.integers(-settings.entry_jitter, settings.entry_jitter + 1, shape)
+    positions = np.searchsorted(price_data.minutes, minutes.ravel(), side='left')
+    found = positions + 1 < len(price_data)
+    positions = np.where(found, positions, 0)
+    entry_price = np.where(found, price_data.close[positions], np.nan)
+
+    is_buy = np.tile(trades.is_buy, samples)
+    direction = np.where(is_buy, 1.0, -1.0)
+    scale = settings.distance_jitter
+    stoploss_distance = np.tile(np.abs(trades.entry_price - trades.stoploss), samples) * rng.uniform(1 - scale, 1 + scale, shape).ravel()
+    takeprofit_distance = np.tile(np.abs(trades.takeprofit - trades.entry_price), samples) * rng.uniform(1 - scale, 1 + scale, shape).ravel()
+    errors = np.where(found, None, "No data available after the jittered entry time.").tolist()
+    located = LocatedTrades(minutes.ravel(), positions, positions + 1, entry_price,
+                            entry_price - direction * stoploss_distance, entry_price + direction * takeprofit_distance,
+                            is_buy, np.tile(trades.breakeven, samples), errors)
+    r_values = r_multiples(price_data, located, settings.system, state['tolerance'], state['pip_size'], state['intrabar'])
+    return r_values.reshape(shape)
+
+# Function to set up a worker: the store is memory-mapped, so workers share its pages instead of copying the data
+def _init_worker(store_path, tick_path, state):
+    _worker_state.update(state)
+    if store_path is not None:
+        _worker_state['price_data'] = open_store(store_path)
+    _worker_state['intrabar'] = TickStore(tick_path).path if tick_path else None
+
+# Function to run one block inside a worker
+def _run_block_in_worker(task):
+    settings, samples, seed = task
+    return run_block(_worker_state, settings, samples, seed)
+
+# Function to split a run into blocks of samples, each with its own seed drawn from the run's seed,
+# so the samples are the same however the blocks are spread over processes
+def _blocks(settings, trade_count):
+    per_block = max(1, MAX_BLOCK_CELLS // max(trade_count, 1))
+    sizes = [min(per_block, settings.samples - start) for start in range(0, settings.samples, per_block)]
+    return list(zip(sizes, np.random.SeedSequence(settings.seed).spawn(len(sizes))))
+
+# Function to run a robustness analysis of parsed trades.
+# The trades are resolved once for the baseline; samples are then drawn in blocks, in this process
+# or, with max_workers > 1, across a process pool (jitter re-resolves trades, so its workers open
+# store_path, a price store of the same data, and tick_path when intrabar resolution is used).
+# on_block is called with the number of samples finished after each block (e.g. to report progress).
+# Returns {'settings', 'trades', 'resolved', 'baseline', 'distributions'} and, with include_samples,
+# the per-sample values of every metric.
+def run_robustness(price_data, trades, settings=None, tolerance=0.1, pip_size=0.1, timeframe='M1', intrabar=None,
+                   max_workers=1, store_path=None, tick_path=None, on_block=None, include_samples=False):
+    settings = settings or RobustnessSettings()
+    located = locate_trades(price_data, trades, pip_size, timeframe)
+    base = r_multiples(price_data, located, settings.system, tolerance, pip_size, intrabar)
+    if not located.valid.any():
+        raise ValueError("None of the trades could be resolved against the data.")
+    # Valid trades in entry order, so drawdowns and streaks follow the order the trades were taken
+    valid = np.flatnonzero(located.valid)
+    valid = valid[np.argsort(located.entry_minutes[valid], kind='stable')]
+    state = {
+        'r_multiples': base[valid],
+        'trades': LocatedTrades(located.entry_minutes[valid], located.positions[valid], located.starts[valid],
+                                located.entry_price[valid], located.stoploss[valid], located.takeprofit[valid],
+                                located.is_buy[valid], located.breakeven[valid], [None] * len(valid)),
+        'tolerance': tolerance,
+        'pip_size': pip_size,
+    }
+
+    blocks = _blocks(settings, len(valid))
+    results = []
+    done = 0
+    if max_workers > 1 and (settings.method != 'jitter' or store_path):
+        initargs = (store_path if settings.method == 'jitter' else None, tick_path, state)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs) as executor:
+            for (samples, _), result in zip(blocks, executor.map(_run_block_in_worker,
+                                                                  [(settings, samples, seed) for samples, seed in blocks])):
+                results.append(result)
+                done += samples
+                if on_block:
+                    on_block(done)
+    else:
+        state.update(price_data=price_data, intrabar=intrabar)
+        for samples, seed in blocks:
+            results.append(run_block(state, settings, samples, seed))
+            done += samples
+            if on_block:
+                on_block(done)
+
+    values = {name: np.concatenate([result[name] for result in results]) for name in SAMPLE_METRICS}
+    baseline = sample_metrics(state['r_multiples'][None, :])
+    report = {
+        'settings': settings.to_dict(),
+        'trades': len(located),
+        'resolved': int((~np.isnan(state['r_multiples'])).sum()),
+        'baseline': {name: None if np.isnan(value[0]) else float(value[0]) for name, value in baseline.items()},
+        'distributions': {name: summarize_distribution(values[name]) for name in SAMPLE_METRICS},
+    }
+    if include_samples:
+        report['samples'] = {name: [None if np.isnan(value) else float(value) for value in values[name]]
+                             for name in SAMPLE_METRICS}
+    return report
+
+# Function to format one table cell
+def _format_cell(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+# Function to print the distributions of a report as an aligned text table
+def print_report(report):
+    columns = ['metric', 'baseline', 'mean', 'std', 'min'] + [f'p{q}' for q in PERCENTILES] + ['max']
+    rows = []
+    for name in SAMPLE_METRICS:
+        summary = report['distributions'][name] or {}
+        rows.append([name, _format_cell(report['baseline'][name])] + [_format_cell(summary.get(column)) for column in columns[2:]])
+    widths = [max([len(column)] + [len(row[i]) for row in rows]) for i, column in enumerate(columns)]
+    print(f"{report['settings']['method']}: {report['settings']['samples']} samples of "
+          f"{report['resolved']} resolved trades ({report['trades']} given)")
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bootstrap, shuffle or jitter resolved trades and report the spread of "
+                                                 "expectancy, drawdown and losing streaks.")
+    parser.add_argument('data', help="price store directory, or a parquet/CSV file (converted to a store next to it)")
+    parser.add_argument('trades', help=".json or .csv file of trades (same fields as the batch endpoint)")
+    parser.add_argument('--method', choices=ROBUSTNESS_METHODS, default='bootstrap', help="sampling method (default: bootstrap)")
+    parser.add_argument('--samples', type=int, default=1000, help="number of samples (default: 1000)")
+    parser.add_argument('--system', choices=EXIT_SYSTEMS, default='sl_tp', help="exit system (default: sl_tp)")
+    parser.add_argument('--seed', type=int, help="random seed, for repeatable runs")
+    parser.add_argument('--entry-jitter', type=int, default=0, help="jitter: largest entry shift in minutes (default: 0)")
+    parser.add_argument('--distance-jitter', type=float, default=0.0,
+                        help="jitter: largest relative change of the SL/TP distances, e.g. 0.1 (default: 0)")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="price tolerance used for SL/TP hits (default: 0.1)")
+    parser.add_argument('--pip-size', type=float, default=0.1, help="price move of one pip (default: 0.1, as for XAUUSD)")
+    parser.add_argument('--timeframe', type=str.upper, choices=list(TIMEFRAMES), default='M1',
+                        help="timeframe of the entry bars; exits are still resolved on M1 (default: M1)")
+    parser.add_argument('--ticks', help="tick store directory used to settle M1 bars that reach several levels")
+    parser.add_argument('--workers', type=int, help="number of worker processes (default: CPU count)")
+    parser.add_argument('--format', choices=['table', 'json'], default='table')
+    parser.add_argument('--include-samples', action='store_true', help="json: include every sample's values")
+    args = parser.parse_args()
+
+    try:
+        trades = load_trades_file(args.trades)
+        settings = RobustnessSettings(args.method, args.samples, args.system, args.seed, args.entry_jitter,
+                                      args.distance_jitter)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Invalid input: {e}")
+    store_path = resolve_store_path(args.data)
+    try:
+        report = run_robustness(open_store(store_path), trades, settings, args.tolerance, args.pip_size, args.timeframe,
+                                TickStore(args.ticks).path if args.ticks else None,
+                                max_workers=args.workers or os.cpu_count() or 1, store_path=store_path,
+                                tick_path=args.ticks, include_samples=args.include_samples)
+    except ValueError as e:
+        sys.exit(f"Invalid input: {e}")
+    if args.format == 'json':
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
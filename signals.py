@@ -0,0 +1,313 @@
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from batch import parse_flag, resolve_trades
+from outcomes import write_csv
+from symbols import Symbol, load_symbol_data
+from sweep import summarize_r
+from tick_store import TickStore
+from timeframes import TIMEFRAMES, parse_timeframe, timeframe_cache
+
+# Entry rules a strategy can use:
+#   session_breakout: the first close of the day beyond the high/low of the opening range
+#                     (the bars from session_open for range_minutes), until session_end
+#   ma_cross:         a fast simple moving average of the closes crossing the slow one
+#   time_of_day:      one entry in a fixed direction at the same time every day
+STRATEGIES = ('session_breakout', 'ma_cross', 'time_of_day')
+
+# Stop loss rules: a fixed distance in pips, or a multiple of the average true range at the signal bar
+SL_MODES = ('pips', 'atr')
+
+# Columns of the generated trades, in the format the batch endpoint and trades files use
+TRADE_FIELDS = ['entry_time', 'trade_type', 'stoploss_pips', 'takeprofit_pips', 'breakeven']
+
+# Function to read an 'HH:MM' time of day as minutes after midnight, raising ValueError otherwise
+def _minute_of_day(text, name):
+    try:
+        hour, minute = (int(part) for part in str(text).split(':'))
+    except ValueError:
+        raise ValueError(f"{name} must be a time of day as HH:MM.")
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError(f"{name} must be a time of day as HH:MM.")
+    return hour * 60 + minute
+
+# Settings of a strategy backtest. Signals are computed on the bars of timeframe (entries are
+# the bar open times and trades enter at the bar's close, as batch entries on that timeframe);
+# exits are resolved on M1. The SL sits sl_pips from the entry, or atr_multiple times the
+# atr_period-bar average true range; the TP sits tp_pips away, or rr times the SL distance.
+class StrategySettings:
+    def __init__(self, strategy='session_breakout', timeframe='M15', session_open='08:00', range_minutes=60,
+                 session_end='23:59', fast=20, slow=50, entry_time='08:00', direction='buy', sl_mode='pips',
+                 sl_pips=50.0, atr_period=14, atr_multiple=1.5, rr=2.0, tp_pips=None, breakeven=True):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Strategy must be one of: {', '.join(STRATEGIES)}.")
+        self.strategy = strategy
+        self.timeframe = parse_timeframe(timeframe)
+        size = TIMEFRAMES[self.timeframe]
+
+        self.session_open = session_open
+        self.session_end = session_end
+        self.range_minutes = int(range_minutes)
+        self.open_minute = _minute_of_day(session_open, "Session open")
+        self.end_minute = _minute_of_day(session_end, "Session end") + 1
+        if self.range_minutes < 1:
+            raise ValueError("Range minutes must be at least 1.")
+        if self.open_minute + self.range_minutes >= self.end_minute:
+            raise ValueError("The opening range must end before the session end.")
+
+        self.fast = int(fast)
+        self.slow = int(slow)
+        if not 1 <= self.fast < self.slow:
+            raise ValueError("Moving averages need 1 <= fast < slow periods.")
+
+        self.entry_time = entry_time
+        self.entry_minute = _minute_of_day(entry_time, "Entry time")
+        if direction not in ['buy', 'sell']:
+            raise ValueError("Direction must be 'buy' or 'sell'.")
+        self.direction = direction
+
+        # Times must fall on bar starts of the signal timeframe, or no bar would match them
+        if strategy == 'session_breakout' and (self.open_minute % size or self.range_minutes % size):
+            raise ValueError(f"Session open and range minutes must be multiples of the {self.timeframe} bar length.")
+        if strategy == 'time_of_day' and self.entry_minute % size:
+            raise ValueError(f"Entry time must fall on a {self.timeframe} bar start.")
+
+        if sl_mode not in SL_MODES:
+            raise ValueError(f"SL mode must be one of: {', '.join(SL_MODES)}.")
+        if not sl_pips > 0:
+            raise ValueError("SL pips must be positive.")
+        if int(atr_period) < 1 or not atr_multiple > 0:
+            raise ValueError("ATR period must be at least 1 and the ATR multiple positive.")
+        if not rr > 0 or (tp_pips is not None and not tp_pips > 0):
+            raise ValueError("RR and TP pips must be positive.")
+        self.sl_mode = sl_mode
+        self.sl_pips = float(sl_pips)
+        self.atr_period = int(atr_period)
+        self.atr_multiple = float(atr_multiple)
+        self.rr = float(rr)
+        self.tp_pips = None if tp_pips is None else float(tp_pips)
+        self.breakeven = bool(breakeven)
+
+    # Function to read the settings from a request body, raising ValueError on invalid input
+    @classmethod
+    def from_payload(cls, payload):
+        tp_pips = payload.get('tp_pips')
+        return cls(strategy=str(payload.get('strategy', 'session_breakout')).strip().lower(),
+                   timeframe=payload.get('timeframe', 'M15'),
+                   session_open=payload.get('session_open', '08:00'),
+                   range_minutes=int(payload.get('range_minutes', 60)),
+                   session_end=payload.get('session_end', '23:59'),
+                   fast=int(payload.get('fast', 20)),
+                   slow=int(payload.get('slow', 50)),
+                   entry_time=payload.get('entry_time', '08:00'),
+                   direction=str(payload.get('direction', 'buy')).strip().lower(),
+                   sl_mode=str(payload.get('sl_mode', 'pips')).strip().lower(),
+                   sl_pips=float(payload.get('sl_pips', 50.0)),
+                   atr_period=int(payload.get('atr_period', 14)),
+                   atr_multiple=float(payload.get('atr_multiple', 1.5)),
+                   rr=float(payload.get('rr', 2.0)),
+                   tp_pips=float(tp_pips) if tp_pips not in (None, '') else None,
+                   breakeven=parse_flag(payload.get('breakeven', True)))
+
+    # Function to describe the settings the strategy actually uses
+    def to_dict(self):
+        settings = {'strategy': self.strategy, 'timeframe': self.timeframe}
+        if self.strategy == 'session_breakout':
+            settings.update(session_open=self.session_open, range_minutes=self.range_minutes, session_end=self.session_end)
+        elif self.strategy == 'ma_cross':
+            settings.update(fast=self.fast, slow=self.slow)
+        else:
+            settings.update(entry_time=self.entry_time, direction=self.direction)
+        settings['sl_mode'] = self.sl_mode
+        if self.sl_mode == 'pips':
+            settings['sl_pips'] = self.sl_pips
+        else:
+            settings.update(atr_period=self.atr_period, atr_multiple=self.atr_multiple)
+        settings.update(rr=self.rr, tp_pips=self.tp_pips, breakeven=self.breakeven)
+        return settings
+
+# Entry signals of a strategy as arrays: entry bar open times (epoch minutes), side, and the
+# SL/TP distances in pips, one per signal in time order
+class Signals:
+    def __init__(self, entry_minutes, is_buy, stoploss_pips, takeprofit_pips, breakeven):
+        self.entry_minutes = entry_minutes
+        self.is_buy = is_buy
+        self.stoploss_pips = stoploss_pips
+        self.takeprofit_pips = takeprofit_pips
+        self.breakeven = breakeven
+
+    def __len__(self):
+        return len(self.entry_minutes)
+
+    # Function to turn the signals into parsed trades (see batch.parse_trade) for the trade resolvers
+    def trades(self):
+        entry_times = pd.to_datetime(self.entry_minutes, unit='m')
+        sides = np.where(self.is_buy, 'buy', 'sell').tolist()
+        return [{'entry_time': entry_time, 'trade_type': side, 'stoploss_price': None, 'takeprofit_price': None,
+                 'stoploss_pips': stoploss_pips, 'takeprofit_pips': takeprofit_pips, 'breakeven': self.breakeven}
+                for entry_time, side, stoploss_pips, takeprofit_pips
+                in zip(entry_times, sides, self.stoploss_pips.tolist(), self.takeprofit_pips.tolist())]
+
+    # Function to describe the signals as trade records with the TRADE_FIELDS columns
+    def to_records(self):
+        entry_text = np.datetime_as_string(self.entry_minutes.astype('datetime64[m]')).tolist()
+        return [dict(trade, entry_time=text) for trade, text in zip(self.trades(), entry_text)]
+
+# Function to find the first close beyond the opening range of each day.
+# The range high/low comes from one reduceat over the range bars grouped by day; every later bar of
+# the session is compared with its day's range at once. Returns (signal bar positions, is_buy).
+def session_breakout_signals(bars, open_minute, range_minutes, end_minute):
+    minutes = np.asarray(bars.minutes)
+    day, minute_of_day = minutes // 1440, minutes % 1440
+    in_range = np.flatnonzero((minute_of_day >= open_minute) & (minute_of_day < open_minute + range_minutes))
+    if in_range.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    range_days, first = np.unique(day[in_range], return_index=True)
+    range_high = np.fmax.reduceat(np.asarray(bars.high, dtype=np.float64)[in_range], first)
+    range_low = np.fmin.reduceat(np.asarray(bars.low, dtype=np.float64)[in_range], first)
+
+    candidates = np.flatnonzero((minute_of_day >= open_minute + range_minutes) & (minute_of_day < end_minute))
+    slot = np.minimum(np.searchsorted(range_days, day[candidates]), len(range_days) - 1)
+    has_range = range_days[slot] == day[candidates]
+    candidates, slot = candidates[has_range], slot[has_range]
+    close = np.asarray(bars.close, dtype=np.float64)[candidates]
+    up, down = close > range_high[slot], close < range_low[slot]
+    breaks, is_buy = candidates[up | down], up[up | down]
+    _, first_break = np.unique(day[breaks], return_index=True)
+    return breaks[first_break], is_buy[first_break]
+
+# Function to find the bars where the fast simple moving average crosses the slow one.
+# Returns (signal bar positions, is_buy): buy on a cross above, sell on a cross below.
+def ma_cross_signals(bars, fast, slow):
+    close = pd.Series(np.asarray(bars.close, dtype=np.float64))
+    spread = (close.rolling(fast).mean() - close.rolling(slow).mean()).to_numpy()
+    # NaN spreads before the slow average is complete compare False, so no cross fires there
+    up = (spread[1:] > 0) & (spread[:-1] <= 0)
+    down = (spread[1:] < 0) & (spread[:-1] >= 0)
+    positions = np.flatnonzero(up | down)
+    return positions + 1, up[positions]
+
+# Function to find the bar starting at a fixed time of day, every day.
+# Returns (signal bar positions, is_buy) with every signal in the given direction.
+def time_of_day_signals(bars, entry_minute, direction):
+    positions = np.flatnonzero(np.asarray(bars.minutes) % 1440 == entry_minute)
+    return positions, np.full(len(positions), direction == 'buy')
+
+# Function to compute the average true range of each bar over the last period bars (NaN until complete)
+def average_true_range(bars, period):
+    high = np.asarray(bars.high, dtype=np.float64)
+    low = np.asarray(bars.low, dtype=np.float64)
+    close = np.asarray(bars.close, dtype=np.float64)
+    previous_close = np.concatenate([[np.nan], close[:-1]])
+    # fmax skips the missing previous close of the first bar
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - previous_close), np.abs(low - previous_close)))
+    return pd.Series(true_range).rolling(period).mean().to_numpy()
+
+# Function to compute the entry signals of a strategy over the whole price history.
+# pip_size is the price move of one pip for the symbol (0.1 for XAUUSD). Signals whose ATR is not
+# available yet (the first atr_period bars) are dropped.
+def generate_signals(price_data, settings, pip_size=0.1):
+    bars = price_data if settings.timeframe == 'M1' else timeframe_cache.get(price_data, settings.timeframe).price_data
+    if settings.strategy == 'session_breakout':
+        positions, is_buy = session_breakout_signals(bars, settings.open_minute, settings.range_minutes, settings.end_minute)
+    elif settings.strategy == 'ma_cross':
+        positions, is_buy = ma_cross_signals(bars, settings.fast, settings.slow)
+    else:
+        positions, is_buy = time_of_day_signals(bars, settings.entry_minute, settings.direction)
+
+    if settings.sl_mode == 'atr':
+        pips_per_unit = 1 / pip_size
+        stoploss_pips = average_true_range(bars, settings.atr_period)[positions] * settings.atr_multiple * pips_per_unit
+        ready = stoploss_pips > 0
+        positions, is_buy, stoploss_pips = positions[ready], is_buy[ready], stoploss_pips[ready]
+    else:
+        stoploss_pips = np.full(len(positions), settings.sl_pips)
+    takeprofit_pips = np.full(len(positions), settings.tp_pips) if settings.tp_pips is not None else stoploss_pips * settings.rr
+    entry_minutes = np.asarray(bars.minutes)[positions].astype(np.int64)
+    return Signals(entry_minutes, is_buy, stoploss_pips, takeprofit_pips, settings.breakeven)
+
+# Function to backtest a strategy: generate its signals over the whole history and resolve them all
+# in one vectorized pass (see batch.resolve_trades).
+# intrabar is an optional tick source (TickStore.path) settling M1 bars that reach several levels.
+# With block_trades the signals are resolved that many at a time, and on_block is called with
+# (signals resolved, total signals) after each block (e.g. to report progress).
+# Returns {'settings', 'summary', 'results'}; the summary aggregates the R multiples of both exit systems.
+def backtest_strategy(price_data, settings=None, tolerance=0.1, pip_size=0.1, intrabar=None, block_trades=None,
+                      on_block=None):
+    settings = settings or StrategySettings()
+    signals = generate_signals(price_data, settings, pip_size)
+    trades = signals.trades()
+    block_trades = block_trades or max(len(trades), 1)
+    results = []
+    for offset in range(0, len(trades), block_trades):
+        results.extend(resolve_trades(price_data, trades[offset:offset + block_trades], tolerance, pip_size,
+                                      settings.timeframe, intrabar))
+        if on_block:
+            on_block(len(results), len(trades))
+
+    def r_multiples(name):
+        return np.array([np.nan if record.get(name) is None else record[name] for record in results], dtype=np.float64)
+
+    summary = {
+        'signals': len(signals),
+        'buys': int(signals.is_buy.sum()),
+        'sells': int(len(signals) - signals.is_buy.sum()),
+        'unresolvable': sum(1 for record in results if record['error']),
+        'sl_tp': summarize_r(r_multiples('pnl_r')),
+        '3r': summarize_r(r_multiples('three_r_pnl_r')),
+    }
+    return {'settings': settings.to_dict(), 'summary': summary, 'results': results}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate strategy entries over a whole price history and backtest them.")
+    parser.add_argument('data', help="price store directory, or a parquet/CSV file of M1 bars")
+    parser.add_argument('--strategy', choices=STRATEGIES, default='session_breakout', help="entry rule (default: session_breakout)")
+    parser.add_argument('--timeframe', type=str.upper, choices=list(TIMEFRAMES), default='M15',
+                        help="timeframe of the signal bars; exits are resolved on M1 (default: M15)")
+    parser.add_argument('--session-open', default='08:00', help="session_breakout: start of the opening range (default: 08:00)")
+    parser.add_argument('--range-minutes', type=int, default=60, help="session_breakout: length of the opening range (default: 60)")
+    parser.add_argument('--session-end', default='23:59', help="session_breakout: last bar that may break out (default: 23:59)")
+    parser.add_argument('--fast', type=int, default=20, help="ma_cross: fast average period in bars (default: 20)")
+    parser.add_argument('--slow', type=int, default=50, help="ma_cross: slow average period in bars (default: 50)")
+    parser.add_argument('--entry-time', default='08:00', help="time_of_day: bar to enter at (default: 08:00)")
+    parser.add_argument('--direction', choices=['buy', 'sell'], default='buy', help="time_of_day: side of every entry (default: buy)")
+    parser.add_argument('--sl-mode', choices=SL_MODES, default='pips', help="SL from fixed pips or from the ATR (default: pips)")
+    parser.add_argument('--sl-pips', type=float, default=50.0, help="SL distance in pips (default: 50)")
+    parser.add_argument('--atr-period', type=int, default=14, help="ATR period in signal bars (default: 14)")
+    parser.add_argument('--atr-multiple', type=float, default=1.5, help="SL distance in ATRs (default: 1.5)")
+    parser.add_argument('--rr', type=float, default=2.0, help="TP distance as a multiple of the SL distance (default: 2)")
+    parser.add_argument('--tp-pips', type=float, help="fixed TP distance in pips instead of --rr")
+    parser.add_argument('--no-breakeven', action='store_true', help="trade the 3R system without moving the SL to breakeven")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="price tolerance used for SL/TP hits (default: 0.1)")
+    parser.add_argument('--pip-size', type=float, default=0.1, help="price move of one pip (default: 0.1, as for XAUUSD)")
+    parser.add_argument('--ticks', help="tick store directory used to settle M1 bars that reach several levels")
+    parser.add_argument('--format', choices=['summary', 'json', 'csv', 'trades'], default='summary',
+                        help="summary; json (summary and every result); csv (results); "
+                             "trades (the generated entries as a trades file for portfolio.py or robustness.py)")
+    args = parser.parse_args()
+
+    try:
+        settings = StrategySettings(args.strategy, args.timeframe, args.session_open, args.range_minutes, args.session_end,
+                                    args.fast, args.slow, args.entry_time, args.direction, args.sl_mode, args.sl_pips,
+                                    args.atr_period, args.atr_multiple, args.rr, args.tp_pips, not args.no_breakeven)
+    except ValueError as e:
+        sys.exit(f"Invalid input: {e}")
+    price_data = load_symbol_data(Symbol("DATA", args.data, pip_size=args.pip_size, tolerance=args.tolerance))
+
+    if args.format == 'trades':
+        writer = csv.DictWriter(sys.stdout, fieldnames=TRADE_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(generate_signals(price_data, settings, args.pip_size).to_records())
+        sys.exit()
+    intrabar = TickStore(args.ticks).path if args.ticks else None
+    result = backtest_strategy(price_data, settings, args.tolerance, args.pip_size, intrabar)
+    if args.format == 'csv':
+        write_csv(result['results'], sys.stdout)
+    else:
+        print(json.dumps({'settings': result['settings'], 'summary': result['summary']} if args.format == 'summary' else result,
+                         indent=2))
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch import parse_flag, parse_entry, parse_trades, read_trade_records
+from hit_search import HIT_BREAKEVEN, HIT_SL, HIT_THREE_R, find_three_r_hits
+from price_data import to_epoch_minutes_array
+from price_store import STORE_SUFFIX, convert_to_store, open_store, store_matches_source
+
+# Parameters that make up one cell of the sweep grid
+GRID_KEYS = ('sl_pips', 'rr', 'breakeven', 'tolerance')
+
+# Columns of the aggregated table, after the grid parameters
+SUMMARY_KEYS = ('trades', 'open', 'wins', 'losses', 'breakevens', 'win_rate', 'expectancy',
+                'avg_win_r', 'avg_loss_r', 'total_r')
+
+# Price data and located entries shared by every task run in a worker process
+_worker_state = {}
+
+# Function to expand lists of parameter values into every grid cell
+def expand_grid(sl_pips, rr, breakeven=(True,), tolerance=(0.1,)):
+    return [dict(zip(GRID_KEYS, values)) for values in itertools.product(sl_pips, rr, breakeven, tolerance)]
+
+# Function to locate entries in the price data, keeping those with an entry bar and data after it.
+# Returns (entry prices, is_buy flags, positions of the first bar after each entry).
+def locate_entries(price_data, entry_minutes, is_buy):
+    positions, starts = price_data.locate_many(entry_minutes)
+    valid = (positions >= 0) & (starts < len(price_data))
+    return price_data.close[positions[valid]], np.asarray(is_buy)[valid], starts[valid]
+
+# Function to resolve every located entry for one grid cell with the 3R system rules.
+# SL sits sl_pips from the entry close and the target rr times the SL distance away;
+# pip_size is the price move of one pip for the symbol (0.1 for XAUUSD).
+# Returns the R multiple of each entry, NaN where the trade never resolved.
+def resolve_cell(price_data, entries, sl_pips, rr, breakeven, tolerance, pip_size=0.1):
+    entry_price, is_buy, starts = entries
+    pips_per_unit = 1 / pip_size
+    stoploss = np.where(is_buy, entry_price - sl_pips / pips_per_unit, entry_price + sl_pips / pips_per_unit)
+    r_pips = np.abs(stoploss - entry_price) * pips_per_unit
+    target = np.where(is_buy, entry_price + rr * r_pips / pips_per_unit, entry_price - rr * r_pips / pips_per_unit)
+    _, outcome, _ = find_three_r_hits(price_data.high, price_data.low, entry_price, stoploss, target, is_buy,
+                                      breakeven, starts, np.full(len(starts), len(price_data)), tolerance,
+                                      extremes=price_data.extremes)
+    return np.select([outcome == HIT_SL, outcome == HIT_BREAKEVEN, outcome == HIT_THREE_R],
+                     [-1.0, 0.0, float(rr)], np.nan)
+
+# Function to aggregate R multiples into win rate, expectancy and average R figures
+def summarize_r(r_multiples):
+    resolved = r_multiples[~np.isnan(r_multiples)]
+    wins = resolved[resolved > 0]
+    losses = resolved[resolved < 0]
+    return {
+        'trades': int(resolved.size),
+        'open': int(r_multiples.size - resolved.size),
+        'wins': int(wins.size),
+        'losses': int(losses.size),
+        'breakevens': int(resolved.size - wins.size - losses.size),
+        'win_rate': float(wins.size / resolved.size) if resolved.size else None,
+        'expectancy': float(resolved.mean()) if resolved.size else None,
+        'avg_win_r': float(wins.mean()) if wins.size else None,
+        'avg_loss_r': float(losses.mean()) if losses.size else None,
+        'total_r': float(resolved.sum()),
+    }
+
+# Function to set up a worker: the store is memory-mapped, so workers share its pages instead of copying the data
+def _init_worker(store_path, entry_minutes, is_buy, pip_size):
+    price_data = open_store(store_path)
+    _worker_state['price_data'] = price_data
+    _worker_state['pip_size'] = pip_size
+    _worker_state['entries'] = locate_entries(price_data, entry_minutes, is_buy)
+
+# Function to run one grid cell inside a worker
+def _run_cell(cell):
+    r_multiples = resolve_cell(_worker_state['price_data'], _worker_state['entries'],
+                               pip_size=_worker_state['pip_size'], **cell)
+    return dict(cell, **summarize_r(r_multiples))
+
+# Function to run a sweep over a price store for (entry_time, trade_type) entries.
+# Grid cells are sharded across a process pool; results come back in grid order.
+def run_sweep(store_path, entries, grid, max_workers=None, pip_size=0.1):
+    return list(iter_sweep(store_path, entries, grid, max_workers, pip_size))
+
+# Function to run a sweep like run_sweep, yielding each row in grid order as soon as its cell is done
+def iter_sweep(store_path, entries, grid, max_workers=None, pip_size=0.1):
+    entry_minutes = to_epoch_minutes_array([entry_time for entry_time, _ in entries])
+    is_buy = np.array([trade_type == 'buy' for _, trade_type in entries], dtype=bool)
+    workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(grid) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(store_path, entry_minutes, is_buy, pip_size)) as executor:
+        yield from executor.map(_run_cell, grid, chunksize=chunksize)
+
+# Function to find or build the store for a data path (store directory, parquet or CSV file).
+# The store next to a file is rebuilt when it was built from another version of the file.
+def resolve_store_path(data_path):
+    if os.path.isdir(data_path):
+        return data_path
+    store_path = os.path.splitext(data_path)[0] + STORE_SUFFIX
+    if not store_matches_source(store_path, data_path):
+        convert_to_store(data_path, store_path)
+    return store_path
+
+# Function to print sweep results as an aligned text table
+def print_table(rows):
+    columns = GRID_KEYS + SUMMARY_KEYS
+    cells = [[_format_cell(row[column]) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(line[i]) for line in cells]) for i, column in enumerate(columns)]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(value.rjust(width) for value, width in zip(line, widths)))
+
+# Function to format one table cell
+def _format_cell(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sweep SL/RR/breakeven/tolerance grids over a set of trade entries.")
+    parser.add_argument('data', help=f"price store directory, or a parquet/CSV file (converted to a {STORE_SUFFIX} next to it)")
+    parser.add_argument('--entries', required=True, help=".json or .csv file of entries with entry_time and trade_type")
+    parser.add_argument('--sl-pips', type=float, nargs='+', required=True, help="SL distances in pips")
+    parser.add_argument('--rr', type=float, nargs='+', default=[3.0], help="target multiples of the SL distance (default: 3)")
+    parser.add_argument('--breakeven', nargs='+', default=['true'], help="breakeven settings, e.g. true false (default: true)")
+    parser.add_argument('--tolerance', type=float, nargs='+', default=[0.1], help="price tolerances (default: 0.1)")
+    parser.add_argument('--pip-size', type=float, default=0.1, help="price move of one pip (default: 0.1, as for XAUUSD)")
+    parser.add_argument('--workers', type=int, help="number of worker processes (default: CPU count)")
+    parser.add_argument('--format', choices=['table', 'json', 'csv', 'ndjson'], default='table',
+                        help="csv and ndjson print each row as soon as its cell is done (default: table)")
+    args = parser.parse_args()
+
+    try:
+        entries = parse_trades(read_trade_records(args.entries), parse=parse_entry)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Invalid entries file: {e}")
+
+    grid = expand_grid(args.sl_pips, args.rr, [parse_flag(value) for value in args.breakeven], args.tolerance)
+    rows = iter_sweep(resolve_store_path(args.data), entries, grid, args.workers, args.pip_size)
+
+    if args.format == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=GRID_KEYS + SUMMARY_KEYS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            sys.stdout.flush()
+    elif args.format == 'ndjson':
+        for row in rows:
+            print(json.dumps(row), flush=True)
+    elif args.format == 'json':
+        print(json.dumps(list(rows), indent=2))
+    else:
+        print_table(list(rows))
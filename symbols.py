@@ -0,0 +1,211 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from ingest import LiveDataset
+from parquet_scan import ChunkedPriceFile
+from price_store import STORE_SUFFIX, load_price_file, open_store
+from tick_store import TickStore
+from timeframes import SEARCH_INDEXES, TimeframeIndex
+
+# One tradable instrument: where its M1 data lives and how its prices are measured.
+# pip_size is the price move of one pip (0.1 for XAUUSD, 0.0001 for EURUSD), tolerance the
+# price slack used when checking whether a bar reached a level, and digits the decimals shown.
+# With chunked=True a parquet file (or directory of parquet partitions) is scanned row group by
+# row group instead of loaded (see parquet_scan.py); such symbols serve single-trade queries only.
+# tick_path optionally names a tick store (see tick_store.py) used to settle M1 bars that reach
+# several levels by replaying their ticks. search_index picks the index the hit searches use
+# for far-away levels (one of SEARCH_INDEXES).
+class Symbol:
+    def __init__(self, name, data_path, pip_size=0.1, tolerance=0.1, digits=3, ingest_dir=None, chunked=False,
+                 tick_path=None, search_index='pyramid'):
+        self.name = name.upper()
+        self.data_path = data_path
+        self.pip_size = float(pip_size)
+        self.tolerance = float(tolerance)
+        self.digits = int(digits)
+        self.ingest_dir = ingest_dir
+        self.chunked = bool(chunked)
+        self.tick_path = tick_path
+        if self.chunked and ingest_dir:
+            raise ValueError(f"Symbol {self.name} cannot use both chunked scans and an ingest_dir.")
+        self.search_index = str(search_index).strip().lower()
+        if self.search_index not in SEARCH_INDEXES:
+            raise ValueError(f"Symbol {self.name} search_index must be one of: {', '.join(SEARCH_INDEXES)}.")
+
+    # Pips in one unit of price (10 for XAUUSD)
+    @property
+    def pips_per_unit(self):
+        return 1 / self.pip_size
+
+    # Price step used to normalize SL/TP prices in result cache keys
+    @property
+    def tick(self):
+        return self.pip_size / 100
+
+    # Function to build a symbol from a registry file entry
+    @classmethod
+    def from_config(cls, name, config, base_dir="."):
+        if 'data' not in config:
+            raise ValueError(f"Symbol {name} has no 'data' path.")
+        ingest_dir = config.get('ingest_dir')
+        ticks = config.get('ticks')
+        return cls(name, os.path.join(base_dir, config['data']),
+                   pip_size=config.get('pip_size', 0.1),
+                   tolerance=config.get('tolerance', 0.1),
+                   digits=config.get('digits', 3),
+                   ingest_dir=os.path.join(base_dir, ingest_dir) if ingest_dir else None,
+                   chunked=config.get('chunked', False),
+                   tick_path=os.path.join(base_dir, ticks) if ticks else None,
+                   search_index=config.get('search_index', 'pyramid'))
+
+# Function to read a registry file mapping symbol names to their settings, e.g.
+#   {"XAUUSD": {"data": "xauusd_m1.store", "pip_size": 0.1, "tolerance": 0.1, "ticks": "xauusd.ticks"},
+#    "EURUSD": {"data": "eurusd_m1.parquet", "pip_size": 0.0001, "tolerance": 0.00002, "digits": 5,
+#               "search_index": "timeframes"},
+#    "XAGUSD": {"data": "xagusd_partitions", "pip_size": 0.01, "chunked": true}}
+# Relative paths are taken from the registry file's directory.
+def load_symbols_file(path):
+    with open(path) as handle:
+        config = json.load(handle)
+    if not isinstance(config, dict) or not config:
+        raise ValueError(f"Symbols file {path} must be a non-empty JSON object of symbol settings.")
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [Symbol.from_config(name, settings, base_dir) for name, settings in config.items()]
+
+# Function to open a symbol's data: a price store directory is memory-mapped, a parquet or CSV file parsed,
+# and a chunked symbol's parquet data only indexed by row group
+def load_symbol_data(symbol):
+    if symbol.chunked:
+        return ChunkedPriceFile(symbol.data_path)
+    if os.path.isdir(symbol.data_path) or symbol.data_path.endswith(STORE_SUFFIX):
+        return open_store(symbol.data_path)
+    return load_price_file(symbol.data_path)
+
+# Function to count the bytes a dataset keeps in process memory.
+# Memory-mapped arrays are left out: their pages belong to the OS page cache, which can drop them.
+def resident_bytes(dataset):
+    if isinstance(dataset, (LiveDataset, ChunkedPriceFile)):
+        return dataset.nbytes
+    arrays = [dataset.minutes, dataset.open, dataset.high, dataset.low, dataset.close]
+    if dataset.extremes is not None:
+        arrays += [dataset.extremes.high_max, dataset.extremes.low_min]
+    return sum(values.nbytes for values in arrays if not isinstance(values, np.memmap))
+
+# Registry of the symbols one deployment serves.
+# Data is loaded on first use, and the least recently used symbols are evicted once the loaded
+# datasets take more than memory_budget bytes (the symbol in use is always kept). Requests
+# holding a PriceData keep it usable after an eviction; the memory is freed when they finish.
+# With live=True (or a symbol ingest_dir) datasets are wrapped in a LiveDataset so new bars can
+# be appended; chunks in ingest_dir are re-applied when an evicted symbol is loaded again.
+class SymbolRegistry:
+    def __init__(self, symbols, memory_budget=None, default=None, live=False, poll_interval=5.0):
+        self.symbols = OrderedDict((symbol.name, symbol) for symbol in symbols)
+        if not self.symbols:
+            raise ValueError("The symbol registry needs at least one symbol.")
+        self.default = (default or next(iter(self.symbols))).upper()
+        self.memory_budget = memory_budget
+        self.live = live
+        self.poll_interval = poll_interval
+        self.loads = 0
+        self.evictions = 0
+        # Seconds the latest load of each symbol took
+        self.load_seconds = {}
+        self._datasets = OrderedDict()
+        self._tick_stores = {}
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.symbols}
+
+    # Function to look up a symbol by name (the default symbol when name is empty)
+    def symbol(self, name=None):
+        name = (name or self.default).strip().upper()
+        if name not in self.symbols:
+            raise ValueError(f"Unknown symbol: {name}. Available symbols: {', '.join(self.symbols)}.")
+        return self.symbols[name]
+
+    # Function to get (symbol, current PriceData) for a symbol name, loading the data if needed.
+    # A symbol searching over timeframes gets its index attached here, so live snapshots get one too;
+    # the aggregates come from the timeframe cache, which builds them once per dataset version.
+    def get(self, name=None):
+        symbol = self.symbol(name)
+        dataset = self._dataset(symbol)
+        price_data = dataset.price_data if isinstance(dataset, LiveDataset) else dataset
+        if symbol.search_index == 'timeframes' and not symbol.chunked and price_data.search_index is None:
+            price_data.search_index = TimeframeIndex.build(price_data)
+        return symbol, price_data
+
+    # Function to get the LiveDataset of a symbol for appending bars (None unless the symbol is live)
+    def live_dataset(self, name=None):
+        dataset = self._dataset(self.symbol(name))
+        return dataset if isinstance(dataset, LiveDataset) else None
+
+    # Function to get the tick store of a symbol for intrabar resolution (None unless it has one).
+    # Only the store's index is read here; tick days are loaded as bars need them.
+    def tick_store(self, name=None):
+        symbol = self.symbol(name)
+        if not symbol.tick_path:
+            return None
+        with self._lock:
+            if symbol.name not in self._tick_stores:
+                self._tick_stores[symbol.name] = TickStore(symbol.tick_path)
+            return self._tick_stores[symbol.name]
+
+    # Function to report what is loaded and how much memory it takes
+    def stats(self):
+        with self._lock:
+            loaded = {name: resident_bytes(dataset) for name, dataset in self._datasets.items()}
+            ticks = {name: store.stats() for name, store in self._tick_stores.items()}
+        return {
+            'symbols': list(self.symbols),
+            'default': self.default,
+            'loaded': loaded,
+            'resident_bytes': sum(loaded.values()),
+            'memory_budget': self.memory_budget,
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'load_seconds': dict(self.load_seconds),
+            'tick_stores': ticks,
+        }
+
+    # Function to get the loaded dataset of a symbol, loading it on first use.
+    # Loads take a per-symbol lock, so other symbols stay available while one is loading.
+    def _dataset(self, symbol):
+        with self._lock:
+            if symbol.name in self._datasets:
+                self._datasets.move_to_end(symbol.name)
+                return self._datasets[symbol.name]
+        with self._load_locks[symbol.name]:
+            with self._lock:
+                if symbol.name in self._datasets:
+                    return self._datasets[symbol.name]
+            started = time.perf_counter()
+            dataset = load_symbol_data(symbol)
+            if (self.live and not symbol.chunked) or symbol.ingest_dir:
+                dataset = LiveDataset(dataset)
+                if symbol.ingest_dir:
+                    dataset.watch_directory(symbol.ingest_dir, self.poll_interval)
+            with self._lock:
+                self.loads += 1
+                self.load_seconds[symbol.name] = time.perf_counter() - started
+                self._datasets[symbol.name] = dataset
+                self._evict(keep=symbol.name)
+            return dataset
+
+    # Function to drop the least recently used datasets until the rest fit the memory budget
+    def _evict(self, keep):
+        if self.memory_budget is None:
+            return
+        sizes = {name: resident_bytes(dataset) for name, dataset in self._datasets.items()}
+        # Memory-mapped datasets hold no process memory, so dropping them would free nothing
+        candidates = [name for name in self._datasets if name != keep and sizes[name]]
+        while candidates and sum(sizes.values()) > self.memory_budget:
+            name = candidates.pop(0)
+            del sizes[name]
+            dataset = self._datasets.pop(name)
+            if isinstance(dataset, LiveDataset):
+                dataset.stop()
+            self.evictions += 1
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+# The trade monitoring loops the hit search replaced, kept as the reference its answers are checked
+# against: they walk df.iterrows() over the bars after the entry exactly as monitor_trade used to.
+
+# Function to build the M1 frame the loops walk from High/Low arrays, one bar per minute from start
+def price_frame(high, low, start="2024-01-01 00:00"):
+    times = pd.date_range(start, periods=len(high), freq="min")
+    return pd.DataFrame({'Local time': times, 'High': high, 'Low': low})
+
+# Function to find the first SL/TP hit after entry_time; TP is checked before SL within a bar.
+# Returns ('tp' | 'sl' | None, hit time or None).
+def sl_tp_hit(df, entry_time, stoploss_price, takeprofit_price, trade_type, tolerance=0.1):
+    df_filtered = df[df['Local time'] > entry_time]
+    for _, row in df_filtered.iterrows():
+        current_high = row['High']
+        current_low = row['Low']
+        current_time = row['Local time']
+        if trade_type.lower() == 'buy':
+            if current_high >= takeprofit_price - tolerance:
+                return 'tp', current_time
+            elif current_low <= stoploss_price + tolerance:
+                return 'sl', current_time
+        elif trade_type.lower() == 'sell':
+            if current_low <= takeprofit_price + tolerance:
+                return 'tp', current_time
+            elif current_high >= stoploss_price - tolerance:
+                return 'sl', current_time
+    return None, None
+
+# Function to find the 3R system outcome after entry_time: the app's loop checks the SL first on
+# every bar (check_stoploss), backtest_1.py's does not. Without breakeven only the SL and the 3R
+# target are watched; target_r moves the target (3R in the app, the rr of a sweep cell).
+# Returns (breakeven trigger time or None, 'sl' | 'breakeven' | '3r' | None, time or None).
+def three_r_hit(df, entry_time, entry_price, stoploss_price, trade_type, breakeven, tolerance=0.1,
+                check_stoploss=True, target_r=3):
+    sl_pips = abs(stoploss_price - entry_price) * 10
+    three_r_target = (entry_price + target_r * sl_pips / 10 if trade_type.lower() == 'buy'
+                      else entry_price - target_r * sl_pips / 10)
+    df_filtered = df[df['Local time'] > entry_time]
+    breakeven_triggered = False
+    trigger_time = None
+    for _, row in df_filtered.iterrows():
+        current_high = row['High']
+        current_low = row['Low']
+        current_time = row['Local time']
+        if trade_type.lower() == 'buy':
+            if check_stoploss and current_low <= stoploss_price + tolerance:
+                return trigger_time, 'sl', current_time
+            if breakeven:
+                if not breakeven_triggered and current_high >= entry_price + sl_pips / 10 - tolerance:
+                    breakeven_triggered = True
+                    trigger_time = current_time
+                if breakeven_triggered and current_low <= entry_price + tolerance:
+                    return trigger_time, 'breakeven', current_time
+            if current_high >= three_r_target - tolerance:
+                return trigger_time, '3r', current_time
+        elif trade_type.lower() == 'sell':
+            if check_stoploss and current_high >= stoploss_price - tolerance:
+                return trigger_time, 'sl', current_time
+            if breakeven:
+                if not breakeven_triggered and current_low <= entry_price - sl_pips / 10 + tolerance:
+                    breakeven_triggered = True
+                    trigger_time = current_time
+                if breakeven_triggered and current_high >= entry_price - tolerance:
+                    return trigger_time, 'breakeven', current_time
+            if current_low <= three_r_target + tolerance:
+                return trigger_time, '3r', current_time
+    return trigger_time, None, None
+
+# Function to generate a random-walk M1 series with realistic bar ranges around a price
+def random_walk(count, seed, price=2000.0, step=0.4):
+    rng = np.random.default_rng(seed)
+    close = price + np.cumsum(rng.normal(0.0, step, count))
+    high = close + rng.exponential(step, count)
+    low = close - rng.exponential(step, count)
+    return np.round(high, 3), np.round(low, 3)
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+import hit_search
+from baseline import price_frame, random_walk, sl_tp_hit, three_r_hit
+from forward_extremes import ForwardExtremes
+from hit_search import find_trade_outcome
+from price_data import PriceData
+from timeframes import TimeframeIndex
+
+# Function to resolve one trade entered at bar `entry` with the hit search, reporting times like the baseline loops
+def resolve(df, entry, stoploss_price, takeprofit_price, trade_type, breakeven=True, tolerance=0.1,
+            check_stoploss=True, extremes=None):
+    high, low = df['High'].to_numpy(), df['Low'].to_numpy()
+    entry_price = (high[entry] + low[entry]) / 2
+    sl_pips = abs(stoploss_price - entry_price) * 10
+    three_r_target = entry_price + 3 * sl_pips / 10 if trade_type == 'buy' else entry_price - 3 * sl_pips / 10
+    hit, hit_index, trigger_index, outcome, index = find_trade_outcome(
+        high, low, entry_price, stoploss_price, takeprofit_price, three_r_target, trade_type, breakeven,
+        tolerance=tolerance, check_stoploss=check_stoploss, start=entry + 1, extremes=extremes)
+    time = lambda position: None if position is None else df['Local time'].iloc[position]
+    return (hit, time(hit_index)), (time(trigger_index), outcome, time(index))
+
+# Function to resolve the same trade with the baseline loops
+def reference(df, entry, stoploss_price, takeprofit_price, trade_type, breakeven=True, tolerance=0.1,
+              check_stoploss=True):
+    entry_time = df['Local time'].iloc[entry]
+    entry_price = (df['High'].iloc[entry] + df['Low'].iloc[entry]) / 2
+    return (sl_tp_hit(df, entry_time, stoploss_price, takeprofit_price, trade_type, tolerance),
+            three_r_hit(df, entry_time, entry_price, stoploss_price, trade_type, breakeven, tolerance, check_stoploss))
+
+# Bars around an entry at 2000 (bar 0 is the entry bar, with a mid price of 2000)
+def bars(*ranges):
+    high, low = zip(*[(2000.5, 1999.5)] + list(ranges))
+    return price_frame(np.array(high), np.array(low))
+
+def test_tp_wins_over_sl_on_the_same_bar():
+    df = bars((2000.4, 1999.6), (2011.0, 1989.0))
+    for trade_type, stoploss, takeprofit in [('buy', 1990.0, 2010.0), ('sell', 2010.0, 1990.0)]:
+        sl_tp, _ = resolve(df, 0, stoploss, takeprofit, trade_type)
+        assert sl_tp == ('tp', df['Local time'].iloc[2])
+        assert sl_tp == reference(df, 0, stoploss, takeprofit, trade_type)[0]
+
+def test_levels_within_the_tolerance_are_hit():
+    # The TP at 2010 is reached by a High of 2009.9 with the default 0.1 tolerance, not by 2009.85
+    assert resolve(bars((2009.85, 1999.0)), 0, 1990.0, 2010.0, 'buy')[0] == (None, None)
+    df = bars((2009.85, 1999.0), (2009.9, 1999.0))
+    assert resolve(df, 0, 1990.0, 2010.0, 'buy')[0] == ('tp', df['Local time'].iloc[2])
+    # A wider tolerance reaches it on the first bar
+    assert resolve(df, 0, 1990.0, 2010.0, 'buy', tolerance=0.2)[0] == ('tp', df['Local time'].iloc[1])
+    df = bars((2000.0, 1990.15), (2000.0, 1990.1))
+    assert resolve(df, 0, 1990.0, 2010.0, 'buy')[0] == ('sl', df['Local time'].iloc[2])
+
+def test_no_hit_leaves_both_systems_open():
+    df = bars((2001.0, 1999.0), (2002.0, 1998.0))
+    assert resolve(df, 0, 1990.0, 2010.0, 'buy') == ((None, None), (None, None, None))
+    assert resolve(df, 0, 1990.0, 2010.0, 'buy') == reference(df, 0, 1990.0, 2010.0, 'buy')
+
+def test_breakeven_trigger_and_exit():
+    # 1R is 2010: the trigger fires on bar 1 and the breakeven exit on bar 2, before the 3R target
+    df = bars((2010.5, 2001.0), (2005.0, 1999.0), (2031.0, 2020.0))
+    times = df['Local time']
+    assert resolve(df, 0, 1990.0, 2050.0, 'buy')[1] == (times.iloc[1], 'breakeven', times.iloc[2])
+    # A bar reaching the trigger and the entry closes at breakeven on that bar
+    df = bars((2010.5, 1999.5))
+    assert resolve(df, 0, 1990.0, 2050.0, 'buy')[1] == (df['Local time'].iloc[1], 'breakeven', df['Local time'].iloc[1])
+    for case in [((2010.5, 2001.0), (2005.0, 1999.0)), ((2010.5, 1999.5),)]:
+        df = bars(*case)
+        assert resolve(df, 0, 1990.0, 2050.0, 'buy') == reference(df, 0, 1990.0, 2050.0, 'buy')
+
+def test_three_r_without_breakeven_ignores_the_trigger():
+    df = bars((2010.5, 2001.0), (2005.0, 1999.0), (2031.0, 2020.0))
+    assert resolve(df, 0, 1990.0, 2050.0, 'buy', breakeven=False)[1] == (None, '3r', df['Local time'].iloc[3])
+    assert resolve(df, 0, 1990.0, 2050.0, 'buy', breakeven=False) == reference(df, 0, 1990.0, 2050.0, 'buy', breakeven=False)
+
+def test_three_r_checks_the_stoploss_only_when_asked():
+    # Bar 1 reaches the SL before the trigger; the SL ends the 3R system unless check_stoploss is off
+    df = bars((2001.0, 1989.0), (2031.0, 2011.0))
+    times = df['Local time']
+    assert resolve(df, 0, 1990.0, 2050.0, 'buy')[1] == (None, 'sl', times.iloc[1])
+    assert resolve(df, 0, 1990.0, 2050.0, 'buy', check_stoploss=False)[1] == (times.iloc[2], '3r', times.iloc[2])
+    for check_stoploss in [True, False]:
+        assert (resolve(df, 0, 1990.0, 2050.0, 'buy', check_stoploss=check_stoploss)
+                == reference(df, 0, 1990.0, 2050.0, 'buy', check_stoploss=check_stoploss))
+
+@pytest.mark.parametrize('check_stoploss', [True, False])
+def test_random_trades_match_the_baseline_loops(check_stoploss, monkeypatch):
+    high, low = random_walk(2500, seed=7, step=1.0)
+    df = price_frame(high, low)
+    minutes = df['Local time'].to_numpy().astype('datetime64[m]').astype(np.int64)
+    # With an index, hits past the first few bars are answered by its queries, which must agree with the plain scan
+    monkeypatch.setattr(hit_search, 'NEAR_SCAN_BARS', 16)
+    indexes = [None, ForwardExtremes.build(high, low), TimeframeIndex.build(PriceData(minutes, high, high, low, low))]
+    rng = np.random.default_rng(11)
+    for _ in range(60):
+        entry = int(rng.integers(0, 1200))
+        trade_type = str(rng.choice(['buy', 'sell']))
+        mid = (high[entry] + low[entry]) / 2
+        direction = 1 if trade_type == 'buy' else -1
+        stoploss = mid - direction * rng.uniform(0.5, 40.0)
+        takeprofit = mid + direction * rng.uniform(0.5, 120.0)
+        breakeven = bool(rng.integers(0, 2))
+        tolerance = float(rng.choice([0.0, 0.1, 0.5]))
+        expected = reference(df, entry, stoploss, takeprofit, trade_type, breakeven, tolerance, check_stoploss)
+        for extremes in indexes:
+            assert resolve(df, entry, stoploss, takeprofit, trade_type, breakeven, tolerance, check_stoploss,
+                           extremes) == expected
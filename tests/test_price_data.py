@@ -0,0 +1,22 @@
+import numpy as np
+
+from baseline import random_walk
+from price_data import PriceData
+
+# Function to build price data over a random walk, one bar per minute
+def walk_data(count=50000, seed=11):
+    high, low = random_walk(count, seed=seed)
+    close = (high + low) / 2
+    return PriceData(np.arange(count, dtype=np.int64) + 28_000_000, close.copy(), high, low, close)
+
+def test_version_changes_with_any_single_bar():
+    reference = walk_data().version
+    assert walk_data().version == reference
+    # Bar 1 lies between the closes a sampled checksum would read, and keeps the row count and time range
+    for column in ['open', 'high', 'low', 'close']:
+        price_data = walk_data()
+        getattr(price_data, column)[1] += 0.01
+        assert price_data.version != reference, column
+    price_data = walk_data()
+    price_data.minutes[1:-1] += 1
+    assert price_data.version != reference
@@ -0,0 +1,94 @@
+import numpy as np
+
+from baseline import price_frame, random_walk, sl_tp_hit, three_r_hit
+from hit_search import (ADVERSE, FAVORABLE, HIT_NAMES, HIT_SL, HIT_THREE_R, HIT_TP, ExitRule, ManagedLeg, find_three_r_hits,
+                        find_trade_outcomes, manage_trades, trade_outcome_manager, trade_outcome_results)
+
+# Random trades on a random walk: (entry bars, is_buy, entry prices, stop losses, take profits, breakeven, 3R targets)
+def random_trades(high, low, count, seed):
+    rng = np.random.default_rng(seed)
+    entry = rng.integers(0, len(high) // 2, count)
+    is_buy = rng.integers(0, 2, count).astype(bool)
+    direction = np.where(is_buy, 1.0, -1.0)
+    entry_price = (high[entry] + low[entry]) / 2
+    stoploss = entry_price - direction * rng.uniform(0.5, 30.0, count)
+    takeprofit = entry_price + direction * rng.uniform(0.5, 90.0, count)
+    breakeven = rng.integers(0, 2, count).astype(bool)
+    three_r_target = entry_price + 3 * (entry_price - stoploss)
+    return entry, is_buy, entry_price, stoploss, takeprofit, breakeven, three_r_target
+
+# Function to turn a bar index (-1 when missing) into its time, as the baseline loops report it
+def time_at(df, index):
+    return None if index < 0 else df['Local time'].iloc[index]
+
+def test_one_pass_matches_the_separate_baseline_scans():
+    high, low = random_walk(1500, seed=3, step=1.0)
+    df = price_frame(high, low)
+    entry, is_buy, entry_price, stoploss, takeprofit, breakeven, three_r_target = random_trades(high, low, 80, seed=5)
+    for check_stoploss in [True, False]:
+        hit, hit_index, trigger_index, outcome, index = find_trade_outcomes(
+            high, low, entry_price, stoploss, takeprofit, three_r_target, is_buy, breakeven, entry + 1,
+            np.full(len(entry), len(high)), check_stoploss=check_stoploss)
+        for i in range(len(entry)):
+            trade_type = 'buy' if is_buy[i] else 'sell'
+            entry_time = df['Local time'].iloc[entry[i]]
+            assert (HIT_NAMES[hit[i]], time_at(df, hit_index[i])) == sl_tp_hit(
+                df, entry_time, stoploss[i], takeprofit[i], trade_type)
+            assert (time_at(df, trigger_index[i]), HIT_NAMES[outcome[i]], time_at(df, index[i])) == three_r_hit(
+                df, entry_time, entry_price[i], stoploss[i], trade_type, breakeven[i], check_stoploss=check_stoploss)
+
+def test_three_r_system_alone_matches_the_combined_pass():
+    high, low = random_walk(1500, seed=4, step=1.0)
+    entry, is_buy, entry_price, stoploss, takeprofit, breakeven, three_r_target = random_trades(high, low, 200, seed=6)
+    stops = np.full(len(entry), len(high))
+    combined = find_trade_outcomes(high, low, entry_price, stoploss, takeprofit, three_r_target, is_buy, breakeven,
+                                   entry + 1, stops)
+    alone = find_three_r_hits(high, low, entry_price, stoploss, three_r_target, is_buy, breakeven, entry + 1, stops)
+    for expected, actual in zip(combined[2:], alone):
+        np.testing.assert_array_equal(expected, actual)
+
+def test_target_nearer_than_the_breakeven_trigger():
+    # Buy at 2000 with SL 1990 and a 0.5R target: the target is reached before the 1R trigger
+    high = np.array([2000.5, 2006.0, 1996.0])
+    low = np.array([1999.5, 1995.0, 1989.0])
+    df = price_frame(high, low)
+    for breakeven in [True, False]:
+        trigger_index, outcome, index = find_three_r_hits(high, low, [2000.0], [1990.0], [2005.0], [True], [breakeven],
+                                                          [1], [len(high)])
+        assert (trigger_index[0], outcome[0], index[0]) == (-1, HIT_THREE_R, 1)
+        assert (None, '3r', time_at(df, 1)) == three_r_hit(df, df['Local time'].iloc[0], 2000.0, 1990.0, 'buy',
+                                                          breakeven, target_r=0.5)
+
+def test_bars_arriving_in_pieces_resolve_like_one_array():
+    high, low = random_walk(3000, seed=8, step=1.0)
+    entry, is_buy, entry_price, stoploss, takeprofit, breakeven, three_r_target = random_trades(high, low, 100, seed=9)
+    starts = entry + 1
+    expected = find_trade_outcomes(high, low, entry_price, stoploss, takeprofit, three_r_target, is_buy, breakeven,
+                                   starts, np.full(len(entry), len(high)))
+    manager = trade_outcome_manager(entry_price, stoploss, takeprofit, three_r_target, is_buy, breakeven)
+    for offset in range(0, len(high), 256):
+        piece = slice(offset, offset + 256)
+        size = len(high[piece])
+        manager.advance(high[piece], low[piece], np.clip(starts - offset, 0, size), np.full(len(entry), size),
+                        offset=offset)
+    for expected_values, values in zip(expected, trade_outcome_results(manager)):
+        np.testing.assert_array_equal(expected_values, values)
+
+def test_trailing_stop_and_partial_close_rules():
+    # Buy at 2000 with SL 1990 and TP 2030: at +10 half the position closes and the stop trails to 2005
+    high = np.array([2000.5, 2011.0, 2012.0, 2004.0, 2031.0])
+    low = np.array([1999.5, 2006.0, 2008.0, 2003.0, 2020.0])
+    leg = ManagedLeg('trailing', [
+        ExitRule('tp', FAVORABLE, 2030.0, HIT_TP),
+        ExitRule('sl', ADVERSE, 1990.0, HIT_SL),
+        ExitRule('half', FAVORABLE, 2010.0, fraction=0.5, disables=('sl',), enables=('trail',)),
+        ExitRule('trail', ADVERSE, 2005.0, HIT_SL, fraction=0.5, active=False),
+    ])
+    result, = manage_trades(high, low, [leg], [True], [1], [len(high)])
+    assert result.fired['half'][0] == 1
+    assert result.fired['sl'][0] == -1
+    assert (result.outcome[0], result.index[0], result.remaining[0]) == (HIT_SL, 3, 0.0)
+    # Without the pullback the remaining half runs to the TP
+    high[3], low[3] = 2012.0, 2008.0
+    result, = manage_trades(high, low, [leg], [True], [1], [len(high)])
+    assert (result.outcome[0], result.index[0]) == (HIT_TP, 4)
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import fastparquet
+import numpy as np
+import pandas as pd
+
+from price_store import parse_local_times
+
+# Directory suffix of a converted tick store
+TICK_STORE_SUFFIX = ".ticks"
+
+# Format version written to meta.json, bumped when the layout changes
+TICK_STORE_FORMAT = 1
+
+# Source data the store can be built from: raw ticks, or S1 (one-second) OHLC bars
+TICK_KINDS = ('tick', 's1')
+
+MS_PER_MINUTE = 60_000
+MS_PER_DAY = 86_400_000
+
+# Rows read from the source per step while converting
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+# Function to read a tick or S1 file as a stream of DataFrames: a CSV in chunks of rows, a parquet file by row group
+def _read_chunks(source, chunk_rows=DEFAULT_CHUNK_ROWS):
+    if source.lower().endswith(".csv"):
+        yield from pd.read_csv(source, chunksize=chunk_rows)
+    else:
+        yield from fastparquet.ParquetFile(source).iter_row_groups()
+
+# Function to parse the 'Local time' column of a chunk to epoch milliseconds.
+# Tick files carry milliseconds ('dd.mm.YYYY HH:MM:SS.fff'), S1 files whole seconds.
+def _chunk_millis(df, kind):
+    milliseconds = kind == 'tick'
+    times = parse_local_times(df['Local time'].to_numpy(), milliseconds)
+    if times is None:
+        try:
+            times = pd.to_datetime(df['Local time'], format='%d.%m.%Y %H:%M:%S.%f' if milliseconds else '%d.%m.%Y %H:%M:%S').to_numpy()
+        except Exception as e:
+            raise ValueError(f"Error parsing 'Local time' column: {e}")
+    return times.astype('datetime64[ms]').astype(np.int64)
+
+# Function to turn a chunk of ticks or S1 bars into price path points: (epoch milliseconds, prices) in time order.
+# A tick is one point at price_column (Bid by default, the side M1 bars are usually built from).
+# An S1 bar becomes four points at its second: the open, whichever of high and low is nearer the open,
+# the other one, and the close. The order inside a second is unknown, so S1 data settles the bars
+# whose levels were reached in different seconds and otherwise follows that guess.
+def chunk_path(df, kind='tick', price_column='Bid'):
+    millis = _chunk_millis(df, kind)
+    if kind == 'tick':
+        if price_column not in df.columns:
+            raise ValueError(f"Tick data has no '{price_column}' column.")
+        prices = df[price_column].to_numpy(dtype=np.float64)
+        keep = ~np.isnan(prices)
+        return millis[keep], prices[keep]
+    bars = df[['Open', 'High', 'Low', 'Close']].to_numpy(dtype=np.float64)
+    keep = ~np.isnan(bars).any(axis=1)
+    millis, (open_prices, high, low, close) = millis[keep], bars[keep].T
+    high_first = high - open_prices <= open_prices - low
+    points = np.column_stack([open_prices, np.where(high_first, high, low), np.where(high_first, low, high), close])
+    return np.repeat(millis, 4), points.ravel()
+
+# Function to name the file holding one day (epoch days) of ticks
+def _day_file(day):
+    return f"{np.datetime64(int(day), 'D')}.npz"
+
+# Function to convert a tick or S1 file into a tick store directory.
+# The store holds one compressed .npz file per day (milliseconds into the day as int32 and prices as
+# float64), so resolving a bar loads a single day. The source is streamed in chunks and each day is
+# written once it is complete, so files of any size convert in bounded memory.
+# Raises ValueError if the data is not in time order.
+def write_tick_store(source, store_path, kind='tick', price_column='Bid', chunk_rows=DEFAULT_CHUNK_ROWS):
+    if kind not in TICK_KINDS:
+        raise ValueError(f"Tick data kind must be one of: {', '.join(TICK_KINDS)}.")
+    temp_path = store_path + ".tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    day_millis, day_prices = [], []
+    current_day = None
+    first = last = None
+    rows = days = 0
+    for df in _read_chunks(source, chunk_rows):
+        millis, prices = chunk_path(df, kind, price_column)
+        if not len(millis):
+            continue
+        if np.any(millis[1:] < millis[:-1]) or (last is not None and millis[0] < last):
+            raise ValueError("Ticks are not in time order; sort the source file before converting it.")
+        first = int(millis[0]) if first is None else first
+        last = int(millis[-1])
+        rows += len(millis)
+
+        # Cut the chunk at day boundaries; a day is written when the next one starts
+        day_of = millis // MS_PER_DAY
+        cuts = np.flatnonzero(day_of[1:] != day_of[:-1]) + 1
+        for begin, end in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [len(millis)]])):
+            day = int(day_of[begin])
+            if current_day is not None and day != current_day:
+                _write_day(temp_path, current_day, day_millis, day_prices)
+                days += 1
+            current_day = day
+            day_millis.append(millis[begin:end])
+            day_prices.append(prices[begin:end])
+    if current_day is not None:
+        _write_day(temp_path, current_day, day_millis, day_prices)
+        days += 1
+
+    meta = {
+        'format': TICK_STORE_FORMAT,
+        'kind': kind,
+        'price_column': price_column if kind == 'tick' else None,
+        'rows': rows,
+        'days': days,
+        'source': source,
+        'first_ms': first,
+        'last_ms': last,
+    }
+    with open(os.path.join(temp_path, "meta.json"), "w") as handle:
+        json.dump(meta, handle, indent=2)
+
+    old_path = store_path + ".old"
+    if os.path.exists(store_path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(store_path, old_path)
+    os.rename(temp_path, store_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return meta
+
+# Function to write the collected points of one day and empty the buffers
+def _write_day(path, day, day_millis, day_prices):
+    millis = np.concatenate(day_millis) - day * MS_PER_DAY
+    np.savez_compressed(os.path.join(path, _day_file(day)), ms=millis.astype(np.int32), price=np.concatenate(day_prices))
+    day_millis.clear()
+    day_prices.clear()
+
+# Intrabar price paths read from a tick store (see write_tick_store).
+# path(minute) returns the prices inside one M1 bar in time order; days are loaded on first use
+# and only the cache_days most recently used are kept, so a backtest reads just the days of the
+# bars it needs to settle.
+class TickStore:
+    def __init__(self, path, cache_days=8):
+        with open(os.path.join(path, "meta.json")) as handle:
+            self.meta = json.load(handle)
+        if self.meta.get('format') != TICK_STORE_FORMAT:
+            raise ValueError(f"Tick store {path} has format {self.meta.get('format')}, expected {TICK_STORE_FORMAT}; convert it again.")
+        self.directory = path
+        self.cache_days = max(int(cache_days), 1)
+        self.days = {int(np.datetime64(name[:-len(".npz")], 'D').astype(np.int64)): name
+                     for name in os.listdir(path) if name.endswith(".npz")}
+        # Days read from disk, bars served with ticks and bars asked for that have none
+        self.days_loaded = 0
+        self.bars_served = 0
+        self.bars_missing = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Function to fingerprint the store, so cached results are not reused after it changes
+    @property
+    def version(self):
+        return f"{self.meta['kind']}-{self.meta['rows']}-{self.meta['first_ms']}-{self.meta['last_ms']}"
+
+    # Function to get the prices inside the M1 bar starting at an epoch minute (empty without ticks)
+    def path(self, minute):
+        day = minute // 1440
+        ticks = self._day(day)
+        if ticks is not None:
+            millis, prices = ticks
+            start = (minute - day * 1440) * MS_PER_MINUTE
+            begin, end = np.searchsorted(millis, [start, start + MS_PER_MINUTE])
+            if end > begin:
+                self.bars_served += 1
+                return prices[begin:end]
+        self.bars_missing += 1
+        return np.empty(0)
+
+    # Function to report how much of the store has been used
+    def stats(self):
+        return {
+            'kind': self.meta['kind'],
+            'days': len(self.days),
+            'days_loaded': self.days_loaded,
+            'bars_served': self.bars_served,
+            'bars_missing': self.bars_missing,
+        }
+
+    # Function to get the (milliseconds into the day, prices) arrays of an epoch day, or None without a file
+    def _day(self, day):
+        if day not in self.days:
+            return None
+        with self._lock:
+            if day in self._cache:
+                self._cache.move_to_end(day)
+                return self._cache[day]
+        with np.load(os.path.join(self.directory, self.days[day])) as data:
+            ticks = data['ms'], data['price']
+        with self._lock:
+            self.days_loaded += 1
+            self._cache[day] = ticks
+            while len(self._cache) > self.cache_days:
+                self._cache.popitem(last=False)
+        return ticks
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a tick or S1 file into a tick store for intrabar resolution.")
+    parser.add_argument('source', help="CSV or parquet file with a 'Local time' column and prices, in time order")
+    parser.add_argument('store', nargs='?', help=f"output directory (default: source name with a {TICK_STORE_SUFFIX} suffix)")
+    parser.add_argument('--kind', choices=TICK_KINDS, default='tick',
+                        help="tick: one price per row ('dd.mm.YYYY HH:MM:SS.fff' times); s1: one-second OHLC bars (default: tick)")
+    parser.add_argument('--price-column', default='Bid', help="tick price column (default: Bid)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"CSV rows read per step (default: {DEFAULT_CHUNK_ROWS})")
+    args = parser.parse_args()
+    store = args.store or os.path.splitext(args.source)[0] + TICK_STORE_SUFFIX
+    meta = write_tick_store(args.source, store, args.kind, args.price_column, args.chunk_rows)
+    print(f"Wrote {meta['rows']} price points over {meta['days']} days to {store}")
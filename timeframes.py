@@ -0,0 +1,207 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from hit_search import first_events_many
+from price_data import PriceData
+
+# Supported timeframes and their length in minutes. Buckets are aligned to the epoch,
+# so every timeframe nests inside the next one (five M1 bars per M5 bar, and so on).
+TIMEFRAMES = OrderedDict([('M1', 1), ('M5', 5), ('M15', 15), ('H1', 60), ('H4', 240), ('D1', 1440)])
+
+# Function to normalize a timeframe name, raising ValueError for unknown ones
+def parse_timeframe(timeframe):
+    name = str(timeframe or 'M1').strip().upper()
+    if name not in TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe: {timeframe}. Use one of {', '.join(TIMEFRAMES)}.")
+    return name
+
+# Higher-timeframe bars aggregated from M1 data.
+# price_data holds one OHLC bar per bucket (minutes is the bucket start) and bounds[i] is the
+# position of the first M1 bar of bar i, with bounds[-1] == number of M1 bars, so M1 bars
+# bounds[i]:bounds[i + 1] make up bar i.
+class TimeframeBars:
+    def __init__(self, timeframe, price_data, bounds):
+        self.timeframe = timeframe
+        self.price_data = price_data
+        self.bounds = bounds
+
+    def __len__(self):
+        return len(self.price_data)
+
+    # Function to find the bar containing each M1 position
+    def bar_of(self, positions):
+        return np.searchsorted(self.bounds, positions, side='right') - 1
+
+# Function to aggregate M1 price data into bars of a higher timeframe
+def resample(price_data, timeframe):
+    timeframe = parse_timeframe(timeframe)
+    size = TIMEFRAMES[timeframe]
+    if len(price_data) == 0:
+        empty = np.empty(0, dtype=np.float64)
+        return TimeframeBars(timeframe, PriceData(np.empty(0, dtype=np.int64), empty, empty, empty, empty),
+                             np.zeros(1, dtype=np.int64))
+    buckets = np.asarray(price_data.minutes) // size
+    first = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    bounds = np.append(first, len(price_data)).astype(np.int64)
+    bars = PriceData(buckets[first] * size,
+                     np.asarray(price_data.open)[first],
+                     np.fmax.reduceat(np.asarray(price_data.high, dtype=np.float64), first),
+                     np.fmin.reduceat(np.asarray(price_data.low, dtype=np.float64), first),
+                     np.asarray(price_data.close)[bounds[1:] - 1])
+    return TimeframeBars(timeframe, bars, bounds)
+
+# Bounded cache of resampled bars, keyed on the dataset version and timeframe,
+# so each aggregate is built once per dataset and rebuilt after the data changes.
+class TimeframeCache:
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Function to get the bars of a timeframe for the price data, resampling on a miss
+    def get(self, price_data, timeframe):
+        timeframe = parse_timeframe(timeframe)
+        key = (price_data.version, timeframe)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        bars = resample(price_data, timeframe)
+        with self._lock:
+            self._entries[key] = bars
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return bars
+
+# Cache shared by the batch resolver and the timeframe index
+timeframe_cache = TimeframeCache()
+
+# Indexes the hit searches can use for far-away levels: the forward-extremes pyramid (the
+# default), or the coarse-to-fine search over the cached aggregates below
+SEARCH_INDEXES = ('pyramid', 'timeframes')
+
+# Index answering "first bar at or after i where High >= X" (or Low <= Y) coarse-to-fine
+# over the cached timeframe aggregates. A query climbs from M1 to coarser bars as soon as it
+# sits on a bar boundary, skips whole bars whose range cannot reach the level, scans the
+# coarsest bars in vectorized chunks, and drills down to M1 only inside the first bar that
+# reaches it, so answers are exact at M1. It has the same query methods as ForwardExtremes,
+# so it can be passed to the hit search as `extremes`; set it as a PriceData's search_index
+# (a symbol's search_index setting, or --search-index in backtest_1.py) to make it the hit index.
+class TimeframeIndex:
+    def __init__(self, high, low, bars):
+        self.high = high
+        self.low = low
+        self.bars = bars
+
+    # Function to build the index from cached aggregates of the given timeframes
+    @classmethod
+    def build(cls, price_data, timeframes=('M5', 'M15', 'H1', 'H4', 'D1'), cache=timeframe_cache):
+        bars = [cache.get(price_data, timeframe) for timeframe in sorted(set(map(parse_timeframe, timeframes)),
+                                                                          key=TIMEFRAMES.get)
+                if timeframe != 'M1']
+        return cls(price_data.high, price_data.low, bars)
+
+    # Function to find, for each query, the first bar in [start, stop) whose High is >= level (-1 if none)
+    def first_high_at_or_above(self, levels, starts, stops):
+        series = [self.high] + [bars.price_data.high for bars in self.bars]
+        return self._first_reaching(series, np.greater_equal, levels, starts, stops)
+
+    # Function to find, for each query, the first bar in [start, stop) whose Low is <= level (-1 if none)
+    def first_low_at_or_below(self, levels, starts, stops):
+        series = [self.low] + [bars.price_data.low for bars in self.bars]
+        return self._first_reaching(series, np.less_equal, levels, starts, stops)
+
+    # Function to find the bucket of each M1 position at a level (level 0 is M1 itself)
+    def _bucket(self, level, positions):
+        return positions if level == 0 else self.bars[level - 1].bar_of(positions)
+
+    # Function to find the M1 position where each bucket at a level ends
+    def _bucket_end(self, level, buckets):
+        return buckets + 1 if level == 0 else self.bars[level - 1].bounds[buckets + 1]
+
+    # Function to find the first M1 position of each bucket at a level
+    def _bucket_start(self, level, buckets):
+        return buckets if level == 0 else self.bars[level - 1].bounds[buckets]
+
+    # Function to test the bucket holding each position against its query level, for mixed levels
+    def _reaches(self, series, condition, levels, level, position, queries):
+        result = np.zeros(len(queries), dtype=bool)
+        for current in np.unique(level[queries]):
+            group = level[queries] == current
+            buckets = self._bucket(current, position[queries[group]])
+            result[group] = condition(series[current][buckets], levels[queries[group]])
+        return result
+
+    # Function to move each query past the bucket holding its position at its level
+    def _skip(self, level, position, queries):
+        for current in np.unique(level[queries]):
+            group = queries[level[queries] == current]
+            position[group] = self._bucket_end(current, self._bucket(current, position[group]))
+
+    # Function to run the coarse-to-fine search for many queries at once
+    def _first_reaching(self, series, condition, levels, starts, stops):
+        levels = np.asarray(levels, dtype=np.float64)
+        position = np.asarray(starts, dtype=np.int64).copy()
+        stops = np.minimum(np.asarray(stops, dtype=np.int64), len(self.high))
+        top = len(self.bars)
+        level = np.zeros(len(position), dtype=np.int64)
+        result = np.full(len(position), -1, dtype=np.int64)
+
+        # Climb: a query moves up a level whenever its position starts a bar of the next timeframe.
+        # Until it reaches the top it tests one bar at its level per step, skipping it on a miss.
+        found = []
+        scanning = []
+        climbing = np.flatnonzero(position < stops)
+        while climbing.size:
+            for _ in range(top):
+                rising = climbing[level[climbing] < top]
+                if not rising.size:
+                    break
+                above = level[rising] + 1
+                aligned = np.zeros(rising.size, dtype=bool)
+                for current in np.unique(above):
+                    group = above == current
+                    bars = self.bars[current - 1]
+                    aligned[group] = bars.bounds[bars.bar_of(position[rising[group]])] == position[rising[group]]
+                level[rising[aligned]] += 1
+            at_top = level[climbing] == top
+            scanning.append(climbing[at_top])
+            climbing = climbing[~at_top]
+            hit = self._reaches(series, condition, levels, level, position, climbing)
+            found.append(climbing[hit])
+            moving = climbing[~hit]
+            self._skip(level, position, moving)
+            climbing = moving[position[moving] < stops[moving]]
+
+        # At the top level, the remaining bars are scanned in vectorized chunks
+        scanning = np.concatenate(scanning) if scanning else np.empty(0, dtype=np.int64)
+        if scanning.size:
+            hit_bucket = first_events_many([(series[top], condition, levels[scanning])],
+                                           self._bucket(top, position[scanning]),
+                                           self._bucket(top, stops[scanning] - 1) + 1)[0]
+            hit = hit_bucket >= 0
+            position[scanning[hit]] = self._bucket_start(top, hit_bucket[hit])
+            found.append(scanning[hit])
+
+        # Descend: inside a bar that reaches the level, test its sub-bars in order and enter the first that does
+        descending = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        hits = [descending[level[descending] == 0]]
+        descending = descending[level[descending] > 0]
+        while descending.size:
+            level[descending] -= 1
+            reach = self._reaches(series, condition, levels, level, position, descending)
+            # A sub-bar that misses is skipped; coming back up a level makes the next step test its sibling
+            missed = descending[~reach]
+            self._skip(level, position, missed)
+            level[missed] += 1
+            descending = descending[position[descending] < stops[descending]]
+            settled = level[descending] == 0
+            hits.append(descending[settled])
+            descending = descending[~settled]
+
+        hits = np.concatenate(hits)
+        hits = hits[position[hits] < stops[hits]]
+        result[hits] = position[hits]
+        return result